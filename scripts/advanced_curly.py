@@ -18,7 +18,7 @@
 
 #!/usr/bin/python
 
-import requests
+from ena_http_session import http_post
 import argparse
 
 parser = argparse.ArgumentParser(description='ENA portal api curl query tool')
@@ -61,7 +61,7 @@ def query_api(infile, input_t, query_t):
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
         payload = {'result': f'{query_t}', 'includeAccessionType': f'{input_t}', 'includeAccessions':str(final_query), 'fields': 'description%2Ccountry', 'format': 'tsv'}
 
-        r = requests.post(url, data=payload, headers=headers)
+        r = http_post(url, data=payload, headers=headers)
         results = r.text
         return results
 
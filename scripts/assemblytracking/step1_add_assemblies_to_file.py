@@ -14,12 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import io, os, sys, argparse, requests
+import io, os, sys, argparse
 import datetime as dt
 import numpy as np
 import pandas as pd
 from pandas import json_normalize
 
+# the one shared pooled ENA/EBI HTTP session, ena_http_session.py, is in scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ena_http_session import http_get
+
 # Purpose of script - adds new assemblies to the tracking_file.txt in the format used for logging and tracking of
 # the progress of the assemblies release.
 
@@ -33,7 +37,7 @@ def get_taxon(releasing_seq):
                   'fields': 'scientific_name',
                   'includeAccessions': biosample_id,
                   'result': 'sample'}
-        r = requests.get('https://www.ebi.ac.uk/ena/portal/api/search', params)
+        r = http_get('https://www.ebi.ac.uk/ena/portal/api/search', params)
         if r.status_code == 200:
             json_data = r.json()
             #print('json_data', type(json_data), json_data)
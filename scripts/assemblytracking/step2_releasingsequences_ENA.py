@@ -14,11 +14,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import io, os, requests, sys, argparse
+import io, os, sys, argparse
 import numpy as np
 import pandas as pd
 from pandas import json_normalize
 
+# the one shared pooled ENA/EBI HTTP session, ena_http_session.py, is in scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ena_http_session import http_get
+
 
 # purpose of script - uses ena browser API to check for links to sample and project in browser
 # TODO: NOT CHECKING VERSION FOR CHROMOSOMES - THINK ON HOW TO DO THIS
@@ -33,7 +37,7 @@ def get_accessions(field, base_url):
     for i, row in dataset_ENA.iterrows():
         value = row[field]
         url = base_url + str(value)
-        r = requests.get(url)
+        r = http_get(url)
         if r.status_code == 200:
             json_data = r.json()
             df_data = json_normalize(json_data['summaries'])
@@ -67,7 +71,7 @@ def get_data(field, base_url):
             and row['accession type'] == field:
                 value = row['accessions']
                 url = base_url + str(value)
-                r = requests.get(url)
+                r = http_get(url)
                 if r.status_code == 200:
                     json_data = r.json()
                     df_data = json_normalize(json_data['summaries'])
@@ -262,7 +266,7 @@ if __name__ == "__main__":
         if row['Assembly type'] == "primary metagenome" or row['Assembly type'] == "binned metagenome":
             value = row['analysis ID']
             url = base_url + str(value)
-            r = requests.get(url)
+            r = http_get(url)
             if r.status_code == 200:
                 json_data = r.json()
                 df_data = json_normalize(json_data['summaries'])
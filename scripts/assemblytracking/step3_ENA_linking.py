@@ -14,11 +14,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import io, os, requests, sys, argparse
+import io, os, sys, argparse
 import numpy as np
 import pandas as pd
 from pandas import json_normalize
 
+# the one shared pooled ENA/EBI HTTP session, ena_http_session.py, is in scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ena_http_session import http_get
+
 # purpose of scripts - chckes ENA portal API for links between assembly, sequences and projects.
 #TODO: check if I'm checking version for chromosomes and GCAs
 
@@ -36,7 +40,7 @@ def get_links(field, type):
             value = "sample/"
         url = base_url + value
         params = {'format': 'json', 'accession': accession, 'result': type}
-        r = requests.get(url, params=params)
+        r = http_get(url, params=params)
         if r.status_code == 200:
             json_data = r.json()
             if not json_data:
@@ -14,7 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import sys, requests, json
+import sys, json
+from ena_http_session import http_get
 
 """
 This script is designed to help to detect issues with data display on the ENA browser.
@@ -44,7 +45,7 @@ if '--short' in project_accs:
 for project_acc in project_accs:
     url = f"https://www.ebi.ac.uk/ena/portal/api/filereport?accession={project_acc}&result=read_run&fields=sample_accession,experiment_accession,run_accession,tax_id,scientific_name,fastq_ftp,sra_ftp&format=json&download=false"
 
-    content = requests.get(url)
+    content = http_get(url)
     try:
         data = json.loads(content.content)
     except json.decoder.JSONDecodeError:
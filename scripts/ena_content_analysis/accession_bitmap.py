@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Script of accession_bitmap.py is to hold category memberships (sets of sample/run accessions) as bitmaps
+
+Every accession is interned once to a dense integer, and a category is then a bitmap with bit n set if
+accession n is a member. The bitmap is a Python int, so intersection, union and difference are a single
+C level &, | or & ~ over the words, and the cardinality is int.bit_count(). One bit per interned accession
+replaces a set of strings, i.e. ~1MB for 10M accessions rather than hundreds of MB.
+
+usage:
+    environmental = AccessionBitmap.from_accessions(environmental_sample_accs)
+    european = AccessionBitmap.from_accessions(european_sample_accs)
+    print(len(environmental & european))
+    (environmental & european).get_accessions()
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x accession_bitmap.py
+"""
+
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+class AccessionInterner:
+    """
+    accession <-> dense integer, the integers are given in the order first seen and never change
+    """
+
+    def __init__(self):
+        self.position_by_accession = {}
+        self._accession_array = np.empty(0, dtype = object)
+        self._lock = threading.Lock()
+
+    def intern(self, accessions):
+        """
+        :param accessions: iterable of accessions, new ones are added
+        :return: numpy int64 array of their positions
+        """
+        accessions = list(accessions)
+        with self._lock:
+            position_by_accession = self.position_by_accession
+            setdefault = position_by_accession.setdefault
+            return np.fromiter((setdefault(accession, len(position_by_accession)) for accession in accessions),
+                               dtype = np.int64, count = len(accessions))
+
+    def get_total(self):
+        return len(self.position_by_accession)
+
+    def get_accession_array(self):
+        """
+        :return: numpy object array, the accession of each position
+        """
+        with self._lock:
+            if len(self._accession_array) != len(self.position_by_accession):
+                self._accession_array = np.array(list(self.position_by_accession), dtype = object)
+            return self._accession_array
+
+
+_interner = None
+_interner_lock = threading.Lock()
+
+
+def get_accession_interner():
+    """
+    lazily creates the shared interner, so the bitmaps of all the categories are comparable
+    :return: AccessionInterner
+    """
+    global _interner
+    if _interner is None:
+        with _interner_lock:
+            if _interner is None:
+                _interner = AccessionInterner()
+    return _interner
+
+
+class AccessionBitmap:
+    """
+    a set of interned accessions as the bits of a Python int
+    """
+    __slots__ = ('bits', 'interner')
+
+    def __init__(self, bits=0, interner=None):
+        self.bits = bits
+        self.interner = interner if interner is not None else get_accession_interner()
+
+    @classmethod
+    def from_positions(cls, positions, interner=None):
+        """
+        :param positions: numpy int array of interned positions
+        :param interner: defaults to the shared one
+        :return: AccessionBitmap
+        """
+        positions = np.asarray(positions, dtype = np.int64)
+        if len(positions) == 0:
+            return cls(0, interner)
+        is_member = np.zeros(int(positions.max()) + 1, dtype = bool)
+        is_member[positions] = True
+        return cls(int.from_bytes(np.packbits(is_member, bitorder = 'little').tobytes(), 'little'), interner)
+
+    @classmethod
+    def from_accessions(cls, accessions, interner=None):
+        if interner is None:
+            interner = get_accession_interner()
+        return cls.from_positions(interner.intern(accessions), interner)
+
+    def get_positions(self):
+        """
+        :return: sorted numpy int64 array of the set bits
+        """
+        if self.bits == 0:
+            return np.empty(0, dtype = np.int64)
+        bit_bytes = np.frombuffer(self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little'), dtype = np.uint8)
+        return np.flatnonzero(np.unpackbits(bit_bytes, bitorder = 'little')).astype(np.int64)
+
+    def get_accessions(self):
+        """
+        :return: list of the member accessions, in interned order
+        """
+        return self.interner.get_accession_array()[self.get_positions()].tolist()
+
+    def _check_interner(self, other):
+        if self.interner is not other.interner:
+            raise ValueError("AccessionBitmaps from different interners can not be combined")
+
+    def __and__(self, other):
+        self._check_interner(other)
+        return AccessionBitmap(self.bits & other.bits, self.interner)
+
+    def __or__(self, other):
+        self._check_interner(other)
+        return AccessionBitmap(self.bits | other.bits, self.interner)
+
+    def __sub__(self, other):
+        self._check_interner(other)
+        return AccessionBitmap(self.bits & ~other.bits, self.interner)
+
+    def __xor__(self, other):
+        self._check_interner(other)
+        return AccessionBitmap(self.bits ^ other.bits, self.interner)
+
+    def __eq__(self, other):
+        return isinstance(other, AccessionBitmap) and self.interner is other.interner and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __contains__(self, accession):
+        position = self.interner.position_by_accession.get(accession)
+        return position is not None and (self.bits >> position) & 1 == 1
+
+    def __repr__(self):
+        return f"AccessionBitmap(cardinality={len(self)})"
+
+
+def get_intersection(bitmaps):
+    """
+    :param bitmaps: list of AccessionBitmap, at least one
+    :return: AccessionBitmap
+    """
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        result = result & bitmap
+    return result
+
+
+def get_union(bitmaps):
+    """
+    :param bitmaps: list of AccessionBitmap, at least one
+    :return: AccessionBitmap
+    """
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        result = result | bitmap
+    return result
+
+
+def main():
+    environmental = AccessionBitmap.from_accessions(['SAMEA1', 'SAMEA2', 'SAMEA3'])
+    european = AccessionBitmap.from_accessions(['SAMEA2', 'SAMEA3', 'SAMEA4'])
+    print(len(environmental & european), (environmental & european).get_accessions(), (environmental | european))
+
+
+if __name__ == '__main__':
+    main()
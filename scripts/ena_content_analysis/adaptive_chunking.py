@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Script of adaptive_chunking.py is to size, pace and retry the chunks of the chunked portal API calls
+
+The chunks are cut on a grid of chunk_size ids, so that the same list gives the same includeAccessions, and
+so the same portal response cache keys, on every run. The AdaptiveChunkController grows the chunks to
+chunk_size * 2, 4, ... (each aligned to its own size on the grid), and the number fetched at once, while the
+latency and error rate are healthy. On a 5xx, a 413/414 (too large) or a timeout the chunks are halved, by
+splitting the chunk_size blocks in half again and again, i.e. at offsets derived from the grid.
+A chunk that was too large (413/414) or timed out is itself split in half and its halves sent instead, as
+resending it unchanged would fail the same way. Concurrency is only halved where the server looks overloaded
+(5xx, timeouts), and there is a jittered exponential backoff for the retries. Chunks that still fail are
+checkpointed to a JSON lines file, so that they can be retried later, and the call raises
+IncompleteChunkedCallError.
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x adaptive_chunking.py
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import time
+from collections import deque
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+def is_too_large_failure(status):
+    """
+    failures that suggest the chunk itself is too big, so it is worth splitting it rather than resending it
+    :param status: http status code, or "timeout" / "connection_error"
+    :return: boolean
+    """
+    return status in (413, 414, "timeout")
+
+
+def is_overload_failure(status):
+    """
+    failures that suggest the server is overloaded, so it is worth halving the number of chunks sent at once
+    :param status: http status code, or "timeout" / "connection_error"
+    :return: boolean
+    """
+    if status in ("timeout", "connection_error"):
+        return True
+    return isinstance(status, int) and status >= 500
+
+
+def is_shrink_worthy_failure(status):
+    """
+    failures after which the chunks are halved
+    :param status: http status code, or "timeout" / "connection_error"
+    :return: boolean
+    """
+    return is_too_large_failure(status) or is_overload_failure(status)
+
+
+def is_retryable_failure(status):
+    """
+    failures worth resending the same chunk for after a backoff: the overloaded ones, being told to slow down (429)
+    or a request timeout (408). Whereas e.g. a 400, or a 413/414 (see is_too_large_failure()), will fail the same
+    way again
+    :param status: http status code, or "timeout" / "connection_error"
+    :return: boolean
+    """
+    return is_overload_failure(status) or status in (408, 429)
+
+
+def split_chunk(offset, chunk):
+    """
+    the two halves of a chunk, the first having any odd id, so the same chunk is always split the same way
+    :param offset: of the chunk in the id list
+    :param chunk: list of ids
+    :return: [(offset, first_half), (offset + len(first_half), second_half)]
+    """
+    half = (len(chunk) + 1) // 2
+    return [(offset, chunk[0:half]), (offset + half, chunk[half:])]
+
+
+def carve_chunks(id_list, pos, chunk_size, level):
+    """
+    the next chunks of id_list, on the grid of chunk_size ids
+    :param id_list:
+    :param pos: a multiple of chunk_size
+    :param chunk_size: the grid
+    :param level: see AdaptiveChunkController.get_level(). Above 0 one chunk of chunk_size * 2**level, smaller where
+                  pos is not a multiple of that. Below 0 the chunk_size block split in half -level times
+    :return: list of (offset, chunk), together covering id_list from pos to the next multiple of the chunk size
+    """
+    span = chunk_size << max(0, level)
+    while span > chunk_size and pos % span != 0:
+        span //= 2
+    pieces = [(pos, list(id_list[pos:pos + span]))]
+    for _ in range(-level):
+        pieces = [half for piece in pieces for half in split_chunk(*piece) if len(half[1]) > 0]
+    return pieces
+
+
+class IncompleteChunkedCallError(Exception):
+    """
+    raised by the chunked portal API calls when some chunks could not be fetched, even after their retries
+    """
+
+    def __init__(self, data, failed_chunks, checkpoint_file):
+        """
+        :param data: the records of the chunks that were fetched, in id order
+        :param failed_chunks: list of the id lists of the chunks that were not
+        :param checkpoint_file: where the failed chunks are, see retry_checkpointed_chunks()
+        """
+        self.data = data
+        self.failed_chunks = failed_chunks
+        self.checkpoint_file = checkpoint_file
+        super().__init__(f"{len(failed_chunks)} chunks could not be fetched, see {checkpoint_file}")
+
+    def get_failed_ids(self):
+        """
+        :return: set of the ids in the chunks that were not fetched
+        """
+        return {accession for chunk in self.failed_chunks for accession in chunk}
+
+
+class AdaptiveChunkController:
+    """
+    controller = AdaptiveChunkController(400, max_concurrency=4)
+    size = controller.get_chunk_size()          # tuned, see get_level()
+    concurrency = controller.get_concurrency()  # tuned
+    controller.record_success(latency_seconds)  or  controller.record_failure(status)
+    """
+
+    def __init__(self, chunk_size, max_concurrency=1, min_chunk_size=None, max_chunk_size=None, target_latency=20.0,
+                 max_error_rate=0.1, window_size=10, backoff_base=1.0, backoff_cap=60.0):
+        """
+        :param chunk_size: the grid the chunks are cut on, and the size they start at
+        :param max_concurrency:
+        :param min_chunk_size: the chunks are not halved below this, None for chunk_size // 8, as halving on
+                               errors that are not due to the size would otherwise shrink them to a handful of ids
+        :param max_chunk_size: the chunks are not grown above this, None for chunk_size * 4
+        """
+        self.chunk_size = max(1, chunk_size)
+        self.min_chunk_size = max(1, min(self.chunk_size, self.chunk_size // 8 if min_chunk_size is None
+                                         else min_chunk_size))
+        self.max_chunk_size = max(self.chunk_size, self.chunk_size * 4 if max_chunk_size is None else max_chunk_size)
+        self.level = 0
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._recent_outcomes = deque(maxlen = window_size)  # True for a success
+        self.success_total = 0
+        self.failure_total = 0
+        self.shrink_total = 0
+
+    def get_size_at_level(self, level):
+        """
+        :return: the largest chunk size at that level, see carve_chunks()
+        """
+        if level >= 0:
+            return self.chunk_size << level
+        return -(-self.chunk_size // (1 << -level))
+
+    def get_level(self):
+        """
+        :return: 0 for chunk_size, 1 for twice that, -1 for half of it etc.
+        """
+        return self.level
+
+    def get_chunk_size(self):
+        return self.get_size_at_level(self.level)
+
+    def grow(self):
+        if self.get_size_at_level(self.level + 1) <= self.max_chunk_size:
+            self.level += 1
+            logger.debug(f"chunk size grown to {self.get_chunk_size()}")
+
+    def shrink(self):
+        smaller_size = self.get_size_at_level(self.level - 1)
+        if self.min_chunk_size <= smaller_size < self.get_chunk_size():
+            self.level -= 1
+            self.shrink_total += 1
+            return True
+        return False
+
+    def set_max_concurrency(self, max_concurrency):
+        """
+        :param max_concurrency: e.g. the number of worker threads, the concurrency starts there
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+
+    def get_concurrency(self):
+        return self.concurrency
+
+    def get_error_rate(self):
+        if len(self._recent_outcomes) == 0:
+            return 0.0
+        return self._recent_outcomes.count(False) / len(self._recent_outcomes)
+
+    def is_healthy(self, latency):
+        return latency <= self.target_latency and self.get_error_rate() <= self.max_error_rate
+
+    def record_success(self, latency):
+        """
+        while healthy, first the concurrency is raised back up to max_concurrency, and then the chunk size grown
+        :param latency: seconds the chunk took
+        :return: the new concurrency
+        """
+        self.success_total += 1
+        self._recent_outcomes.append(True)
+        if self.is_healthy(latency):
+            if self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                logger.debug(f"concurrency raised to {self.concurrency}")
+            else:
+                self.grow()
+        return self.concurrency
+
+    def record_failure(self, status):
+        """
+        :param status: http status code, or "timeout" / "connection_error"
+        :return: the new concurrency
+        """
+        self.failure_total += 1
+        self._recent_outcomes.append(False)
+        if is_shrink_worthy_failure(status) and self.shrink():
+            logger.info(f"due to {status} chunk size halved to {self.get_chunk_size()}")
+        if is_overload_failure(status) and self.concurrency > 1:
+            self.concurrency = max(1, self.concurrency // 2)
+            logger.info(f"due to {status} concurrency halved to {self.concurrency}")
+        return self.concurrency
+
+    def get_backoff_seconds(self, attempt):
+        """
+        "full jitter" exponential backoff
+        :param attempt: 1 for the first retry
+        :return: seconds to wait before the retry
+        """
+        if attempt <= 0:
+            return 0.0
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * math.pow(2, attempt)))
+
+    def print_summary(self):
+        return (f"chunk_size={self.get_chunk_size()} concurrency={self.concurrency}/{self.max_concurrency} "
+                f"successes={self.success_total} failures={self.failure_total} halvings={self.shrink_total}")
+
+
+def get_default_checkpoint_file():
+    return "failed_portal_chunks.jsonl"
+
+
+def checkpoint_failed_chunk(checkpoint_file, url, params, with_obj_type, chunk, status):
+    """
+    appends a chunk that could not be fetched to the checkpoint file
+    :param checkpoint_file:
+    :param url:
+    :param params:
+    :param with_obj_type:
+    :param chunk: the ids in the chunk
+    :param status:
+    :return:
+    """
+    record = {"url": url, "params": params, "with_obj_type": with_obj_type, "chunk": list(chunk),
+              "status": str(status), "time": time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(checkpoint_file, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def load_failed_chunks(checkpoint_file):
+    """
+    :param checkpoint_file:
+    :return: list of the checkpointed chunk records, [] if none
+    """
+    if not os.path.exists(checkpoint_file):
+        return []
+    with open(checkpoint_file, "r") as f:
+        return [json.loads(line) for line in f if line.strip() != ""]
+
+
+def main():
+    controller = AdaptiveChunkController(400, max_concurrency = 4)
+    for latency in [1, 1, 1]:
+        controller.record_success(latency)
+    controller.record_failure(503)
+    logger.info(controller.print_summary())
+    print(controller.print_summary())
+
+
+if __name__ == '__main__':
+    main()
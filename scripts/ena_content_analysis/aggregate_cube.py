@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Script of aggregate_cube.py is to count the records of many group-bys of the same frame with one scan of it
+
+The plotting stages group the same big frame by many paths, often prefixes or subsets of each other
+(e.g. ['continent', 'country_clean'] and ['ocean']). The cube is the record count of the finest grain, i.e.
+grouped by every dimension at once, which is computed once. Any coarser group-by is then a roll up (sum)
+of the cube, which is only as big as the number of distinct combinations, not the number of records.
+As with df.groupby(path_list).size(), the rows with a missing value in the path are left out of its counts.
+
+usage:
+    cube = AggregateCube(df, ['continent', 'country_clean', 'ocean'])
+    plot_df = cube.counts(['continent', 'country_clean'])
+    plot_df = cube.counts(['ocean'], where = lambda cube_df: cube_df['continent'] == 'europe')
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x aggregate_cube.py
+"""
+
+import logging
+import sys
+import pandas as pd
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+class AggregateCube:
+    """
+    the record counts of a frame, by every combination of the dimensions present in it
+    """
+
+    def __init__(self, df, dimensions):
+        """
+        :param df: the snapshot of the frame, later changes to it are not seen
+        :param dimensions: list of all the columns that any counts() will group by
+        """
+        self.dimensions = list(dimensions)
+        self.record_total = len(df)
+        self.cube_df = df.groupby(self.dimensions, dropna = False, observed = True).size() \
+            .to_frame('record_count').reset_index()
+        logger.debug(f"AggregateCube of {self.record_total} records by {self.dimensions}: {len(self.cube_df)} cells")
+
+    def counts(self, path_list, name='record_count', where=None):
+        """
+        :param path_list: some of the dimensions
+        :param name: of the count column
+        :param where: optional function of the cube DataFrame (the dimensions and record_count), returning a
+                      boolean mask of the cells to count, i.e. a filter on the records by their dimensions
+        :return: DataFrame of path_list and the count, as df.groupby(path_list).size().to_frame(name).reset_index()
+        """
+        missing_dimensions = [column for column in path_list if column not in self.dimensions]
+        if missing_dimensions:
+            logger.error(f"{missing_dimensions} are not dimensions of the AggregateCube {self.dimensions}")
+            sys.exit(1)
+        cube_df = self.cube_df if where is None else self.cube_df[where(self.cube_df)]
+        return cube_df.groupby(path_list, observed = True)['record_count'].sum().to_frame(name).reset_index()
+
+
+def main():
+    df = pd.DataFrame({'continent': ['europe', 'europe', 'asia', None], 'country_clean': ['France', 'Spain', 'Japan', None],
+                       'ocean': ['not ocean', 'not ocean', 'Pacific Ocean', 'Atlantic Ocean']})
+    cube = AggregateCube(df, ['continent', 'country_clean', 'ocean'])
+    print(cube.counts(['continent', 'country_clean']))
+    print(cube.counts(['ocean'], where = lambda cube_df: cube_df['continent'] == 'europe'))
+
+
+if __name__ == '__main__':
+    main()
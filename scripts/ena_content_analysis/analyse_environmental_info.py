@@ -20,6 +20,14 @@ from eDNA_utilities import print_value_count_table, \
     get_ena_checklist_dict, obj_print_and_display_md
 from get_environmental_info import get_all_study_details, process_geographical_data
 from taxonomy import *
+from taxonomy_interval_index import TaxonomyIntervalIndex
+from tag_decoder import add_env_tag_columns
+from readrun_dataset import load_readrun_frame
+from collection_dates import get_collection_date_normaliser, get_collection_year_bins
+from distinct_value_cache import DistinctValueCache
+from env_prediction import get_env_predictor
+from readrun_pipeline import LazyReadrunPipeline
+from aggregate_cube import AggregateCube
 
 logger = logging.getLogger(name = 'mylogger')
 pd.set_option('display.max_columns', None)
@@ -27,9 +35,9 @@ pd.set_option('max_colwidth', None)
 pd.options.mode.copy_on_write = True
 
 def clean_dates_in_df(my_df):
-    my_df['collection_year'] = my_df['collection_date'].apply(collection_date_year)
-    my_df['collection_year'] = pd.to_numeric(my_df['collection_year'], errors = 'coerce').astype('Int64')
-    my_df['collection_year_bin'] = my_df['collection_year'].apply(create_year_bins)
+    # the collection_date_year() and create_year_bins() rules, vectorized over the distinct collection_date values
+    my_df['collection_year'] = get_collection_date_normaliser().get_collection_years(my_df['collection_date'])
+    my_df['collection_year_bin'] = get_collection_year_bins(my_df['collection_year'])
     return my_df
 
 def select_first_part(value):
@@ -71,12 +79,20 @@ def get_presence_or_absence_col(df, col_name):
             present_count += 1
     return present_count, absent_count
 
-def filter_on_library_strategies(df, library_strategy_list_to_keep):
-
+def report_library_counts_before_filtering(df):
     logger.info("before filtering")
     print_value_count_table(df.library_source)
     print_value_count_table(df.library_strategy)
 
+
+def filter_on_library_strategies(df, library_strategy_list_to_keep, report_before=True):
+    """
+    :param report_before: False where the frame is already filtered, and so the counts before filtering are
+                          reported elsewhere, see get_readrun_detail_pipeline()
+    """
+    if report_before:
+        report_library_counts_before_filtering(df)
+
     logger.info(library_strategy_list_to_keep)
 
     df = df.loc[df['library_strategy'].isin(library_strategy_list_to_keep)]
@@ -101,16 +117,17 @@ def experimental_analysis_inc_filtering(df):
     print_value_count_table(df.library_source)
     logger.info(f"type = {type(df)}")
 
-    plot_df = df.groupby(['instrument_platform']).size().to_frame('record_count').reset_index().sort_values(by=['record_count'], ascending=False)
+    path_list = ['library_source', 'library_strategy', 'instrument_platform', 'collection_year_bin']
+    cube = AggregateCube(df, path_list)   # the counts below are all roll ups of this one group-by
+    plot_df = cube.counts(['instrument_platform']).sort_values(by=['record_count'], ascending=False)
     obj_print_and_display_md(plot_df,"instrument_platform")
 
     plot_simple_pie(plot_df,'record_count','instrument_platform', '' , "../images/ena_instrument_platform_pie.png")
 
-    print(df.groupby(['library_source', 'library_strategy']).size().reset_index().to_markdown(index=False))
+    print(cube.counts(['library_source', 'library_strategy']).to_markdown(index=False))
     #logger.info(df.head(10).to_markdown(index=False))
     logger.info(df.columns)
-    path_list = ['library_source', 'library_strategy', 'instrument_platform', 'collection_year_bin']
-    plot_df = df.groupby(path_list).size().to_frame('record_count').reset_index()
+    plot_df = cube.counts(path_list)
     logger.info(plot_df.to_markdown(index=False))
     plotfile = "../images/experimental_analysis_strategy.png"
     logger.info(f"plotting {plotfile}")
@@ -157,7 +174,7 @@ def target_gene_analysis(df):
     # print_value_count_table(df['target_gene'])
     total = len(df)
 
-    df["target_gene_clean_set"] = df["target_gene"].apply(get_barcoding_genes)
+    df["target_gene_clean_set"] = get_barcoding_gene_cache().map_series(df["target_gene"])
 
     tmp_df = df[df['target_gene'] != ""]
     print_value_count_table(tmp_df['target_gene'])
@@ -173,77 +190,50 @@ def target_gene_analysis(df):
 
 def add_taxonomy_columns(df):
     """
-
+    The lookups are done once per distinct tax_id, from the local taxonomy store, then mapped onto the rows,
+    so scales to millions of rows.
     :param df:
     :return: df: with scientific_name, lineage and tax_lineage
     """
-    def lineage_lookup(value):
-        # logger.info(taxonomy_hash_by_tax_id[value])
-        if value in taxonomy_hash_by_tax_id:
-            return taxonomy_hash_by_tax_id[value]['lineage']
-
-        logger.debug(f"warning  taxonomy_hash_by_tax_id: {value} does not exist")
-        return ""
-
-    def tax_lineage_lookup(value):
-        # logger.info(taxonomy_hash_by_tax_id[value])
-        if value in taxonomy_hash_by_tax_id:
-            return taxonomy_hash_by_tax_id[value]['tax_lineage']
-
-        logger.debug(f"warning  taxonomy_hash_by_tax_id: {value} does not exist")
-        return ""
-
-    def scientific_name_lookup(value):
-        # logger.info(taxonomy_hash_by_tax_id[value])
-        if value in taxonomy_hash_by_tax_id:
-            return taxonomy_hash_by_tax_id[value]['scientific_name']
-
-        logger.debug(f"warning  taxonomy_hash_by_tax_id: {value} does not exist")
-        return ""
-
     if 'lineage' in df:
         logger.info(f"Already have the taxonomic columns, so can forgo this again")
         return df
     else:
         tax_id_list = df['tax_id'].unique()
         taxonomy_hash_by_tax_id = create_taxonomy_hash_by_tax_id(tax_id_list)
-        df['scientific_name'] = df['tax_id'].apply(scientific_name_lookup)
-        df['lineage'] = df['tax_id'].apply(lineage_lookup)
-        df['tax_lineage'] = df['tax_id'].apply(tax_lineage_lookup)
+        missing_total = len(set(tax_id_list) - set(taxonomy_hash_by_tax_id))
+        if missing_total > 0:
+            logger.debug(f"warning  taxonomy_hash_by_tax_id: {missing_total} tax_ids do not exist")
+        for column in ['scientific_name', 'lineage', 'tax_lineage']:
+            lookup = {tax_id: record[column] for tax_id, record in taxonomy_hash_by_tax_id.items()}
+            df[column] = df['tax_id'].map(lookup).fillna("")
         return df
 
-def taxonomic_filter(df, taxonomy_to_filter):
+def get_taxonomy_filter_tax_ids():
+    """
+    the taxonomy_to_filter options, mapped to the tax_id at the top of their subtree
+    :return: dict
     """
+    return {"fungi": "4751"}
 
+def taxonomic_filter(df, taxonomy_to_filter):
+    """
+    keeps the rows whose taxon is in the subtree of taxonomy_to_filter.
+    Uses the interval index of the lineages, so is one vectorised range test rather than parsing each lineage
     :param taxonomy_to_filter:
     :param df:
     :return: df
     """
-
-    def do_the_actual_filtering(my_df, my_taxonomy_to_filter):
-        my_df = add_taxonomy_columns(my_df)
-        start_total = len(my_df)
-        sample_num = 3
-        logger.info(f"samples to analyse({sample_num}) = {df.lineage.sample(sample_num).to_string()}")
-        df['lineage_list'] = df['lineage'].str.split(';', expand = False).copy()
-        if my_taxonomy_to_filter == "Fungi":
-
-            logger.info(f"\n{df.sample(2)}")
-            df['lineage_1'] = df['lineage_list'].str[0]
-            df['lineage_2'] = df['lineage_list'].str[1]
-            df['lineage_3'] = df['lineage_list'].str[2]
-            my_df = my_df.query('lineage_2 == @my_taxonomy_to_filter')
-        else:
-            my_df = my_df.query('lineage.str.contains(@my_taxonomy_to_filter)')
-        end_total = len(my_df)
-        logger.info(f"before filtering for {my_taxonomy_to_filter}, start_total={start_total} after: end_total={end_total}")
-        return my_df
-
-    if taxonomy_to_filter == "fungi":
-        df = do_the_actual_filtering(df, "Fungi")
-    else:
+    filter_tax_ids = get_taxonomy_filter_tax_ids()
+    if taxonomy_to_filter not in filter_tax_ids:
         sys.exit(f"unknown taxonomy filter of {taxonomy_to_filter}")
 
+    df = add_taxonomy_columns(df)
+    start_total = len(df)
+    interval_index = TaxonomyIntervalIndex(df['tax_lineage'].unique())
+    df = df[interval_index.get_subtree_mask(df['tax_id'], filter_tax_ids[taxonomy_to_filter])]
+    end_total = len(df)
+    logger.info(f"before filtering for {taxonomy_to_filter}, start_total={start_total} after: end_total={end_total}")
     return df
 
 
@@ -286,13 +276,16 @@ def taxonomic_analysis(df):
 
     logger.info(f"\n{df.sample(3)}")
 
+    # the counts below are all roll ups of this one group-by
+    cube = AggregateCube(df, ['library_source', 'library_strategy', 'lineage_1', 'lineage_2', 'lineage_9',
+                              'lineage_minus3', 'lineage_minus2', 'scientific_name', 'lineage'])
     path_list = ['lineage_2', 'lineage_minus2', 'scientific_name']
-    plot_df = df.groupby(path_list).size().to_frame('record_count').reset_index()
+    plot_df = cube.counts(path_list)
     plotfile = "../images/taxonomic_analysis_sunburst.png"
     plot_sunburst(plot_df, 'Figure: ENA "Environmental" readrun records, tax lineage(select)', path_list, 'record_count', plotfile)
     logger.info("-----------------------------------------------------------------------------------------------------")
     path_list = ['lineage_1', 'lineage_minus3', 'lineage_minus2', 'scientific_name', 'lineage']
-    plot_df = df.groupby(path_list).size().to_frame('record_count').reset_index()
+    plot_df = cube.counts(path_list)
     logger.info(f"\n{plot_df.head(3)}")
     logger.info(f"\n{plot_df['lineage_1'].value_counts()}")
     plot_df = plot_df[plot_df['lineage_1'] == 'Eukaryota']
@@ -304,7 +297,7 @@ def taxonomic_analysis(df):
                   'record_count', plotfile)
 
     path_list = ['lineage_2', 'lineage_minus3', 'lineage_minus2', 'scientific_name', 'lineage']
-    plot_df = df.groupby(path_list).size().to_frame('record_count').reset_index()
+    plot_df = cube.counts(path_list)
     plot_df = plot_df[plot_df['lineage'].str.contains('Vertebrata')]
     obj_print_and_display_md(plot_df, "ena_lineage_vertebrata")
     plotfile = "../images/taxonomic_analysis_vertebrata_sunburst.png"
@@ -312,18 +305,18 @@ def taxonomic_analysis(df):
               'record_count', plotfile)
 
     path_list = ["lineage_9"]
-    plot_df = df[df['lineage'].str.contains('Vertebrata')]
-    plot_df = plot_df.groupby(path_list).size().to_frame('record_count').reset_index().sort_values(by='record_count', ascending=False)
+    plot_df = cube.counts(path_list, where = lambda cube_df: cube_df['lineage'].str.contains('Vertebrata', na = False))
+    plot_df = plot_df.sort_values(by='record_count', ascending=False)
     obj_print_and_display_md(plot_df, "ena_lineage_vertebrata")
 
     path_list = ['library_source', 'library_strategy', 'lineage_1']
-    plot_df = df.groupby(path_list).size().to_frame('record_count').reset_index()
+    plot_df = cube.counts(path_list)
     plotfile = "../images/experimental_analysis_strategy_tax.png"
     sankey_link_weight = 'record_count'
     plot_sankey(plot_df, sankey_link_weight, path_list, 'Figure ENA "Environmental" readrun record count: library_source, library_strategy & tax', plotfile)
 
     path_list = ['lineage_2', 'lineage_minus3', 'lineage_minus2', 'scientific_name', 'lineage']
-    plot_df = df.groupby(path_list).size().to_frame('record_count').reset_index()
+    plot_df = cube.counts(path_list)
     plot_df = plot_df[plot_df['lineage'].str.contains('Fungi')]
 
     path_list = ['lineage_minus3', 'lineage_minus2', 'scientific_name']
@@ -436,6 +429,23 @@ def get_barcoding_genes(value):
                 return list(clean_name(genes))
             return None
 
+barcoding_genes_cache_version = "1"   # bump whenever the get_barcoding_genes() rules change
+_barcoding_gene_cache = None
+
+
+def get_barcoding_gene_cache(cache_file="barcoding_genes_cache.pickle"):
+    """
+    lazily creates the persisted cache of get_barcoding_genes(), so each distinct target_gene or study
+    title and description is only parsed once, even across runs
+    :param cache_file:
+    :return: DistinctValueCache
+    """
+    global _barcoding_gene_cache
+    if _barcoding_gene_cache is None:
+        _barcoding_gene_cache = DistinctValueCache(get_barcoding_genes, cache_file,
+                                                   version = barcoding_genes_cache_version)
+    return _barcoding_gene_cache
+
 def analyse_barcode_study_details(df):
     """
     Generates a subset of the df, indexed from sample_accession
@@ -464,7 +474,7 @@ def analyse_barcode_study_details(df):
     barcoding_df['combined_tit_des'] = barcoding_df['study_title'] + barcoding_df['study_description']
     barcoding_df['is_barcoding_experiment_probable'] = True
 
-    barcoding_df['barcoding_genes_from_study'] = barcoding_df.combined_tit_des.apply(get_barcoding_genes)
+    barcoding_df['barcoding_genes_from_study'] = get_barcoding_gene_cache().map_series(barcoding_df.combined_tit_des)
     logger.debug(barcoding_df['barcoding_genes_from_study'].value_counts())
     print_value_count_table(barcoding_df['barcoding_genes_from_study'])
 
@@ -501,6 +511,7 @@ def add_insdc_member_receiver(df):
             return None
 
     df['insdc_member_receiver'] = df['sample_accession'].apply(get_insdc_member_receiver)
+    print_value_count_table(df.insdc_member_receiver)
     logger.debug("exiting add_insdc_member_receiver")
     return df
 
@@ -526,8 +537,9 @@ def do_geographical(df):
     print("Oceans Count and Percentage")
     print_value_count_table(tmp_df.ocean)
 
+    cube = AggregateCube(df, ['continent', 'country_clean', 'ocean'])   # both plots are roll ups of this one group-by
     path_list = ['continent', 'country_clean']
-    plot_df = df.groupby(path_list).size().to_frame('record_count').reset_index()
+    plot_df = cube.counts(path_list)
     plot_df = plot_df.sort_values(by=['record_count'], ascending=False)
     logger.info(f"after process_geographical_data count: {len(plot_df)}")
     plotfile = "../images/geography_sunburst.png"
@@ -556,7 +568,7 @@ def do_geographical(df):
                    "../images/ena_all_countries.png")
 
     path_list = ['ocean']
-    plot_df = df.groupby(path_list).size().to_frame('record_count').reset_index()
+    plot_df = cube.counts(path_list)
     plot_df = plot_df[plot_df['ocean'] != 'not ocean']
     plotfile = "../images/ocean_sunburst.png"
     logger.info(f"plotting {plotfile}")
@@ -657,7 +669,7 @@ def create_year_bins(value):
     max_year=2025
     if isinstance(value, int):
         if value <= min_year:
-            return str(min) + "-pre"
+            return str(min_year) + "-pre"
         for x in range(min_year, max_year, 5):
             # 2023 far more likely than min so could try reversing the order
             # logger.info(value)
@@ -673,30 +685,22 @@ def detailed_environmental_analysis(df):
     :return: df        with the addition of ['env_prediction']  ['env_prediction_hl']  ['env_confidence']
     """
     logger.info(len(df))
-    def process_env_tags(value):
-        my_tag_list = value.split(';')
-        my_env_tags = [s for s in my_tag_list if "env_" in s]
-        return my_env_tags
 
     print_value_count_table(df.tag)
     # logger.info(df.tag.head(50))
-    df['env_tag'] = df['tag'].apply(process_env_tags)
-    df['env_tag_string'] = df['env_tag'].apply(lambda x: ';'.join(x))
+    # the env_tags decoded by filter_for_aquatic() are re-used, the tag column is only decoded if they are not there
+    add_env_tag_columns(df)
+    df['env_tag_string'] = df['env_tags'].fillna("")
     # logger.info(df['env_tag'].value_counts().head(5))
 
-    def is_w_env_tags(value_list):
-        if len(value_list) == 0:
-            return False
-        return True
-
     # tmp_df = cp_df[len(cp_df.env_tag)> 0]
-    df['is_env_tags'] = df['env_tag'].apply(is_w_env_tags)
-    logger.debug(f"{df['env_tag'].value_counts().head()}")
+    df['is_env_tags'] = df['env_tag_string'] != ""
+    logger.debug(f"{df['env_tag_string'].value_counts().head()}")
     logger.info(f"{df.columns}")
     tmp_df = df[df['is_env_tags'] == True]
     # print_value_count_table(tmp_df.env_tag)
-    logger.debug(tmp_df['env_tag'].value_counts().head(5))
-    logger.debug(tmp_df['env_tag'].explode().unique())
+    logger.debug(tmp_df['env_tag_string'].value_counts().head(5))
+    logger.debug(tmp_df['env_tag_string'].str.split(';').explode().unique())
     # tmp_df['env_tag_string'] = tmp_df['env_tag'].apply(lambda x: ';'.join(x))
     # tmp_df['env_tag_string'] = tmp_df['env_tag'].str.join(';')
     # logger.info(tmp_df['env_tag_string'].unique())
@@ -705,195 +709,13 @@ def detailed_environmental_analysis(df):
     #      logger.info(tag)
     logger.info(f"starting len={len(df)} filtered len={len(tmp_df)}")
 
-    tag_string_assignment = {}
-    # f = tmp_df['env_tag_string'].str.contains("env_geo",na=False)
-
-    logger.info("++++++++++++++++++++++++++++++++++++++++++++++++")
-    not_assigned = []
-    multiples = []
-    aquatic_tag_set = ['env_geo:marine', 'env_geo:freshwater', 'env_geo:brackish', 'env_geo:coastal', 'env_tax:marine',
-                        'env_tax:freshwater', 'env_tax:brackish', 'env_tax:coastal']
-    terrestrial_tag_set = ['env_geo:terrestrial', 'env_tax:terrestrial']
-    for tags in tmp_df['env_tag_string'].unique():
-        logger.debug(tags)
-        tag_list = tags.split(';')
-
-        if 'env_geo' in tags:
-            # logger.info(f"----------------------{tags}")
-            matches = re.findall(r'env_geo[^;]*', tags)
-            # logger.info(matches)
-            if len(matches) > 1:
-                msg = f"WARNING, multiple GEO matches={matches}, tags={tags} THAT IS NOT YET HANDLED"
-                if 'env_geo:coastal' in matches and 'env_geo:marine' in matches:
-                    if len(tag_list) == 2:
-                        tag_string_assignment[tags] = {'prediction': 'coastal', 'confidence': 'medium'}
-                    elif 'env_tax:marine' in tags or 'env_tax:coastal' or 'env_tax:brackish' in tags:
-                        tag_string_assignment[tags] = {'prediction': 'coastal', 'confidence': 'high'}
-                    else:
-                        logger.debug(msg)
-                        multiples.append(msg)
-                elif 'env_geo:terrestrial' in tags:
-                    if 'env_geo:freshwater' in tags:
-                        tag_string_assignment[tags] = {'prediction': 'freshwater', 'confidence': 'low'}
-                    elif 'env_geo:coastal' in tags:
-                        tag_string_assignment[tags] = {'prediction': 'terrestrial', 'confidence': 'medium'}
-                    else:
-                        multiples.append(msg)
-                elif 'env_geo:marine' in tags:
-                        if 'env_tax:marine' in tags:
-                            tag_string_assignment[tags] = {'prediction': 'marine', 'confidence': 'medium'}
-                        elif 'env_geo:freshwater' in tags and 'env_tax:freshwater' in tags:
-                            tag_string_assignment[tags] = {'prediction': 'freshwater', 'confidence': 'medium'}
-                        elif 'env_geo:freshwater' in tags:
-                            tag_string_assignment[tags] = {'prediction': 'brackish', 'confidence': 'low'}
-                        else:
-                            multiples.append(msg)
-                else:
-                    logger.debug(matches)
-                    multiples.append(msg)
-            else:  # i.e. one match
-                if matches[0] == 'env_geo:marine' and 'env_tax:marine' in tags:
-                    tag_string_assignment[tags] = {'prediction': 'marine', 'confidence': 'high'}
-                elif matches[0] == 'env_geo:freshwater' and 'env_geo:freshwater' in tags:
-                    tag_string_assignment[tags] = {'prediction': 'freshwater', 'confidence': 'high'}
-                elif matches[0] == 'env_geo:coastal' and 'env_geo:coastal' in tags:
-                    tag_string_assignment[tags] = {'prediction': 'coastal', 'confidence': 'high'}
-                elif matches[0] == 'env_geo:brackish' and 'env_geo:brackish' in tags:
-                    tag_string_assignment[tags] = {'prediction': 'brackish', 'confidence': 'high'}
-                elif matches[0] == 'env_geo:terrestrial' and 'env_geo:terrestrial' in tags:
-                    tag_string_assignment[tags] = {'prediction': 'terrestrial', 'confidence': 'high'}
-                elif len(tag_list) == 2 and 'env_geo:terrestrial' not in tags:
-                    if tag_list[0] in aquatic_tag_set and tag_list[1] in aquatic_tag_set:
-                        tag_string_assignment[tags] = {'prediction': 'mixed_aquatic', 'confidence': 'medium'}
-                    elif (tag_list[0] in terrestrial_tag_set and tag_list[1] in aquatic_tag_set) or (tag_list[1] in terrestrial_tag_set and tag_list[0] in aquatic_tag_set):
-                            tag_string_assignment[tags] = {'prediction': 'mixed', 'confidence': 'low'}
-                elif len(tag_list) == 3 and 'env_geo:terrestrial' not in tags:
-                    if tag_list[0] in aquatic_tag_set and (tag_list[1] in aquatic_tag_set or tag_list[2] in aquatic_tag_set):
-                        tag_string_assignment[tags] = {'prediction': 'mixed_aquatic', 'confidence': 'medium'}
-                    else:
-                        tag_string_assignment[tags] = {'prediction': 'mixed', 'confidence': 'low'}
-                else:
-                    logger.debug("________________________________________________________")
-                    logger.debug(matches[0])
-                    if len(tag_list) == 1:
-                        value = re.findall(r'env_geo:(.*)', matches[0])[0]
-                        tag_string_assignment[tags] = {'prediction': value, 'confidence': 'medium'}
-                    elif matches[0] == 'env_geo:coastal' and "brackish" in tags:
-                        tag_string_assignment[tags] = {'prediction': 'coastal', 'confidence': 'medium'}
-                    elif matches[0] == 'env_geo:marine' and ("brackish" in tags or "coastal" in tags):
-                        tag_string_assignment[tags] = {'prediction': 'coastal', 'confidence': 'medium'}
-                    elif matches[0] == 'env_geo:marine' and ("terrestrial" in tags):
-                        tag_string_assignment[tags] = {'prediction': 'mixed', 'confidence': 'low'}
-                    else:
-                        if re.match(r'^(env_tax:freshwater;env_geo:marine|env_tax:freshwater;env_tax:terrestrial;env_geo:marine)$',tags):
-                            not_assigned.append(tags)
-                        else:
-                            logger.error(f"Not assigned--->{tags} len_tags={len(tag_list)}")
-                            sys.exit(f"Not assigned--->{tags} len_tags={len(tag_list)}")
-
-        # the following are where there are no env_geo: tgs
-        elif len(tag_list) == 1:
-            value = re.findall(r'env_tax:(.*)', tag_list[0])[0]
-            tag_string_assignment[tags] = {'prediction': value, 'confidence': 'medium'}
-        elif len(tag_list) == 2:
-            if tag_list[0] in aquatic_tag_set and tag_list[1] in aquatic_tag_set:
-                tag_string_assignment[tags] = {'prediction': 'mixed_aquatic', 'confidence': 'medium'}
-            elif tag_list[0] in aquatic_tag_set and tag_list[1] in aquatic_tag_set:
-                tag_string_assignment[tags] = {'prediction': 'mixed', 'confidence': 'low'}
-            elif tag_list[0] in aquatic_tag_set and tag_list[1] in terrestrial_tag_set:
-                tag_string_assignment[tags] = {'prediction': 'mixed', 'confidence': 'low'}
-            elif ((tag_list[0] in terrestrial_tag_set and tag_list[1] in aquatic_tag_set) or
-                  (tag_list[1] in terrestrial_tag_set and tag_list[0] in aquatic_tag_set)):
-                tag_string_assignment[tags] = {'prediction': 'mixed', 'confidence': 'low'}
-            else:
-                not_assigned.append(tags)
-        elif len(tag_list) == 3:
-                if tag_list[0] in aquatic_tag_set and (
-                        tag_list[1] in aquatic_tag_set or tag_list[2] in aquatic_tag_set):
-                    tag_string_assignment[tags] = {'prediction': 'mixed_aquatic', 'confidence': 'low'}
-                elif tag_list[1] in aquatic_tag_set and (
-                        tag_list[2] in aquatic_tag_set):
-                    tag_string_assignment[tags] = {'prediction': 'mixed_aquatic', 'confidence': 'low'}
-                elif tag_list[0] in terrestrial_tag_set and (
-                            tag_list[1] in aquatic_tag_set and tag_list[2] in aquatic_tag_set):
-                    tag_string_assignment[tags] = {'prediction': 'mixed', 'confidence': 'low'}
-                else:
-                    not_assigned.append(tags)
-        elif len(tag_list) == 4:
-                if (tag_list[0] in aquatic_tag_set or tag_list[1] in aquatic_tag_set) and (
-                        tag_list[2] in aquatic_tag_set or tag_list[3] in aquatic_tag_set):
-                    tag_string_assignment[tags] = {'prediction': 'mixed_aquatic', 'confidence': 'low'}
-                else:
-                    not_assigned.append(tags)
-        else:
-            not_assigned.append(tags)
-            logger.debug(f"Not assigned--->{tags} len_tags={len(tag_list)}")
-    # END OF FOR
-    logger.info("finished big for loop")
-
-    # logger.info(tag_string_assignment)
-    if len(multiples) > 0:
-        logger.error("Apologies: you need to address these cases before proceeding")
-        logger.error(f"multiples:{multiples}")
-        logger.error(f"not_assigned: {not_assigned}")
-        sys.exit("not_assigned:")
-    elif len(not_assigned) > 0:
-        logger.error("Apologies: you need to address these cases before proceeding")
-        logger.error(f"not_assigned: {not_assigned}")
-        sys.exit("not_assigned")
-
-    # logger.info('env_tax:freshwater;env_tax:terrestrial;env_geo:marine')
-    # tmp_df = df[df['env_tags'].str.contains('env_tax:freshwater;env_tax:terrestrial;env_geo:marine')]
-    # logger.info(tmp_df['sample_accession'].unique())
-    logger.info("about to do a bunch of assignments")
-
-    def actually_assign_env_info_pred(value):
-        # logger.info(value)
-        if len(value) > 1:
-            # return tag_string_assignment[value]['prediction'], tag_string_assignment[value]['confidence']
-            return tag_string_assignment[value]['prediction']
-        return "terrestrial_assumed"
-
-    def actually_assign_env_info_conf(value):
-        # logger.info(value)
-        if len(value) > 1:
-            # return tag_string_assignment[value]['prediction'], tag_string_assignment[value]['confidence']
-            return tag_string_assignment[value]['confidence']
-        return "low"
-
-    def add_ocean_evidence(vec):
-        env_prediction = vec[0]
-        ocean_evidence = vec[1]
-        if ocean_evidence != "not ocean" and env_prediction in ['terrestrial', 'mixed']:
-            logger.debug(f"ocean_evidence: {ocean_evidence}")
-            return "marine"
-        return env_prediction
-
-    aquatic_set = ('marine', 'brackish', 'coastal', 'freshwater', 'mixed_aquatic')
-    logger.info(f"aquatic_set: {aquatic_set}")
-
-    def actually_assign_env_info_pred_hl(value):
-        # logger.info(value)
-        if value != "terrestrial_assumed" and value is not None:
-            if value == "terrestrial":
-                   return value
-            elif value in aquatic_set:
-                    return "aquatic"
-            else:
-                   return "mixed"
-        return "terrestrial_assumed"
-
-        #, tag_string_assignment[value]['confidence']
-    logger.info(len(df))
-
-    df['env_prediction'] = df['env_tags'].apply(actually_assign_env_info_pred)
-    df['env_confidence'] = df['env_tags'].apply(actually_assign_env_info_conf)
-    df['env_prediction'] = df[['env_prediction', 'ocean']].apply(add_ocean_evidence, axis=1)
-
-
-    df['env_prediction_hl'] = df['env_prediction'].apply(actually_assign_env_info_pred_hl)
+    # the rules are a lookup table keyed on the canonical env_ tag set, see env_prediction.py
+    prediction_df = get_env_predictor().predict(df['env_tags'], df['ocean'])
+    df[['env_prediction', 'env_confidence', 'env_prediction_hl']] = prediction_df
     print()
-    tmp_df = df.groupby(['env_prediction', 'env_confidence']).size().reset_index(name = 'count')
+    path = ['env_prediction_hl', 'env_prediction', 'env_confidence']
+    cube = AggregateCube(df, path)   # both tables are roll ups of this one group-by
+    tmp_df = cube.counts(['env_prediction', 'env_confidence'], name = 'count')
     logger.info("\n" + tmp_df.to_string())
     obj_print_and_display_md(tmp_df, "ena_aquatic_environment_predictions")
     print()
@@ -901,9 +723,8 @@ def detailed_environmental_analysis(df):
     # sys.exit("'env_prediction', 'env_confidence'")
     #
 
-    path = ['env_prediction_hl', 'env_prediction', 'env_confidence']
     value_field = 'record_count'
-    plot_df = df.groupby(path).size().to_frame('record_count').reset_index()
+    plot_df = cube.counts(path)
     plotfile = "../images/env_predictions.png"
     plot_sunburst(plot_df, "Figure: ENA readrun Aquatic environmental predictions using species and lat/lons (Sunburst Plot)", path, value_field, plotfile)
 
@@ -994,50 +815,51 @@ def clean_df(df):
     df['lon'] = pd.to_numeric(df['lon'], errors = 'coerce')
     return df
 
-def analyse_readrun_detail(df):
-    logger.info("in analyse_readrun_detail")
-    df = clean_df(df)
+def get_readrun_detail_pipeline(type_of_data, name=None, filters=None, pickle_file=None, columns=None):
+    """
+    the stages of analyse_readrun_detail(), as a plan, with the columns each stage reads from the dataset
+    :param type_of_data: aquatic, all or fungi
+    :param name: the read_run dataset, only needed for collect()
+    :param filters: on the partition columns, e.g. {'query_type': ['environmental_checklists']}
+    :param pickle_file:
+    :param columns: extra columns to read
+    :return: LazyReadrunPipeline
+    """
     strategy_list_to_keep = ['AMPLICON', 'WGS', 'RNA-Seq', 'WGA', 'Targeted-Capture', 'ssRNA-seq', 'miRNA-Seq']
-    if args.type_of_data in ["fungi"]:
-        before_filter_count = len(df)
-        df = taxonomic_filter(df, args.type_of_data)
-        logger.info(f"Done taxonomic filtering for {args.type_of_data} now have {len(df)} / {before_filter_count}")
+    if type_of_data in ["fungi"]:
         strategy_list_to_keep = ['AMPLICON']
-    logger.info(f"in analyse_readrun_detail strategy_list_to_keep={strategy_list_to_keep}" )
-    df = filter_on_library_strategies(df, strategy_list_to_keep)
-
-    # df['sample_accession'] = df['sample_accession'].to_string()
-    logger.info("cols:{}".format(df.columns))
-    logger.info(df['sample_accession'])
-    df = add_insdc_member_receiver(df)
-    print_value_count_table(df.insdc_member_receiver)
-
-    # outfile = all_sample_accessions.tsv"
-    # logger.info(outfile)
-    # df.sample_accession.to_csv(outfile)
-
-    analyse_checklists(df)
-
-    # uncomment when running for real
-    target_gene_analysis(df)
-    df = clean_dates_in_df(df)
+    logger.info(f"in get_readrun_detail_pipeline strategy_list_to_keep={strategy_list_to_keep}")
+    taxonomy_columns = ['tax_id', 'scientific_name', 'lineage', 'tax_lineage']   # the last 3 only if already there
+
+    pipeline = LazyReadrunPipeline(name, filters, pickle_file, columns)
+    # the cheap library_strategy filter goes first, so is pushed down into the read; the counts before it are
+    # reported from a scan of just those columns, as the main scan never loads the rows it filters away
+    pipeline.filter_isin('library_strategy', strategy_list_to_keep)
+    pipeline.report_before_filters("library_counts_before_filtering", report_library_counts_before_filtering,
+                                   ['library_source', 'library_strategy'])
+    pipeline.stage("clean_df", clean_df, ['lat', 'lon'])
+    if type_of_data in ["fungi"]:
+        pipeline.stage("taxonomic_filter", lambda df: taxonomic_filter(df, type_of_data), taxonomy_columns)
+    pipeline.stage("filter_on_library_strategies",
+                   lambda df: filter_on_library_strategies(df, strategy_list_to_keep, report_before = False),
+                   ['library_strategy', 'library_source'])
+    pipeline.stage("add_insdc_member_receiver", add_insdc_member_receiver, ['sample_accession'])
+    pipeline.stage("analyse_checklists", analyse_checklists, ['ncbi_reporting_standard', 'checklist'])
+    pipeline.stage("target_gene_analysis", target_gene_analysis, ['target_gene', 'study_accession'])
+    pipeline.stage("clean_dates_in_df", clean_dates_in_df, ['collection_date'])
+    pipeline.stage("analyse_dates", analyse_dates, [])
+    pipeline.stage("experimental_analysis_inc_filtering", experimental_analysis_inc_filtering,
+                   ['instrument_platform'])
+    pipeline.stage("do_geographical", do_geographical, ['country', 'broad_scale_environmental_context'])
+    pipeline.stage("taxonomic_analysis", taxonomic_analysis, taxonomy_columns)
+    pipeline.stage("detailed_environmental_analysis", detailed_environmental_analysis, ['tag', 'env_tags'])
+    return pipeline
 
-    analyse_dates(df)
-
-    logger.info(f"before experimental_analysis_inc_filtering filtered: rownum={len(df)}")
-    df = experimental_analysis_inc_filtering(df)
-    logger.info(f"after experimental_analysis_inc_filtering filtered: rownum={len(df)}")
-
-    # logger.info("-------------about to do geographical------------------------")
-    df = do_geographical(df)
-
-    logger.info("-------------about to do taxonomic_analysis------------------------")
-    df = taxonomic_analysis(df)
-
-    logger.info("-------------about to do detailed_environmental_analysis------------------------")
-    df = detailed_environmental_analysis(df)
+def analyse_readrun_detail(df):
+    logger.info("in analyse_readrun_detail")
+    df = get_readrun_detail_pipeline(args.type_of_data).run(df)
     logger.info("-------------end of analyse_readrun_detail------------------------")
-    
+    return df
 
 
 def main():
@@ -1053,17 +875,29 @@ def main():
 
     logger.info(f"in main with args.type_of_data={args.type_of_data}")
     if args.type_of_data in ["all","fungi"]:
+        dataset_name = 'env_readrun_detail'
         pickle_file = 'env_readrun_detail_all.pickle'
     elif args.type_of_data == "aquatic":
+        dataset_name = 'df_aquatic_env_readrun_detail'
         pickle_file = 'df_aquatic_env_readrun_detail.pickle'
     else:
         sys.exit(f"args.type_of_data is unknown = {args.type_of_data}")
 
     # df_all_study_details = analyse_barcode_study_details(get_all_study_details())
 
-    df_env_readrun_detail = pd.read_pickle(pickle_file)
+    # only the wanted columns and query_type partitions are read
+    filters = {'query_type': args.query_type} if args.query_type else None
+    if args.lazy:
+        pipeline = get_readrun_detail_pipeline(args.type_of_data, dataset_name, filters, pickle_file, args.columns)
+        logger.info(f"lazy pipeline plan:\n{pipeline.explain()}")
+        pipeline.collect()
+        return
+    df_env_readrun_detail = load_readrun_frame(dataset_name, columns = args.columns, filters = filters,
+                                               memory_map = True, pickle_file = pickle_file)
+    if df_env_readrun_detail is None:
+        sys.exit(f"neither the {dataset_name} dataset nor {pickle_file} exist, run get_environmental_info.py first")
     # df_env_readrun_detail = df_env_readrun_detail.sample(1000000)
-    logger.info(f"unpickled from {pickle_file} row total={len(df_env_readrun_detail)}")
+    logger.info(f"loaded {dataset_name} row total={len(df_env_readrun_detail)}")
     logger.info(f"columns={df_env_readrun_detail.columns}")
     analyse_readrun_detail(df_env_readrun_detail)
 
@@ -1088,6 +922,12 @@ if __name__ == '__main__':
     parser.add_argument("-t", "--type_of_data",
                          help = "--type_of_data aquatic|all|fungi",
                          required = True)
+    parser.add_argument("-c", "--columns", nargs = "*", required = False,
+                        help = "only load these columns of the read_run dataset, default all")
+    parser.add_argument("-q", "--query_type", nargs = "*", required = False,
+                        help = "only load these query_type partitions e.g. environmental_checklists, default all")
+    parser.add_argument("-l", "--lazy", required = False, action = "store_true",
+                        help = "only read the columns and library_strategy rows the analysis uses, from the dataset")
     parser.parse_args()
     args = parser.parse_args()
 
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Script of benchmark_portal_api.py is to benchmark the portal API fetch paths against the local portal_api_stand_in
+
+Runs the real client code (chunk_portal_api_call, setup_run_api_call, study2sample, create_taxonomy_hash and
+get_sample_run_accessions) against the stand-in and reports the requests/sec, wall time and peak RSS of each.
+The response cache is turned off, so every run goes to the server.
+
+usage:
+    python3 benchmark_portal_api.py --n_samples 50000 --latency 0.02 --error_rate 0.01
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x benchmark_portal_api.py
+"""
+
+import argparse
+import json
+import logging
+import resource
+import sys
+import time
+from eDNA_utilities import logger, my_coloredFormatter
+from ena_portal_api import configure_portal_url, chunk_portal_api_call, get_ena_portal_url, get_sample_run_accessions
+from ena_api_calls import setup_run_api_call
+from portal_api_stand_in import PortalApiStandIn
+from portal_response_cache import configure_portal_cache
+from study_collection import StudyCollection, study2sample
+from taxonomy import create_taxonomy_hash
+
+
+def get_peak_rss_mb():
+    """
+    N.B. ru_maxrss is the peak of the whole process so far, in KB on linux
+    :return: MB
+    """
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def get_benchmark_scenarios(stand_in):
+    """
+    :param stand_in: PortalApiStandIn, to get the ids from
+    :return: dict of scenario name to a function with no arguments returning the records
+    """
+    tables = stand_in.tables
+    sample_ids = [row["sample_accession"] for row in tables.sample]
+    study_ids = [row["study_accession"] for row in tables.study]
+    tax_ids = [row["tax_id"] for row in tables.taxon]
+    sample_fields = ["sample_accession", "country", "collection_date", "tax_id", "checklist"]
+    return {
+        "chunk_portal_api_call": lambda: chunk_portal_api_call(get_ena_portal_url() + "search?", "sample",
+                                                               sample_fields, None, sample_ids),
+        "setup_run_api_call": lambda: setup_run_api_call("environmental_checklists", 0),
+        "study2sample": lambda: study2sample(study_ids, StudyCollection(), False),
+        "create_taxonomy_hash": lambda: create_taxonomy_hash(tax_ids)[0],
+        "get_sample_run_accessions": lambda: get_sample_run_accessions(sample_ids)
+    }
+
+
+def run_benchmark(stand_in, scenario_names=None):
+    """
+    :param stand_in: a started PortalApiStandIn
+    :param scenario_names: None for all
+    :return: list of result dicts
+    """
+    configure_portal_cache(enabled = False)
+    configure_portal_url(stand_in.get_url())
+    results = []
+    for name, scenario in get_benchmark_scenarios(stand_in).items():
+        if scenario_names is not None and name not in scenario_names:
+            continue
+        stand_in.reset_stats()
+        start_time = time.perf_counter()
+        records = scenario()
+        wall_time = time.perf_counter() - start_time
+        stats = stand_in.get_stats()
+        results.append({
+            "scenario": name,
+            "records": len(records),
+            "requests": stats["requests"],
+            "server_errors": stats["errors"],
+            "bytes": stats["bytes"],
+            "wall_time_s": round(wall_time, 3),
+            "requests_per_s": round(stats["requests"] / wall_time, 2) if wall_time > 0 else 0.0,
+            "peak_rss_mb": get_peak_rss_mb()
+        })
+        logger.info(results[-1])
+    configure_portal_url(None)
+    return results
+
+
+def print_summary(results):
+    columns = ["scenario", "records", "requests", "server_errors", "wall_time_s", "requests_per_s", "peak_rss_mb"]
+    out_string = "".join(column.ljust(28 if column == "scenario" else 16) for column in columns) + "\n"
+    for result in results:
+        out_string += "".join(str(result[column]).ljust(28 if column == "scenario" else 16) for column in columns) + "\n"
+    return out_string
+
+
+def main():
+    stand_in = PortalApiStandIn(n_studies = args.n_studies, n_samples = args.n_samples, n_runs = args.n_runs,
+                                n_taxa = args.n_taxa, latency = args.latency, error_rate = args.error_rate)
+    with stand_in:
+        results = run_benchmark(stand_in, args.scenarios)
+    print(print_summary(results))
+    if args.output_file:
+        with open(args.output_file, "w") as f:
+            json.dump(results, f, indent = 2)
+        logger.info(f"written {args.output_file}")
+
+
+if __name__ == '__main__':
+    logger.propagate = False
+    ch = logging.StreamHandler(stream = sys.stdout)
+    ch.setFormatter(fmt = my_coloredFormatter)
+    logger.addHandler(hdlr = ch)
+
+    prog_des = "Benchmark the portal API fetch paths against a local stand-in of the ENA portal API"
+    parser = argparse.ArgumentParser(description = prog_des)
+    parser.add_argument("-d", "--debug_status",
+                        help = "Debug status i.e.True if selected, is verbose",
+                        required = False, action = "store_true")
+    parser.add_argument("--n_studies", type = int, default = 500, required = False)
+    parser.add_argument("--n_samples", type = int, default = 20000, required = False)
+    parser.add_argument("--n_runs", type = int, default = 40000, required = False)
+    parser.add_argument("--n_taxa", type = int, default = 5000, required = False)
+    parser.add_argument("-l", "--latency", type = float, default = 0.0, required = False,
+                        help = "seconds the stand-in adds to every request")
+    parser.add_argument("-e", "--error_rate", type = float, default = 0.0, required = False,
+                        help = "fraction of the stand-in requests given a 5xx")
+    parser.add_argument("-s", "--scenarios", nargs = "*", required = False,
+                        help = "only run these e.g. study2sample setup_run_api_call")
+    parser.add_argument("-o", "--output_file", required = False, help = "write the results as JSON")
+    args = parser.parse_args()
+
+    if args.debug_status:
+        logger.setLevel(level = logging.DEBUG)
+    else:
+        logger.setLevel(level = logging.INFO)
+    logger.info(prog_des)
+
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Script of collection_dates.py is to get the collection year, and its 5 year bin, of a whole collection_date column
+
+The same rules as analyse_environmental_info.collection_date_year(), but as one combined regular expression whose
+alternatives are in the same order as that if/elif ladder, run with str.extract over the distinct raw values only.
+The distinct raw values already seen are kept in a memo table, so a value is only ever parsed once.
+The year bins are then a single pd.cut.
+
+usage:
+    normaliser = get_collection_date_normaliser()
+    df['collection_year'] = normaliser.get_collection_years(df['collection_date'])
+    df['collection_year_bin'] = get_collection_year_bins(df['collection_year'])
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x collection_dates.py
+"""
+
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(name = 'mylogger')
+
+# one named group per rule of collection_date_year(), the first alternative that matches is the rule used
+_collection_date_pattern = (
+    r"(?s)^(?:"
+    r"(?P<missing>missing|not|[Nn][Aa]|N/A|Not|NOT|unknown|Unk|UNK|-$|.*?(?:Missing|n/a|restricted access|none))"
+    r"|(?P<year>[0-9]{4})$"
+    r"|(?P<year_first>[0-9]{4})[/-]"
+    r"|[0-9]{1,2}/[0-9]{1,2}/(?P<slash_year>[0-9]{2,4})"
+    r"|(?P<dot_date>[0-9]{1,2}.[0-9]{1,2}\.[0-9]{2,4})"
+    r"|.*(?P<year_last>[0-9]{4})$"
+    r"|.*(?P<two_digit_last>[0-2][0-9])$"
+    r"|(?P<day_month_name>[0-9]{1,2}-[A-Za-z]{1,12}-[0-9]{2,4})"
+    r"|(?P<spaced_year>.*? [12][0-9]{3} )"
+    r")")
+
+_max_year = 2025
+_year_bin_edges = list(range(1950, 2021, 5))   # create_year_bins(): (x-5, x] is the bin "x-(x+5)"
+
+
+def get_collection_date_pattern():
+    return _collection_date_pattern
+
+
+def predict_years(extract_series):
+    """
+    predict_year() of collection_date_year(), on a Series of the extracted strings
+    :param extract_series: e.g. "2019", "19", " 2019 "
+    :return: float Series of the 4 digit year, NaN where there is none
+    """
+    extract_series = extract_series.astype(object).where(extract_series.notna(), "").astype(str)
+    is_digit = extract_series.str.isdigit()
+    trailing_digits = extract_series.str.strip().str.extract(r"([0-9]+)$", expand = False)
+    digits = extract_series.where(is_digit, trailing_digits)
+    value = pd.to_numeric(digits, errors = 'coerce').astype(float)
+    # 2 digit years, N.B. as that adds '20' to the string, a single digit 5 becomes 205
+    two_digit_year = np.where(value >= 10, 2000 + value, 200 + value)
+    year = np.select([value >= 100, value > 50, value >= 0], [np.where(value > _max_year, np.nan, value),
+                                                             1900 + value, two_digit_year], default = np.nan)
+    return pd.Series(year, index = extract_series.index)
+
+
+def parse_collection_dates(raw_values):
+    """
+    :param raw_values: Series of distinct raw collection_date strings
+    :return: float Series of the collection year, NaN where there is none
+    """
+    raw_values = raw_values.astype(object).where(raw_values.notna(), "").astype(str)
+    groups = raw_values.str.extract(get_collection_date_pattern())
+    extract_series = pd.Series(np.nan, index = raw_values.index, dtype = object)
+    for rule in ['year', 'year_first', 'slash_year', 'year_last', 'two_digit_last']:
+        extract_series = extract_series.fillna(groups[rule])
+    # as collection_date_year() these use the third "." field, and the first " [12=]nnn " respectively
+    is_dot_date = groups['dot_date'].notna()
+    extract_series[is_dot_date] = raw_values[is_dot_date].str.split(".").str[2]
+    is_spaced_year = groups['spaced_year'].notna()
+    extract_series[is_spaced_year] = raw_values[is_spaced_year].str.extract(r"( [12=][0-9]{3} )", expand = False)
+    # missing, day_month_name and no match at all have no year
+    return predict_years(extract_series)
+
+
+class CollectionDateNormaliser:
+    """
+    the memo table of the collection year of each distinct raw collection_date
+    """
+
+    def __init__(self):
+        self.year_by_raw = pd.Series(dtype = float)
+        self._lock = threading.Lock()
+
+    def get_collection_years(self, series):
+        """
+        :param series: the raw collection_date column
+        :return: Int64 Series of the collection year, with the series index
+        """
+        series = series.astype(object).where(series.notna(), "")
+        (codes, uniques) = pd.factorize(series)
+        uniques = pd.Index(uniques, dtype = object)
+        with self._lock:
+            new_raw_values = uniques[~uniques.isin(self.year_by_raw.index)]
+            if len(new_raw_values) > 0:
+                new_years = parse_collection_dates(pd.Series(new_raw_values, index = new_raw_values, dtype = object))
+                self.year_by_raw = pd.concat([self.year_by_raw, new_years])
+                logger.debug(f"parsed {len(new_raw_values)} new distinct collection_date values, "
+                             f"{len(self.year_by_raw)} in the memo table")
+            distinct_years = self.year_by_raw.reindex(uniques).to_numpy()
+        return pd.Series(distinct_years[codes], index = series.index).astype('Int64')
+
+
+_normaliser = None
+_normaliser_lock = threading.Lock()
+
+
+def get_collection_date_normaliser():
+    """
+    lazily creates the shared normaliser, so the memo table is kept between calls
+    :return: CollectionDateNormaliser
+    """
+    global _normaliser
+    if _normaliser is None:
+        with _normaliser_lock:
+            if _normaliser is None:
+                _normaliser = CollectionDateNormaliser()
+    return _normaliser
+
+
+def get_collection_year_bins(year_series):
+    """
+    the same bins as create_year_bins()
+    :param year_series: Int64 Series of years
+    :return: object Series of e.g. "1950-pre", "1955-1960", ... "2020-2025", None where there is no year or it is
+             after the last bin
+    """
+    labels = ["1950-pre"] + [f"{edge}-{edge + 5}" for edge in _year_bin_edges[1:]]
+    year_bins = pd.cut(year_series.astype(float), bins = [-np.inf] + _year_bin_edges, labels = labels, right = True)
+    return year_bins.astype(object).where(year_bins.notna(), None)
+
+
+def main():
+    raw_dates = pd.Series(["2019-05-01", "12/03/19", "missing", "1.2.2001", "circa 1999 or so", "85", ""])
+    years = get_collection_date_normaliser().get_collection_years(raw_dates)
+    print(pd.DataFrame({'collection_date': raw_dates, 'collection_year': years,
+                        'collection_year_bin': get_collection_year_bins(years)}))
+
+
+if __name__ == '__main__':
+    main()
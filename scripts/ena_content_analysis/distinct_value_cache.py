@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Script of distinct_value_cache.py is to run an expensive per value function once per distinct value of a column
+
+The column is factorized, the function is only run on the distinct values that are not already in the cache,
+and the results are broadcast back onto the rows. The cache can be persisted to a pickle, so e.g. a study
+description is not re-parsed on later runs. It is keyed on a 16 byte hash of each value, so the pickle does not
+hold the (possibly long) values themselves, and it is only reused if its version is the same, i.e. bump the
+version whenever the function's rules change.
+
+usage:
+    barcoding_gene_cache = DistinctValueCache(get_barcoding_genes, "barcoding_genes_cache.pickle", version = "1")
+    df["target_gene_clean_set"] = barcoding_gene_cache.map_series(df["target_gene"])
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x distinct_value_cache.py
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+def get_value_key(value):
+    """
+    :param value: a string
+    :return: 16 byte hash of it
+    """
+    return hashlib.blake2b(value.encode("utf-8", "surrogatepass"), digest_size = 16).digest()
+
+
+class DistinctValueCache:
+    """
+    memo of function(value) by value, optionally persisted to cache_file
+    N.B. the rows with the same value share the one result, so do not change them in place
+    """
+
+    def __init__(self, function, cache_file=None, version=""):
+        """
+        :param function: of one string value
+        :param cache_file: pickle to load from and save to, None for in memory only
+        :param version: the cache_file is ignored if it was saved with another version
+        """
+        self.function = function
+        self.cache_file = cache_file
+        self.version = version
+        self.result_by_key = {}
+        self._lock = threading.Lock()
+        self._unsaved_total = 0
+        self.load()
+
+    def load(self):
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "rb") as f:
+                cache = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as err:
+            logger.warning(f"could not read {self.cache_file}, so starting afresh: {err}")
+            return
+        if cache.get('version') != self.version:
+            logger.info(f"{self.cache_file} is version {cache.get('version')} not {self.version}, so starting afresh")
+            return
+        self.result_by_key.update(cache['results'])
+        logger.info(f"loaded {len(cache['results'])} cached results from {self.cache_file}")
+
+    def save(self):
+        """
+        written to a temporary file and then renamed, so an interrupted save does not lose the old cache
+        """
+        if self.cache_file is None:
+            return
+        with self._lock:
+            tmp_file = self.cache_file + ".tmp"
+            with open(tmp_file, "wb") as f:
+                pickle.dump({'version': self.version, 'results': self.result_by_key}, f,
+                            protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.cache_file)
+            self._unsaved_total = 0
+        logger.info(f"saved {len(self.result_by_key)} cached results to {self.cache_file}")
+
+    def get(self, value):
+        """
+        :param value: a string, anything else is None
+        :return: function(value)
+        """
+        if not isinstance(value, str):
+            return None
+        key = get_value_key(value)
+        if key not in self.result_by_key:
+            result = self.function(value)
+            with self._lock:
+                self.result_by_key[key] = result
+                self._unsaved_total += 1
+        return self.result_by_key[key]
+
+    def map_series(self, series, save=True):
+        """
+        :param series: pandas Series of strings
+        :param save: save the cache_file if there are new results
+        :return: object Series of function(value), with the series index
+        """
+        (codes, uniques) = pd.factorize(series, use_na_sentinel = False)
+        distinct_results = np.empty(len(uniques), dtype = object)
+        for position, value in enumerate(uniques):   # one by one, so numpy does not unpack list results
+            distinct_results[position] = self.get(value)
+        logger.debug(f"map_series {len(series)} rows, {len(uniques)} distinct values, "
+                     f"{self._unsaved_total} new results")
+        if save and self._unsaved_total > 0:
+            self.save()
+        return pd.Series(distinct_results[codes], index = series.index, dtype = object)
+
+
+def main():
+    cache = DistinctValueCache(str.upper)
+    print(cache.map_series(pd.Series(["16S rRNA", "COI", "16S rRNA", None])))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,9 +16,13 @@ import plotly.graph_objects as go
 from collections import Counter
 import pprint
 import plotly.express as px
+import os
 import sys
 import time
-import requests
+# the one shared pooled ENA/EBI HTTP session, ena_http_session.py, is in scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ena_http_session import http_get
+from portal_api_metrics import get_portal_metrics
 
 logger = logging.getLogger(name = 'mylogger')
 
@@ -118,6 +122,27 @@ def obj_print_and_display_md(obj,base_file_name):
     with open(outfile, "w") as f:
         f.write(obj.to_csv(sep="\t"))
 
+def flag_property(bit, on_set=None):
+    """
+    a boolean attribute packed into a bit of self._flags, for the classes with __slots__
+    usage (in the class body):
+        isMarine = flag_property(1 << 1)
+    :param bit: e.g. 1 << 3
+    :param on_set: optional function of no arguments, called after each set e.g. to invalidate a cache
+    :return: property
+    """
+    def getter(self):
+        return bool(self._flags & bit)
+
+    def setter(self, value):
+        if value:
+            self._flags |= bit
+        else:
+            self._flags &= ~bit
+        if on_set is not None:
+            on_set()
+    return property(getter, setter)
+
 def pickle_data_structure(data_structure, filename):
     try:
         with open(filename, "wb") as f:
@@ -155,10 +180,12 @@ def run_webservice(url):
     :param url:
     :return:
     """
-    r = requests.get(url)
+    r = http_get(url)
     logger.info(url)
+    if get_portal_metrics() is not None:
+        get_portal_metrics().record_response(url, r)
 
-    run_web_requests(url)
+    return run_web_requests(r)
 
 def run_webservice_with_params(base_url,params):
     """
@@ -175,7 +202,9 @@ def run_webservice_with_params(base_url,params):
     # logger.info(f"base_url={base_url}")
     # logger.info(f"params={params}")
 
-    response = requests.get(base_url, params=params)
+    response = http_get(base_url, params=params)
+    if get_portal_metrics() is not None:
+        get_portal_metrics().record_response(base_url, response, result_type = params.get("result", "") if isinstance(params, dict) else "")
     return run_web_requests(response)
 
 
@@ -10,16 +10,23 @@ chmod a+x ena_api_calls.py
 import json
 import sys
 from eDNA_utilities import logging, run_webservice_with_params
+from ena_portal_api import ena_portal_api_stream, get_ena_portal_url
 import coloredlogs
 logger = logging.getLogger(name = 'mylogger')
 
+def get_environment_ena_checklists():
+    """
+    :return: list of the environmental checklists
+    """
+    return ["ERC000012", "ERC000013", "ERC000020", "ERC000021", "ERC000022", "ERC000023", "ERC000024",
+            "ERC000025", "ERC000027", "ERC000055", "ERC000030", "ERC000031", "ERC000036", "ERC000040"]
+
 def get_environment_ena_checklist_query():
     """
     Construct the checklist query part for the environmental checklists
     :return: string
     """
-    checklists = ["ERC000012", "ERC000013", "ERC000020", "ERC000021", "ERC000022", "ERC000023", "ERC000024",
-                  "ERC000025", "ERC000027", "ERC000055", "ERC000030", "ERC000031", "ERC000036", "ERC000040"]
+    checklists = get_environment_ena_checklists()
     checklist_query = " OR ".join([f'CHECKLIST="{checklist}"' for checklist in checklists])
     return checklist_query
 
@@ -54,7 +61,8 @@ def environment_fields_to_retrieve():
         "sample_accession", "run_accession", "library_strategy", "library_source",
         "instrument_platform", "lat", "lon", "country", "broad_scale_environmental_context", "environmental_medium",
         "tax_id", "checklist", "collection_date", "ncbi_reporting_standard",
-        "target_gene", "tag", "study_accession", "study_title", "sample_collection"
+        "target_gene", "tag", "study_accession", "study_title", "sample_collection",
+        "first_public", "last_updated"
     ]
     # other fields that Elianne wanted, but not in 'https://www.ebi.ac.uk/ena/portal/api/returnFields?result=read_run'
     # samp_mat_process
@@ -65,11 +73,13 @@ def environment_fields_to_retrieve():
 
     return fields
 
-def get_all_environment_params(checklist_type, limit):
+def get_all_environment_params(checklist_type, limit, updated_since=None, window_query=None):
     """
     getting all the environment params
     :param checklist_type:
     :param limit:
+    :param updated_since: YYYY-MM-DD, if given only the records with last_updated on or after it
+    :param window_query: extra clause ANDed on, e.g. one window of readrun_windows.plan_readrun_windows()
     :return: params
     """
 
@@ -84,6 +94,10 @@ def get_all_environment_params(checklist_type, limit):
 
     # Combine the full query
     query = f"(environmental_sample=true OR ({checklist_query}) OR ({reporting_query})) AND not_tax_tree(9606)"
+    if updated_since:
+        query += f" AND last_updated>={updated_since}"
+    if window_query:
+        query += f" AND ({window_query})"
     fields = environment_fields_to_retrieve()
 
     # Encode query parameters
@@ -97,27 +111,40 @@ def get_all_environment_params(checklist_type, limit):
     return params
 
 def get_base_ena_search_url():
-    return "https://www.ebi.ac.uk/ena/portal/api/search"
+    return get_ena_portal_url() + "search"
 
-def setup_run_api_call(checklist_type, limit):
+def setup_run_api_batches(checklist_type, limit, batch_size=10000, updated_since=None, window_query=None):
     """
-    setup and run ena api
+    streaming version of setup_run_api_call, the records are parsed as they come in
+    so peak memory depends on the batch_size and not on the size of the archive.
+    usage:
+        for record_batch in setup_run_api_batches("environmental_checklists", 0):
     :param checklist_type:
     :param limit:
-    :return: API call output
+    :param batch_size: records per batch
+    :param updated_since: see get_all_environment_params()
+    :param window_query: see get_all_environment_params()
+    :return: generator of record lists
     """
-
     base_url = get_base_ena_search_url()
-
-    params = get_all_environment_params(checklist_type, limit)
-    limit = params["limit"]
+    params = get_all_environment_params(checklist_type, limit, updated_since, window_query)
     logger.info(f"base_url={base_url}")
     logger.info(f"params={params}")
+    return ena_portal_api_stream(base_url, params, batch_size = batch_size)
 
-    out = run_webservice_with_params(base_url, params)
-    if 0 < limit < 1000:
-        logger.info(f"out={out}")
-    output = json.loads(out)
+def setup_run_api_call(checklist_type, limit, updated_since=None):
+    """
+    setup and run ena api
+    N.B. is built from the streamed batches, so never holds the raw response text as well as the records
+    :param checklist_type:
+    :param limit:
+    :param updated_since: see get_all_environment_params()
+    :return: API call output
+    """
+
+    output = []
+    for record_batch in setup_run_api_batches(checklist_type, limit, updated_since = updated_since):
+        output.extend(record_batch)
 
     if 0 < limit < 1000:
         logger.info(output)
@@ -8,15 +8,47 @@ chmod a+x ena_portal_api.py
 """
 
 import pandas as pd
-import requests
 import json
+import codecs
+import os
 import sys
-from itertools import islice
+import threading
+from itertools import chain, islice
 import time
+from collections import deque
+from urllib.parse import quote_plus
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.exceptions import Timeout, ConnectionError as RequestsConnectionError
 from eDNA_utilities import logger
+# the one shared pooled ENA/EBI HTTP session, ena_http_session.py, is in scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ena_http_session import http_get, http_post
+from portal_response_cache import get_portal_cache, CachedResponse
+from portal_api_metrics import get_portal_metrics
+from adaptive_chunking import AdaptiveChunkController, IncompleteChunkedCallError, is_retryable_failure, \
+    is_too_large_failure, split_chunk, carve_chunks, checkpoint_failed_chunk, load_failed_chunks, \
+    get_default_checkpoint_file
+
+_portal_url_settings = {
+    # e.g. export ENA_PORTAL_API_URL=http://127.0.0.1:8765/ena/portal/api/ to use the portal_api_stand_in
+    "url": os.environ.get("ENA_PORTAL_API_URL", "https://www.ebi.ac.uk/ena/portal/api/")
+}
+
+def configure_portal_url(url=None):
+    """
+    point all the portal API calls somewhere else, e.g. at the local portal_api_stand_in for testing
+    :param url: ending in /api/, None puts back the real ENA portal
+    :return: the url now in use
+    """
+    if url is None:
+        url = "https://www.ebi.ac.uk/ena/portal/api/"
+    if not url.endswith("/"):
+        url += "/"
+    _portal_url_settings["url"] = url
+    return url
 
 def get_ena_portal_url():
-    return "https://www.ebi.ac.uk/ena/portal/api/"
+    return _portal_url_settings["url"]
 
 def ena_portal_api_call_basic(url):
     """
@@ -24,7 +56,9 @@ def ena_portal_api_call_basic(url):
     :param url:
     :return:
     """
-    response = requests.get(url)
+    response = http_get(url)
+    if get_portal_metrics() is not None:
+        get_portal_metrics().record_response(url, response)
     # print(f"content={response.content}")
     # logger.debug(type(response.content))
     # print(f"content={response.text}")
@@ -38,33 +72,66 @@ def ena_portal_api_call_basic(url):
         # logger.debug(response.text)
         data = response.text
     else:
-        logger.debug()
+        logger.debug(response.text)
         print(f"Error: Unable to fetch data for {url} because {response}")
         sys.exit()
     return data, response
 
-def ena_portal_api_call(url, params, result_object_type, query_accession_ids):
+def ena_portal_api_call(url, params, result_object_type, query_accession_ids, attempt=0, chunk_size=1024 * 1024):
     """
     URL API call allowing slightly more complex situations than ena_portal_api_call_basic i.e. using params
+    Successful responses are kept in the portal response cache, so a re-run only goes to the portal for
+    queries that are new or whose cache entry has expired.
+    The body is streamed and a JSON array is parsed record by record as it comes off the socket,
+    see parse_json_text_chunks(), so neither response.content nor response.text is built as well as the records.
+    The request and parse times are recorded in the portal API metrics.
     :param url:
     :param params:
     :param result_object_type:  #don't use it just for debugging
     :param query_accession_ids:  #don't use it just for debugging
+    :param attempt: 0 for the first try, otherwise the retry number, only used for the metrics
+    :param chunk_size: bytes read from the socket at a time
     :return:
     """
-    response = requests.post(url, params)
+    cache = get_portal_cache()
+    cached_text = None
+    if cache is not None:
+        cached_text = cache.get(url, params)
+    if cached_text is not None:
+        response = CachedResponse(url, cached_text)
+    else:
+        response = http_post(url, params, stream = True)
     #logger.debug(url)
     #logger.debug(params)
 
     data = []
-    if response.status_code == 200:  # i.e. ok
-        logger.debug(response.status_code)
-        # Parse the JSON response
-        logger.debug(response)
-        logger.debug(response.text)
+    parse_start_time = time.perf_counter()
+    download_s = 0.0
+    if response.status_code == 200 and cached_text is not None:
         data = json.loads(response.text)
-        logger.debug(data)
-
+    elif response.status_code == 200:  # i.e. ok
+        logger.debug(response.status_code)
+        timing = response.timing
+        text_chunks = iter_response_text(response, chunk_size, timing)
+        body_chunks = []    # only kept for the cache, up to the biggest body it would store
+        if cache is not None:
+            text_chunks = keep_text_chunks(text_chunks, body_chunks, cache.max_entry_bytes)
+        try:
+            data = parse_json_text_chunks(text_chunks)
+        finally:
+            response.close()
+        download_s = timing["download_s"]
+        timing["total_s"] += download_s
+        timing["wire_bytes"] = timing["bytes"]
+        if cache is not None and body_chunks != [None]:
+            cache.put(url, params, "".join(body_chunks))
+        elif cache is not None:
+            logger.debug(f"not caching the response of {url} as it is over {cache.max_entry_bytes} characters")
+    if get_portal_metrics() is not None:
+        parse_s = max(0.0, time.perf_counter() - parse_start_time - download_s)
+        get_portal_metrics().record_response(url, response, parse_s = parse_s,
+                                             retries = attempt, result_type = result_object_type)
+    if response.status_code == 200:
         # check if any hits
         if type(data) is int:
             pass
@@ -76,6 +143,177 @@ def ena_portal_api_call(url, params, result_object_type, query_accession_ids):
             print(f"Error: Unable to fetch data for \"{result_object_type}\" {query_accession_ids} because {response} {response.text}")
     return data, response
 
+def keep_text_chunks(text_chunks, kept_chunks, max_size=None):
+    """
+    passes the text pieces on, appending each to kept_chunks as well e.g. for the cache.
+    Once they add up to more than max_size characters, kept_chunks is set to [None] and nothing more is kept,
+    so that no more than max_size is held on to for a body too big to be cached anyway
+    """
+    kept_size = 0
+    for text_chunk in text_chunks:
+        if kept_size is not None:
+            kept_size += len(text_chunk)
+            if max_size is not None and kept_size > max_size:
+                kept_chunks[:] = [None]
+                kept_size = None
+            else:
+                kept_chunks.append(text_chunk)
+        yield text_chunk
+
+def parse_json_text_chunks(text_chunks):
+    """
+    parses a JSON body as it arrives: an array (i.e. a search) record by record with iter_json_array_records(),
+    anything else e.g. a count, which is small, in one go
+    :param text_chunks: iterable of str pieces of the JSON text, split anywhere
+    :return: the parsed JSON
+    """
+    text_chunks = iter(text_chunks)
+    first_chunk = ""
+    for first_chunk in text_chunks:
+        if first_chunk.strip() != "":
+            break
+    if first_chunk.lstrip().startswith("["):
+        return list(iter_json_array_records(chain([first_chunk], text_chunks)))
+    return json.loads(first_chunk + "".join(text_chunks))
+
+def iter_json_array_records(text_chunks):
+    """
+    incrementally parses a JSON array of records e.g. [{...}, {...}] as the text arrives,
+    so neither the whole text nor the whole list of dicts need to be in memory
+    :param text_chunks: iterable of str pieces of the JSON text, split anywhere
+    :return: generator of records (dicts)
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    for text_chunk in text_chunks:
+        buffer += text_chunk
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"expected a JSON array, but got -->{buffer[pos:pos + 50]}<--")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                record, pos_end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # i.e. the record is not all here yet
+            yield record
+            pos = pos_end
+        buffer = buffer[pos:]
+    if buffer.strip() != "":
+        raise ValueError(f"JSON array was truncated at -->{buffer[0:50]}<--")
+
+def iter_tsv_records(lines):
+    """
+    parses TSV lines into records, the first line being the header
+    :param lines: iterable of str lines
+    :return: generator of records (dicts)
+    """
+    header = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if header is None:
+            header = line.split("\t")
+        elif line != "":
+            yield dict(zip(header, line.split("\t")))
+
+def iter_text_lines(text_chunks):
+    """
+    re-joins text pieces, split anywhere, into whole lines
+    :param text_chunks: iterable of str
+    :return: generator of lines (without the line ending)
+    """
+    remainder = ""
+    for text_chunk in text_chunks:
+        lines = (remainder + text_chunk).split("\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder != "":
+        yield remainder
+
+def iter_record_batches(records, batch_size):
+    """
+    :param records: iterable of records
+    :param batch_size:
+    :return: generator of lists of up to batch_size records
+    """
+    iterator = iter(records)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def iter_response_text(response, chunk_size, timing=None):
+    """
+    decodes the streamed body bit by bit, coping with multi-byte characters split across the chunks
+    :param response: streamed response
+    :param chunk_size:
+    :param timing: if a dict, the seconds spent waiting on the socket and the bytes are added to download_s and bytes
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    byte_chunks = response.iter_content(chunk_size = chunk_size)
+    while True:
+        read_start_time = time.perf_counter()
+        byte_chunk = next(byte_chunks, None)
+        if timing is not None:
+            timing["download_s"] += time.perf_counter() - read_start_time
+        if byte_chunk is None:
+            break
+        if timing is not None:
+            timing["bytes"] += len(byte_chunk)
+        yield decoder.decode(byte_chunk)
+    yield decoder.decode(b"", final = True)
+
+def ena_portal_api_stream(url, params, batch_size=10000, chunk_size=1024 * 1024):
+    """
+    Streaming version of ena_portal_api_call, for the very big searches e.g. with limit=0
+    The records are parsed as they come off the socket, so peak memory depends on batch_size not the result size.
+    Copes with format=json or format=tsv
+    usage:
+        for batch in ena_portal_api_stream(url, params, batch_size=5000):
+            do_something(batch)
+    :param url:
+    :param params:
+    :param batch_size: number of records per batch yielded
+    :param chunk_size: bytes read from the socket at a time
+    :return: generator of lists of records (dicts)
+    """
+    response = http_post(url, params, stream = True)
+    if response.status_code != 200:
+        logger.error(f"Error: Unable to stream data for {url} {params} because {response} {response.text}")
+        response.close()
+        sys.exit(1)
+    timing = response.timing
+    stream_start_time = time.perf_counter()
+    consumer_s = 0.0    # time the caller spent on each batch, which is neither download nor parse
+    try:
+        if params.get("format", "json") == "tsv":
+            records = iter_tsv_records(iter_text_lines(iter_response_text(response, chunk_size, timing)))
+        else:
+            records = iter_json_array_records(iter_response_text(response, chunk_size, timing))
+        record_total = 0
+        for batch in iter_record_batches(records, batch_size):
+            record_total += len(batch)
+            logger.debug(f"streamed {record_total} records so far from {url}")
+            yield_start_time = time.perf_counter()
+            yield batch
+            consumer_s += time.perf_counter() - yield_start_time
+    finally:
+        response.close()
+        if get_portal_metrics() is not None:
+            parse_s = max(0.0, time.perf_counter() - stream_start_time - consumer_s - timing["download_s"])
+            timing["total_s"] += timing["download_s"]
+            timing["wire_bytes"] = timing["bytes"]
+            get_portal_metrics().record_response(url, response, parse_s = parse_s,
+                                                 result_type = params.get("result", ""))
+
 def urldata2id_set(data, id_col_pos):
         """
         e.g. my_set = urldata2id_set(data,1)  where id_col_pos is indexed from 0
@@ -90,15 +328,149 @@ def urldata2id_set(data, id_col_pos):
                 my_set.add(cols[id_col_pos])
             line_count += 1
         return my_set
-def chunk_portal_api_call(url, with_obj_type, return_fields, include_accession_type, id_list):
+def get_default_max_workers():
+    """
+    default number of chunks fetched concurrently by chunk_portal_api_call,
+    kept small so as to be polite to the portal API
+    :return: int
+    """
+    return 4
+
+def get_default_max_retries():
+    return 5
+
+def fetch_chunk_once(url, params, with_obj_type, chunk, controller, attempt):
+    """
+    a single try at one chunk of a chunked portal API call, after a jittered backoff if it is a retry
+    N.B. is run from a thread pool by run_adaptive_chunks
+    :param url:
+    :param params:
+    :param with_obj_type:
+    :param chunk: list of the ids in this chunk
+    :param controller: AdaptiveChunkController, for the backoff
+    :param attempt: 0 for the first try
+    :return: (data, status, latency, from_cache)  status is the http status code or "timeout"/"connection_error"
+    """
+    if attempt > 0:
+        doze_time = controller.get_backoff_seconds(attempt)
+        logger.info(f"retry {attempt} of a chunk of {len(chunk)} for obj_type={with_obj_type}, after a little doze of {doze_time:.1f} seconds")
+        time.sleep(doze_time)
+    logger.debug(f"{url}, {params}, {with_obj_type}, {params['fields']}")
+    logger.debug(f"chunked_id_list_size={len(chunk)}")
+    start_time = time.perf_counter()
+    try:
+        (data, response) = ena_portal_api_call(url, params, with_obj_type, chunk, attempt)
+    except (Timeout, RequestsConnectionError) as err:
+        status = "timeout" if isinstance(err, Timeout) else "connection_error"
+        latency = time.perf_counter() - start_time
+        if get_portal_metrics() is not None:
+            get_portal_metrics().record_request(url, status, {"total_s": latency}, retries = attempt,
+                                                result_type = with_obj_type)
+        return None, status, latency, False
+    return data, response.status_code, time.perf_counter() - start_time, getattr(response, "from_cache", False)
+
+def run_adaptive_chunks(id_list, make_request, with_obj_type, controller, max_workers, checkpoint_file, max_retries):
+    """
+    the engine for the chunked portal API calls.
+    The ids are cut into chunks on a grid of controller.chunk_size ids, grown or halved on it by the controller,
+    see carve_chunks(), so the same id_list gives the same requests, and so portal response cache hits, on a re-run.
+    The controller also tunes how many chunks are in flight at once, up to max_workers, and the backoff.
+    A chunk that was too large (413/414) or timed out is split in half, see split_chunk(), its halves taking its place;
+    a 413/414 is not resent unchanged. A chunk that fails with a 5xx is re-queued whole, after a backoff.
+    Chunks that have used up their retries, or are a single id that is still too large, are checkpointed.
+    The results are keyed on the offset of each chunk, so are combined in id_list order whatever order they finish in.
+    :param id_list:
+    :param make_request: function(chunk) returning (url, params) for a chunk
+    :param with_obj_type:
+    :param controller: AdaptiveChunkController
+    :param max_workers: most chunks to fetch at once
+    :param checkpoint_file: where the chunks that could not be fetched are appended
+    :param max_retries: per chunk
+    :return: (combined_data, failed_chunks) failed_chunks being the list of the id lists that could not be fetched
+    """
+    list_size = len(id_list)
+    next_pos = 0
+    retry_queue = deque()    # (offset, chunk, attempt)
+    carved_queue = deque()   # (offset, chunk, attempt) of the block carved last
+    results = {}
+    failed_chunks = []
+    chunk_count = 0
+    controller.set_max_concurrency(max_workers)
+
+    def has_work():
+        return retry_queue or carved_queue or next_pos < list_size
+
+    def next_work():
+        nonlocal next_pos
+        if retry_queue:
+            return retry_queue.popleft()
+        if not carved_queue:
+            pieces = carve_chunks(id_list, next_pos, controller.chunk_size, controller.get_level())
+            carved_queue.extend((offset, chunk, 0) for (offset, chunk) in pieces)
+            next_pos = pieces[-1][0] + len(pieces[-1][1])
+        return carved_queue.popleft()
+
+    with ThreadPoolExecutor(max_workers = max(1, max_workers)) as executor:
+        in_flight = {}
+        while in_flight or has_work():
+            while len(in_flight) < controller.get_concurrency() and has_work():
+                (offset, chunk, attempt) = next_work()
+                (url, params) = make_request(chunk)
+                future = executor.submit(fetch_chunk_once, url, params, with_obj_type, chunk, controller, attempt)
+                in_flight[future] = (offset, chunk, attempt, url, params)
+            done, not_done = wait(in_flight, return_when = FIRST_COMPLETED)
+            for future in done:
+                (offset, chunk, attempt, url, params) = in_flight.pop(future)
+                (data, status, latency, from_cache) = future.result()
+                if status == 200:
+                    if not from_cache:   # a cache hit says nothing about the server
+                        controller.record_success(latency)
+                    results[offset] = data
+                    chunk_count += 1
+                    if chunk_count % 50 == 0:  # only print progress every X chunks
+                        logger.debug(f"{next_pos}/{list_size} with {controller.print_summary()}")
+                    continue
+                concurrency = controller.record_failure(status)
+                if is_too_large_failure(status) and len(chunk) > 1 and (status != "timeout" or attempt < max_retries):
+                    halves = split_chunk(offset, chunk)
+                    logger.warning(f"Due to response {status} for a chunk of {len(chunk)}, splitting it into "
+                                   f"{len(halves[0][1])} and {len(halves[1][1])}")
+                    next_attempt = attempt + 1 if status == "timeout" else attempt   # i.e. only the timeout is a retry
+                    retry_queue.extendleft((half_offset, half, next_attempt) for (half_offset, half) in halves[::-1])
+                elif is_retryable_failure(status) and attempt < max_retries:
+                    logger.warning(f"Due to response {status} for a chunk of {len(chunk)}, re-queuing it with a concurrency of {concurrency}")
+                    retry_queue.append((offset, chunk, attempt + 1))
+                else:
+                    logger.error(f"Due to response {status}, giving up on a chunk of {len(chunk)} for {url} after {attempt + 1} tries, it is checkpointed to {checkpoint_file}")
+                    checkpoint_failed_chunk(checkpoint_file, url, params, with_obj_type, chunk, status)
+                    failed_chunks.append(chunk)
+
+    combined_data = []
+    for offset in sorted(results):
+        combined_data += results[offset]
+    return combined_data, failed_chunks
+
+def chunk_portal_api_call(url, with_obj_type, return_fields, include_accession_type, id_list, max_workers=None,
+                          chunk_controller=None, checkpoint_file=None, max_retries=None):
     """
     useful for when there could be a long list of ids, that needs to be chunked to not exceed limits.
     N.B. will need to gradually port the other list chunking methods to here!
     passing a URL with a few specific params is critical, as otherwise too much complexity for this
+    The chunks are fetched concurrently by a bounded thread pool, but the results are combined in id_list order,
+    so the output is the same as doing them one after another.
+    The chunks start at 400 ids, on a grid of 400 so they are the same, and hit the cache, on a re-run; their size
+    and the number in flight adapt, halved on 5xx/413/414/timeouts and raised again while the server is responding
+    quickly, see run_adaptive_chunks().
+    Chunks that still fail after max_retries are appended to checkpoint_file, see retry_checkpointed_chunks(),
+    and then IncompleteChunkedCallError is raised, with the data of the chunks that were fetched
     :param with_obj_type:
     :parma include_accession_type:  # will only sometimes apply if not will be "none:
     :param id_list:
     :param return_fields:   # is a list
+    :param max_workers: number of chunks to fetch at once, None uses get_default_max_workers(), 1 is sequential
+    :param chunk_controller: AdaptiveChunkController, None for the default
+    :param checkpoint_file: None uses get_default_checkpoint_file()
+    :param max_retries: per chunk, None uses get_default_max_retries()
     :return: data (as JSON)
 
     e.g. https://www.ebi.ac.uk/ena/portal/api/search?, {'result': 'read_run', 'includeAccessions': 'SAMD00099297,SAMD00099298,SAMD00099299,SAMD00099303,SAMD00099304,SAMD00099305,SAMD00099306,SAMD00099308,SAMD00099314,SAMD00099317', 'format': 'json', 'fields': 'run_accession,sample_accession', 'limit': 0, 'include_accession_type': 'sample_accession'}, read_run, run_accession,sample_accession
@@ -107,17 +479,21 @@ def chunk_portal_api_call(url, with_obj_type, return_fields, include_accession_t
 
     logger.debug(id_list)
     #print(f"url={url}\n, ob_type={with_obj_type}\n, rtn_fields={return_fields}\n, id_list len={len(id_list)}\n")
-    combined_data = []
-    chunk_count = chunk_pos = 0
-    list_size = len(id_list)
-    iterator = iter(id_list)
-    chunk_size = 400  # 400 about the maximum reliable chunk size for including accessions
-    logger.debug(f"{chunk_pos}/{list_size}")
-    while chunk := list(islice(iterator, chunk_size)):
-        chunk_pos += chunk_size
-        chunk_count += 1
-        if chunk_count % 50 == 0:   #only print progress every X chunks
-            logger.debug(f"{chunk_pos}/{list_size} in chunk_portal_api_call()")
+    if max_workers is None:
+        max_workers = get_default_max_workers()
+    if chunk_controller is None:
+        # 400 was about the maximum reliable chunk size for including accessions
+        chunk_controller = AdaptiveChunkController(400)
+    if checkpoint_file is None:
+        checkpoint_file = get_default_checkpoint_file()
+    if max_retries is None:
+        max_retries = get_default_max_retries()
+    if isinstance(id_list, (set, frozenset)):
+        id_list = sorted(id_list)  # a stable order gives the same chunks, and so cache hits, on a re-run
+    else:
+        id_list = list(id_list)
+
+    def make_request(chunk):
         logger.debug(chunk[0:3])
         params = {
                 "result": with_obj_type,
@@ -128,77 +504,238 @@ def chunk_portal_api_call(url, with_obj_type, return_fields, include_accession_t
             }
         if include_accession_type != None:
             params["include_accession_type"] = include_accession_type
-        logger.debug(f"{url}, {params}, {with_obj_type}, {','.join(return_fields)}")
-        logger.debug("****************************************************************************************")
-        logger.debug(f"chunked_id_list_size={len(chunk)}")
-        (data, response) = ena_portal_api_call(url, params, with_obj_type, chunk)
-        logger.debug(f"data={data}")
-
-        if response.status_code != 200:
-            doze_time = 10
-            logger.error(
-                f"Due to response {response.status_code}, having another try for {url} and obj_type={with_obj_type} with {params}, after a little doze of {doze_time} seconds")
-            time.sleep(doze_time)
-            (data, response) = ena_portal_api_call(url, params, with_obj_type, id_list)
-            if response.status_code != 200:
-                logger.error(f"Due to response exiting {response.status_code}, tried twice")
-                sys.exit()
-        combined_data += data
+        return url, params
+
+    logger.debug(f"0/{len(id_list)} with max_workers={max_workers}")
+    (combined_data, failed_chunks) = run_adaptive_chunks(id_list, make_request, with_obj_type, chunk_controller,
+                                                         max_workers, checkpoint_file, max_retries)
     logger.debug(combined_data)
+    logger.debug(chunk_controller.print_summary())
+    if get_portal_cache() is not None:
+        logger.debug(get_portal_cache().print_summary())
+    if len(failed_chunks) > 0:
+        logger.error(f"{len(failed_chunks)} chunks could not be fetched, see {checkpoint_file}")
+        raise IncompleteChunkedCallError(combined_data, failed_chunks, checkpoint_file)
     return combined_data
 
-def chunk_portal_api_call_w_ands(url, with_obj_type, return_fields, and_accession, id_list):
+def get_default_query_byte_budget():
+    """
+    a conservative size of form encoded query= to send in one POST, well under what web servers reject,
+    used unless a byte budget is configured or probing is switched on
+    :return: int
+    """
+    return 64 * 1024
+
+_query_byte_budget_settings = {
+    # e.g. export ENA_PORTAL_QUERY_BYTE_BUDGET=131072 to use a bigger constant
+    "byte_budget": int(os.environ.get("ENA_PORTAL_QUERY_BYTE_BUDGET", 0)) or get_default_query_byte_budget(),
+    # e.g. export ENA_PORTAL_QUERY_BYTE_BUDGET_PROBE=1 to measure it on the portal instead, see probe_query_byte_budget()
+    "probe": os.environ.get("ENA_PORTAL_QUERY_BYTE_BUDGET_PROBE", "") == "1",
+    "probe_start_bytes": 16 * 1024,
+    "probe_max_bytes": 1024 * 1024
+}
+_probed_byte_budgets = {}    # count url: bytes, i.e. probed once per portal per session
+_probed_byte_budgets_lock = threading.Lock()
+
+def configure_query_byte_budget(byte_budget=None, probe=None, probe_start_bytes=None, probe_max_bytes=None):
+    """
+    e.g. configure_query_byte_budget(probe=True) to measure the byte budget of the portal rather than use the constant
+    :param byte_budget: bytes of form encoded query= value to send in one POST, when not probing
+    :param probe: True to probe the portal, once per session, False for the byte_budget constant
+    :param probe_start_bytes: size of the first probe query
+    :param probe_max_bytes: the probe stops growing the query here
+    :return: the settings dict
+    """
+    if byte_budget is not None:
+        _query_byte_budget_settings["byte_budget"] = byte_budget
+    if probe is not None:
+        _query_byte_budget_settings["probe"] = probe
+    if probe_start_bytes is not None:
+        _query_byte_budget_settings["probe_start_bytes"] = probe_start_bytes
+    if probe_max_bytes is not None:
+        _query_byte_budget_settings["probe_max_bytes"] = probe_max_bytes
+    with _probed_byte_budgets_lock:
+        _probed_byte_budgets.clear()
+    return _query_byte_budget_settings
+
+def get_count_url(url):
+    """
+    :param url: e.g. https://www.ebi.ac.uk/ena/portal/api/search?
+    :return: e.g. https://www.ebi.ac.uk/ena/portal/api/count
+    """
+    return url.split("?")[0].rstrip("/").rsplit("/", 1)[0] + "/count"
+
+def probe_query_byte_budget(url, with_obj_type, field, value):
+    """
+    measures the most bytes of form encoded query= the portal takes in one POST. Count queries of
+    field="value" OR ... clauses are sent, doubling in size from probe_start_bytes until one is rejected
+    (413, 414 or 400) or probe_max_bytes is reached, or halving if the first is rejected.
+    N.B. these are real requests of up to probe_max_bytes, so it is only done if switched on, see
+    configure_query_byte_budget()
+    :param url: the search url, the probes go to the count endpoint next to it
+    :param with_obj_type:
+    :param field: e.g. 'study_accession'
+    :param value: e.g. the longest of the accessions to be packed
+    :return: int, the biggest query accepted less a tenth of head room for the other params
+    """
+    count_url = get_count_url(url)
+    clause_bytes = len(quote_plus(f'{field}="{value}" OR '))
+    probe_bytes = _query_byte_budget_settings["probe_start_bytes"]
+    (accepted_bytes, rejected_bytes) = (0, None)
+    while clause_bytes <= probe_bytes <= _query_byte_budget_settings["probe_max_bytes"]:
+        query = make_or_query(field, [value] * (probe_bytes // clause_bytes))
+        try:
+            status = http_post(count_url, {"result": with_obj_type, "query": query}).status_code
+        except (Timeout, RequestsConnectionError) as err:
+            status = "timeout" if isinstance(err, Timeout) else "connection_error"
+        logger.debug(f"query byte budget probe of {len(quote_plus(query))} bytes to {count_url}: {status}")
+        if status == 200:
+            accepted_bytes = len(quote_plus(query))
+            if rejected_bytes is not None:
+                break
+            probe_bytes *= 2
+        elif status in (400, 413, 414):
+            rejected_bytes = probe_bytes
+            if accepted_bytes > 0:
+                break
+            probe_bytes //= 2
+        else:
+            break   # the portal is struggling, which says nothing about the size
+    if accepted_bytes == 0:
+        logger.warning(f"could not measure the query byte budget of {count_url}, so using "
+                       f"{get_default_query_byte_budget()}")
+        return get_default_query_byte_budget()
+    if rejected_bytes is None:
+        reason = f"none up to {_query_byte_budget_settings['probe_max_bytes']} bytes were rejected"
+    else:
+        reason = f"a query of {rejected_bytes} bytes was not"
+    logger.info(f"query byte budget of {count_url} is {accepted_bytes * 9 // 10} bytes, as a query of "
+                f"{accepted_bytes} was accepted and {reason}")
+    return accepted_bytes * 9 // 10
+
+def get_query_byte_budget(url, with_obj_type, field, value):
+    """
+    the configured byte budget, or where probing is switched on the one probed, once per session, for this portal
+    see probe_query_byte_budget() for the params
+    :return: int
+    """
+    if not _query_byte_budget_settings["probe"]:
+        return _query_byte_budget_settings["byte_budget"]
+    count_url = get_count_url(url)
+    with _probed_byte_budgets_lock:
+        if count_url in _probed_byte_budgets:
+            return _probed_byte_budgets[count_url]
+    # probed without the lock, so the other threads are not held up by it, a racing thread's probe is just not kept
+    byte_budget = probe_query_byte_budget(url, with_obj_type, field, value)
+    with _probed_byte_budgets_lock:
+        return _probed_byte_budgets.setdefault(count_url, byte_budget)
+
+def make_or_query(field, values):
+    """
+    e.g. make_or_query('study_accession', ['PRJNA505510', 'PRJEB32543'])
+         'study_accession="PRJNA505510" OR study_accession="PRJEB32543"'
+    :param field:
+    :param values:
+    :return: query string, un-encoded as it is sent as a form
+    """
+    return " OR ".join(f'{field}="{value}"' for value in values)
+
+def pack_or_clauses(field, values, byte_budget):
+    """
+    how many OR clauses can be packed into one query without exceeding the byte budget,
+    sized on the longest value so that every pack fits
+    :param field:
+    :param values:
+    :param byte_budget: bytes of the form encoded query
+    :return: int, at least 1
+    """
+    if len(values) == 0:
+        return 1
+    longest_value = max(values, key = len)
+    clause_bytes = len(quote_plus(f'{field}="{longest_value}" OR '))
+    return max(1, min(len(values), byte_budget // clause_bytes))
+
+def chunk_portal_api_call_w_ands(url, with_obj_type, return_fields, and_accession, id_list, max_workers=None,
+                                 chunk_controller=None, checkpoint_file=None, max_retries=None, byte_budget=None):
     """
     useful for when there could be a long list of ids, that needs to be chunked to not exceed limits.
-    N.B. will need to gradually port the other list chunking methods to here!
-    passing a URL with a few specific params is critical, as otherwise too much complexity for this
+    The ids are packed as and_accession="X" OR ... clauses into the query of a form POST, as many as fit in
+    byte_budget, so e.g. thousands of studies only take a handful of requests.
+    The packs are run concurrently with the same adaptive chunking as chunk_portal_api_call, so also raise
+    IncompleteChunkedCallError if some could not be fetched.
+    :param url: e.g. get_ena_portal_url() + "search?"
     :param with_obj_type:
-    :param id_list:
     :param return_fields:
-    :return:
+    :param and_accession: the field to OR on e.g. 'study_accession'
+    :param id_list:
+    :param max_workers: None uses get_default_max_workers()
+    :param chunk_controller: AdaptiveChunkController, None for the default
+    :param checkpoint_file: None uses get_default_checkpoint_file()
+    :param max_retries: per chunk, None uses get_default_max_retries()
+    :param byte_budget: None uses get_query_byte_budget()
+    :return: data (as JSON)
     """
     logger.debug(f"chunk_portal_api_call_w_ands\nurl={url}\n, ob_type={with_obj_type}\n, rtn_fields={return_fields}\n, id_list len={len(id_list)}\n")
-    combined_data = []
-    chunk_count = chunk_pos = 0
-    list_size = len(id_list)
-    iterator = iter(id_list)
-    chunk_size = 10  # 10 about the maximum reliable chunk size for AND accessions
-    logger.debug(f"{chunk_pos}/{list_size}")
-    pre_url = url  # as need to more to this
-    # https://www.ebi.ac.uk/ena/portal/api/search?study_accession$3DPRJNA435556%20OR%20study_accession%3DPRJEB32543
-    #works curl -s 'https://www.ebi.ac.uk/ena/portal/api/search?result=sample&query=study_accession%3DPRJNA505510%20OR%20study_accession%3DPRJEB32543&fields=sample_accession%2Csample_description%2Cstudy_accession&format=tsv'
-    while chunk := list(islice(iterator, chunk_size)):
-        chunk_pos += chunk_size
-        chunk_count += 1
-        and_accession_string = and_accession + '%3D'
-        join_string = '%20OR%20' + and_accession + '%3D'
-        and_accession_string += join_string.join(chunk)
-        #logger.debug(and_accession_string)
-        url = pre_url + 'query='
-        url += and_accession_string
-        if chunk_count % 10 == 0:   #only print progress every X chunks
-            logger.debug(f"{chunk_pos}/{list_size} in chunk_portal_api_call()")
+    if isinstance(id_list, (set, frozenset)):
+        id_list = sorted(id_list)  # a stable order gives the same packs, and so cache hits, on a re-run
+    else:
+        id_list = list(dict.fromkeys(id_list))  # the duplicates dropped, but in the caller's order
+    if max_workers is None:
+        max_workers = get_default_max_workers()
+    if byte_budget is None and len(id_list) > 0:
+        byte_budget = get_query_byte_budget(url, with_obj_type, and_accession, max(id_list, key = len))
+    if chunk_controller is None:
+        pack_size = pack_or_clauses(and_accession, id_list, byte_budget)
+        chunk_controller = AdaptiveChunkController(pack_size, max_chunk_size = pack_size)   # bigger would not fit
+    if checkpoint_file is None:
+        checkpoint_file = get_default_checkpoint_file()
+    if max_retries is None:
+        max_retries = get_default_max_retries()
+    #works curl -X POST -H "Content-Type: application/x-www-form-urlencoded" -d 'result=sample&query=study_accession%3D%22PRJNA505510%22%20OR%20study_accession%3D%22PRJEB32543%22&fields=sample_accession%2Cstudy_accession&format=tsv' 'https://www.ebi.ac.uk/ena/portal/api/search'
+
+    def make_request(chunk):
         params = {
                 "result": with_obj_type,
+                "query": make_or_query(and_accession, chunk),
                 "format": "json",
                 "fields": ','.join(return_fields),
                 "limit": 0
             }
-        (data, response) = ena_portal_api_call(url, params, with_obj_type, chunk)
-        # print(f"data={data}")
-
-        if response.status_code != 200:
-            doze_time = 10
-            print(
-                f"Due to response {response.status_code}, having another try for {url} and obj_type={with_obj_type} with {params}, after a little doze of {doze_time} seconds")
-            time.sleep(doze_time)
-            (data, response) = ena_portal_api_call(url, params, with_obj_type, id_list)
-            if response.status_code != 200:
-                print(f"Due to response exiting {response.status_code}, tried twice")
-                logger.debug()
-                sys.exit()
-        #print(f"data={data}")
-        combined_data += data
+        return url, params
+
+    logger.debug(f"{len(id_list)} {and_accession} packed {chunk_controller.get_chunk_size()} per query")
+    (combined_data, failed_chunks) = run_adaptive_chunks(id_list, make_request, with_obj_type, chunk_controller,
+                                                         max_workers, checkpoint_file, max_retries)
+    if len(failed_chunks) > 0:
+        logger.error(f"{len(failed_chunks)} chunks could not be fetched, see {checkpoint_file}")
+        raise IncompleteChunkedCallError(combined_data, failed_chunks, checkpoint_file)
+    return combined_data
+
+def retry_checkpointed_chunks(checkpoint_file=None):
+    """
+    have another go at the chunks that were checkpointed by the chunked calls, e.g. once the portal has recovered
+    any that still fail are written back to the checkpoint file
+    :param checkpoint_file: None uses get_default_checkpoint_file()
+    :return: data (as JSON) of those that now worked, N.B. not in the order of the original call
+    """
+    if checkpoint_file is None:
+        checkpoint_file = get_default_checkpoint_file()
+    failed_chunks = load_failed_chunks(checkpoint_file)
+    if len(failed_chunks) == 0:
+        return []
+    os.replace(checkpoint_file, checkpoint_file + ".retrying")
+    controller = AdaptiveChunkController(1)
+    combined_data = []
+    for record in failed_chunks:
+        (data, status, latency, from_cache) = fetch_chunk_once(record["url"], record["params"], record["with_obj_type"],
+                                                               record["chunk"], controller, 0)
+        if status == 200:
+            combined_data += data
+        else:
+            checkpoint_failed_chunk(checkpoint_file, record["url"], record["params"], record["with_obj_type"],
+                                    record["chunk"], status)
+    os.remove(checkpoint_file + ".retrying")
+    logger.info(f"{len(failed_chunks)} checkpointed chunks retried, {len(load_failed_chunks(checkpoint_file))} still failing")
     return combined_data
 
 def encode_accession_list(id_list):
@@ -216,12 +753,12 @@ def get_sample_run_accessions(sample_acc_list):
     :param sample_acc_list:
     :return: sorted run_acc_list or []
     """
-    logger.debug()
+    logger.debug(f"{len(sample_acc_list)} sample accessions")
     if len(sample_acc_list) < 1:
         logger.debug("WARNING: no sample_acc's provide to get_sample_run_accessions()")
         return []
     sample_acc_string = encode_accession_list(sample_acc_list)
-    url = "https://www.ebi.ac.uk/ena/portal/api/search?"
+    url = get_ena_portal_url() + "search?"
     # url += "result=read_run&fields=run_accession%2Csample_accession&includeAccessionType=" + sample_acc_string
     # url += "format=tsv&limit=10"
     #(data, response) = ena_portal_api_call_basic(url)
@@ -238,9 +775,8 @@ def get_sample_run_accessions(sample_acc_list):
 
 
 def main():
-    url = 'https://www.ebi.ac.uk/ena/portal/api/count?result=sample&dataPortal=ena'
+    url = get_ena_portal_url() + 'count?result=sample&dataPortal=ena'
     ena_portal_api_call(url, {}, "sample", "")
 
 if __name__ == '__main__':
-    logger.debug()
     main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Script of env_prediction.py is to predict the environment of each read_run from its env_ tags, as one table lookup
+
+The rules of detailed_environmental_analysis(), that were an if/elif ladder run over the distinct tag strings, are
+compiled once into a lookup table keyed on the canonical env_ tag set, i.e. the distinct env_ tags in a fixed order:
+env_tax: before env_geo:, and marine, freshwater, brackish, coastal, terrestrial within each (the order ENA writes
+them in). There are only ten known env_ tags, so the table covers every set of them, 1024 rows, plus any other
+env_ tag sets seen. Each row has the env_prediction, env_confidence and env_prediction_hl, and the same again
+where the ocean is evidence of it being marine. A whole column is then predicted by factorizing its env_tags,
+looking each distinct value up in the table, and a numpy take back onto the rows.
+
+usage:
+    env_predictor = get_env_predictor()
+    df[['env_prediction', 'env_confidence', 'env_prediction_hl']] = env_predictor.predict(df['env_tags'], df['ocean'])
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x env_prediction.py
+"""
+
+import itertools
+import logging
+import sys
+import threading
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(name = 'mylogger')
+
+_habitats = ['marine', 'freshwater', 'brackish', 'coastal', 'terrestrial']
+_tag_groups = ['env_tax', 'env_geo']
+aquatic_tag_set = {f"{tag_group}:{habitat}" for tag_group in _tag_groups for habitat in _habitats[0:4]}
+terrestrial_tag_set = {f"{tag_group}:{habitat}" for tag_group in _tag_groups for habitat in _habitats[4:]}
+aquatic_set = ('marine', 'brackish', 'coastal', 'freshwater', 'mixed_aquatic')
+no_env_tags_prediction = ('terrestrial_assumed', 'low')
+
+
+def get_known_env_tags():
+    """
+    :return: list of the 10 env_ tags, in the canonical order
+    """
+    return [f"{tag_group}:{habitat}" for tag_group in _tag_groups for habitat in _habitats]
+
+
+def get_tag_sort_key(tag):
+    (tag_group, _, habitat) = tag.partition(':')
+    group_rank = _tag_groups.index(tag_group) if tag_group in _tag_groups else len(_tag_groups)
+    habitat_rank = _habitats.index(habitat) if habitat in _habitats else len(_habitats)
+    return group_rank, habitat_rank, tag
+
+
+def get_env_tag_key(env_tags):
+    """
+    :param env_tags: ';' separated env_ tags in any order, e.g. 'env_geo:marine;env_tax:marine;env_tax:marine'
+    :return: the canonical key e.g. 'env_tax:marine;env_geo:marine', "" where there are none
+    """
+    if not isinstance(env_tags, str) or env_tags == "":
+        return ""
+    return ';'.join(sorted({tag for tag in env_tags.split(';') if tag != ""}, key = get_tag_sort_key))
+
+
+def predict_env_from_tags(tag_list):
+    """
+    the rules, for one canonical tag set
+    :param tag_list: the env_ tags in the canonical order, see get_env_tag_key()
+    :return: (prediction, confidence), None if the rules do not handle these tags
+    """
+    if len(tag_list) == 0:
+        return no_env_tags_prediction
+    geo_tags = [tag for tag in tag_list if tag.startswith('env_geo')]
+    tags = set(tag_list)
+
+    if len(geo_tags) > 1:
+        if 'env_geo:coastal' in tags and 'env_geo:marine' in tags:
+            return ('coastal', 'medium') if len(tag_list) == 2 else ('coastal', 'high')
+        elif 'env_geo:terrestrial' in tags:
+            if 'env_geo:freshwater' in tags:
+                return 'freshwater', 'low'
+            elif 'env_geo:coastal' in tags:
+                return 'terrestrial', 'medium'
+        elif 'env_geo:marine' in tags:
+            if 'env_tax:marine' in tags:
+                return 'marine', 'medium'
+            elif 'env_geo:freshwater' in tags and 'env_tax:freshwater' in tags:
+                return 'freshwater', 'medium'
+            elif 'env_geo:freshwater' in tags:
+                return 'brackish', 'low'
+        return None
+    elif len(geo_tags) == 1:
+        geo_tag = geo_tags[0]
+        if geo_tag == 'env_geo:marine' and 'env_tax:marine' in tags:
+            return 'marine', 'high'
+        elif geo_tag in ['env_geo:freshwater', 'env_geo:coastal', 'env_geo:brackish', 'env_geo:terrestrial']:
+            return geo_tag.split(':')[1], 'high'
+        elif len(tag_list) == 2:
+            if tag_list[0] in aquatic_tag_set and tag_list[1] in aquatic_tag_set:
+                return 'mixed_aquatic', 'medium'
+            elif ((tag_list[0] in terrestrial_tag_set and tag_list[1] in aquatic_tag_set) or
+                  (tag_list[1] in terrestrial_tag_set and tag_list[0] in aquatic_tag_set)):
+                return 'mixed', 'low'
+            return None
+        elif len(tag_list) == 3:
+            if tag_list[0] in aquatic_tag_set and (tag_list[1] in aquatic_tag_set or tag_list[2] in aquatic_tag_set):
+                return 'mixed_aquatic', 'medium'
+            return 'mixed', 'low'
+        elif len(tag_list) == 1:
+            return geo_tag.split(':', 1)[1], 'medium'
+        elif geo_tag == 'env_geo:marine' and any('brackish' in tag or 'coastal' in tag for tag in tag_list):
+            return 'coastal', 'medium'
+        elif geo_tag == 'env_geo:marine' and any('terrestrial' in tag for tag in tag_list):
+            return 'mixed', 'low'
+        return None
+
+    # the following are where there are no env_geo: tags
+    if len(tag_list) == 1:
+        return tag_list[0].split(':', 1)[1], 'medium'
+    elif len(tag_list) == 2:
+        if tag_list[0] in aquatic_tag_set and tag_list[1] in aquatic_tag_set:
+            return 'mixed_aquatic', 'medium'
+        elif ((tag_list[0] in terrestrial_tag_set and tag_list[1] in aquatic_tag_set) or
+              (tag_list[1] in terrestrial_tag_set and tag_list[0] in aquatic_tag_set)):
+            return 'mixed', 'low'
+    elif len(tag_list) == 3:
+        if tag_list[0] in aquatic_tag_set and (tag_list[1] in aquatic_tag_set or tag_list[2] in aquatic_tag_set):
+            return 'mixed_aquatic', 'low'
+        elif tag_list[1] in aquatic_tag_set and tag_list[2] in aquatic_tag_set:
+            return 'mixed_aquatic', 'low'
+    elif len(tag_list) == 4:
+        if ((tag_list[0] in aquatic_tag_set or tag_list[1] in aquatic_tag_set) and
+                (tag_list[2] in aquatic_tag_set or tag_list[3] in aquatic_tag_set)):
+            return 'mixed_aquatic', 'low'
+    return None
+
+
+def get_prediction_hl(prediction):
+    """
+    :param prediction: e.g. 'coastal'
+    :return: terrestrial, aquatic, mixed or terrestrial_assumed
+    """
+    if prediction == "terrestrial_assumed" or prediction is None:
+        return "terrestrial_assumed"
+    elif prediction == "terrestrial":
+        return prediction
+    elif prediction in aquatic_set:
+        return "aquatic"
+    return "mixed"
+
+
+def get_ocean_prediction(prediction):
+    """
+    :return: the prediction where the sample is in an ocean, i.e. terrestrial or mixed become marine
+    """
+    if prediction in ['terrestrial', 'mixed']:
+        return "marine"
+    return prediction
+
+
+def compile_env_prediction_table(env_tag_keys):
+    """
+    :param env_tag_keys: canonical keys, see get_env_tag_key()
+    :return: DataFrame indexed by env_tag_key, with the columns env_prediction, env_confidence, env_prediction_hl,
+             ocean_env_prediction and ocean_env_prediction_hl. env_prediction and env_confidence are None where
+             the rules do not handle the tags
+    """
+    rows = []
+    for env_tag_key in env_tag_keys:
+        tag_list = env_tag_key.split(';') if env_tag_key != "" else []
+        (prediction, confidence) = predict_env_from_tags(tag_list) or (None, None)
+        ocean_prediction = get_ocean_prediction(prediction)
+        rows.append({'env_tag_key': env_tag_key, 'env_prediction': prediction, 'env_confidence': confidence,
+                     'env_prediction_hl': get_prediction_hl(prediction),
+                     'ocean_env_prediction': ocean_prediction,
+                     'ocean_env_prediction_hl': get_prediction_hl(ocean_prediction)})
+    return pd.DataFrame(rows, columns = ['env_tag_key', 'env_prediction', 'env_confidence', 'env_prediction_hl',
+                                         'ocean_env_prediction', 'ocean_env_prediction_hl']).set_index('env_tag_key')
+
+
+def get_all_known_env_tag_keys():
+    """
+    :return: the canonical key of every subset of the known env_ tags, including the empty one
+    """
+    known_env_tags = get_known_env_tags()
+    return [';'.join(tag_subset) for size in range(len(known_env_tags) + 1)
+            for tag_subset in itertools.combinations(known_env_tags, size)]
+
+
+class EnvPredictor:
+    """
+    the compiled env_ tag lookup table, extended with any other env_ tag sets as they are seen
+    """
+
+    def __init__(self):
+        self.table = compile_env_prediction_table(get_all_known_env_tag_keys())
+        self._lock = threading.Lock()
+        logger.debug(f"EnvPredictor table of {len(self.table)} env_ tag sets")
+
+    def get_table(self, env_tag_keys=()):
+        """
+        :param env_tag_keys: canonical keys that must be in the table
+        :return: the table
+        """
+        with self._lock:
+            new_keys = pd.Index(env_tag_keys).difference(self.table.index)
+            if len(new_keys) > 0:
+                self.table = pd.concat([self.table, compile_env_prediction_table(new_keys)])
+            return self.table
+
+    def predict(self, env_tags_series, ocean_series=None):
+        """
+        :param env_tags_series: the ';' separated env_ tags of each row, "" or missing where there are none
+        :param ocean_series: get_ocean() of each row, anything other than 'not ocean' is evidence of an ocean,
+                             None for no ocean evidence at all
+        :return: DataFrame of env_prediction, env_confidence and env_prediction_hl, with the env_tags_series index.
+                 Exits if any of the env_tags are not handled by the rules
+        """
+        (codes, uniques) = pd.factorize(env_tags_series)
+        # a trailing "" key, so that the -1 codes of missing values pick it
+        distinct_keys = [get_env_tag_key(env_tags) for env_tags in uniques] + [""]
+        table = self.get_table(distinct_keys)
+        distinct_rows = table.loc[distinct_keys]
+        not_assigned = sorted(set(distinct_rows.index[distinct_rows['env_prediction'].isna()]))
+        if len(not_assigned) > 0:
+            logger.error("Apologies: you need to address these cases before proceeding")
+            logger.error(f"not_assigned: {not_assigned}")
+            sys.exit("not_assigned")
+
+        if ocean_series is None:
+            is_ocean = np.zeros(len(codes), dtype = bool)
+        else:
+            (ocean_codes, ocean_uniques) = pd.factorize(ocean_series)
+            is_ocean = np.array([ocean != "not ocean" for ocean in ocean_uniques] + [True], dtype = bool)[ocean_codes]
+        columns = {'env_confidence': distinct_rows['env_confidence'].to_numpy()[codes]}
+        for column in ['env_prediction', 'env_prediction_hl']:
+            columns[column] = np.where(is_ocean, distinct_rows['ocean_' + column].to_numpy()[codes],
+                                       distinct_rows[column].to_numpy()[codes])
+        return pd.DataFrame(columns, index = env_tags_series.index,
+                            columns = ['env_prediction', 'env_confidence', 'env_prediction_hl'])
+
+
+_env_predictor = None
+_env_predictor_lock = threading.Lock()
+
+
+def get_env_predictor():
+    """
+    lazily creates the shared predictor, so the table is only compiled once
+    :return: EnvPredictor
+    """
+    global _env_predictor
+    if _env_predictor is None:
+        with _env_predictor_lock:
+            if _env_predictor is None:
+                _env_predictor = EnvPredictor()
+    return _env_predictor
+
+
+def main():
+    env_predictor = get_env_predictor()
+    print(env_predictor.get_table().value_counts(['env_prediction', 'env_confidence'], dropna = False).to_string())
+    env_tags = pd.Series(["env_tax:marine;env_geo:marine", "", "env_tax:terrestrial", "env_geo:coastal;env_geo:marine"])
+    print(env_predictor.predict(env_tags, pd.Series(["not ocean", "not ocean", "Atlantic Ocean", "not ocean"])))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,9 @@ chmod a+x geography.py
 
 import re
 import sys
-from eDNA_utilities import logger
+import pandas as pd
+from eDNA_utilities import logger, capitalise
+from multi_pattern_matcher import MultiPatternMatcher
 
 def clean_insdc_country_term(country):
     """
@@ -57,6 +59,7 @@ class Geography:
         self.north_america_set = {}
         self.ocean_sea_set = {}
         self.country_set = {}
+        self._lookup_table = None
         self.build_insdc_lists()
 
     def is_insdc_country(self, country):
@@ -278,6 +281,66 @@ class Geography:
     def get_insdc_full_country_set(self):
         return self.insdc_full_set
 
+    def get_lookup_table(self):
+        """
+        all the sets compiled once into one table, so a whole column can be annotated with one look up
+        rather than the get_continent() etc. predicates being called per row
+        :return: DataFrame indexed by the (clean) country, with the categorical columns continent, ocean and
+                 european_sea and the boolean is_eu and is_europe columns
+        """
+        if self._lookup_table is None:
+            countries = sorted(self.insdc_full_set.union(self.europe_all_set, self.north_america_set,
+                                                         self.south_america_set, self.africa_set, self.asia_set,
+                                                         self.australasia_set, self.antartica_set, self.eu_set))
+            lookup_table = pd.DataFrame({
+                'continent': [self.get_continent(country) for country in countries],
+                'ocean': [self.get_ocean(country) for country in countries],
+                'european_sea': [self.get_european_sea(country) for country in countries],
+                'is_eu': [self.is_insdc_country_in_eu(country) for country in countries],
+                'is_europe': [self.is_insdc_country_in_europe(country) for country in countries]},
+                index = pd.Index(countries, name = 'country'))
+            for column in ['continent', 'ocean', 'european_sea']:
+                lookup_table[column] = lookup_table[column].astype('category')
+            self._lookup_table = lookup_table
+        return self._lookup_table
+
+    def annotate(self, series):
+        """
+        the same as get_continent(), get_ocean(), get_european_sea(), is_insdc_country_in_eu() and
+        is_insdc_country_in_europe() on each value, but with one look up per distinct value
+        usage:
+            geography_obj.add_annotation_columns(df, 'country_clean')
+        :param series: pandas Series of the cleaned country terms, a missing value is taken as None
+        :return: DataFrame with the series index and the get_lookup_table() columns
+        """
+        lookup_table = self.get_lookup_table()
+        (codes, uniques) = pd.factorize(series, use_na_sentinel = False)
+        distinct_table = lookup_table.reindex(uniques)
+        is_missing = pd.isna(uniques)
+        # a country not in the table is undetermined and not an ocean, a missing one is undetermined and None
+        distinct_table['continent'] = distinct_table['continent'].fillna('undetermined')
+        distinct_table.loc[~is_missing, 'ocean'] = distinct_table.loc[~is_missing, 'ocean'].fillna('not ocean')
+        distinct_table['is_eu'] = distinct_table['is_eu'].fillna(False).astype(bool)
+        distinct_table['is_europe'] = distinct_table['is_europe'].fillna(False).astype(bool)
+        annotation = distinct_table.iloc[codes]
+        annotation.index = series.index
+        for column in ['continent', 'ocean', 'european_sea']:   # so value_counts() only has those present
+            annotation[column] = annotation[column].cat.remove_unused_categories()
+        return annotation
+
+    def add_annotation_columns(self, df, column='country_clean'):
+        """
+        sets the annotate() columns of df[column] on df, by position, so it is safe with a duplicated index
+        (where a join on the index would multiply the rows)
+        :param df: DataFrame, changed in place
+        :param column: of the cleaned country terms
+        :return: df
+        """
+        annotation = self.annotate(df[column])
+        for annotation_column in annotation.columns:
+            df[annotation_column] = annotation[annotation_column].to_numpy()
+        return df
+
     def print_summary(self):
 
         out_string = ""
@@ -293,6 +356,150 @@ class Geography:
         return out_string
 
 
+def select_first_country_part(value):
+    """
+    select just the first part of the INSDC country value, i.e. before any : or ;  (after a GAZ: prefix)
+    :param value: e.g. "United Kingdom: Hinxton"
+    :return: e.g. "United Kingdom", "missing" if there is nothing
+    """
+    if not isinstance(value, str):
+        return "missing"
+    my_list = value.split(":")
+    if my_list[0] == "GAZ" and len(my_list) > 1:
+        target_term = my_list[1]
+    else:
+        target_term = my_list[0]
+    val1 = target_term.split(";")[0]
+    if len(val1) > 0:
+        return val1
+    return "missing"
+
+
+def get_special_country_dict():
+    """
+    :return: dict of the common non-INSDC country terms to the INSDC country
+    """
+    return {
+        "USA": "United States of America",
+        "United States": "United States of America",
+        "US": "United States of America",
+        "UK": "United Kingdom",
+        "England": "United Kingdom",
+        "Wales": "United Kingdom",
+        "Scotland": "United Kingdom",
+        "Macedonia": "Northern Macedonia",
+        "Tasmania": "Australia",
+        "Yenisei river": "Mongolia",
+        "NULL": "missing",
+        "MISSING": "missing",
+        "Cote d'Ivoire": "Cote d'Ivoire",
+        "Faroe": "Faroe Islands",
+        "Temperate Northern Atlantic": "Atlantic Ocean",
+        "Atlantic": "Atlantic Ocean",
+        "Antarctic Peninsula": "Antarctica",
+        "PuertoRico": "Puerto Rico",
+        "Korea": 'South Korea',
+        "KOREA": 'South Korea',
+        "korea": 'South Korea',
+        "Darwin, Norther Territory": "Australia",
+        'Vietnam': 'Viet Nam',
+        "Nabanhe": "China",
+        "Hanzhong": "China"
+    }
+
+
+class CountryMatcher:
+    """
+    cleans the raw INSDC country values to a country (or sea), and finds the European seas in them.
+    The country and sea names are each compiled once into a MultiPatternMatcher, and every result is
+    memoized per distinct raw value, so a column is cleaned at the cost of its distinct values, not its rows.
+    usage:
+        country_matcher = CountryMatcher(Geography())
+        df['country_clean'] = country_matcher.clean_country_series(df['country'])
+    """
+
+    def __init__(self, geography_obj):
+        self.insdc_country_set = set(geography_obj.get_insdc_full_country_set())
+        self.insdc_country_set.add("United States of America")
+        self.insdc_country_set.add("missing")
+        self.lower_country_dict = {str(country).lower(): country for country in self.insdc_country_set}
+        self.special_country_dict = get_special_country_dict()
+        self.country_matcher = MultiPatternMatcher(sorted(self.insdc_country_set))
+        self.special_country_matcher = MultiPatternMatcher(self.special_country_dict)
+        self.europe_sea_matcher = MultiPatternMatcher(sorted(geography_obj.europe_sea_set))
+        self.blank_re = re.compile("^[,.] ?$|^$")
+        self._clean_country_memo = {}
+        self._european_sea_memo = {}
+
+    def extra_country_clean(self, value):
+        """
+        the special terms, then the first country or sea in the value, then the first special term in it
+        :param value: the first part, see select_first_country_part()
+        :return: the clean country, "Unknown" if blank, else the value as it is
+        """
+        if value in self.special_country_dict:
+            return self.special_country_dict[value]
+        elif value in self.insdc_country_set:
+            return value
+
+        match = self.country_matcher.search(value)
+        if match:
+            match_group = value[match[0]:match[1]]
+            logger.debug(f"insdc_country_clean: {value} and '{match_group}'")
+            if match_group in self.special_country_dict:
+                return self.special_country_dict[match_group]
+            elif match_group.lower() in self.lower_country_dict:  # copes with all upper and all lower case countries
+                return self.lower_country_dict[match_group.lower()]
+            return match_group
+
+        match = self.special_country_matcher.search(value)
+        if match:
+            match_group = value[match[0]:match[1]]
+            logger.debug(f"special_country_clean: {value} and '{match_group}'")
+            if match_group in self.special_country_dict:
+                return self.special_country_dict[match_group]
+            return match_group
+        elif self.blank_re.search(value):
+            return "Unknown"
+        logger.debug(f"insdc_country_clean:, not match for '{value}'")
+        return value
+
+    def clean_country(self, raw_value):
+        """
+        :param raw_value: the country as in ENA e.g. "UK: Norfolk"
+        :return: e.g. "United Kingdom"
+        """
+        if raw_value not in self._clean_country_memo:
+            self._clean_country_memo[raw_value] = self.extra_country_clean(select_first_country_part(raw_value))
+        return self._clean_country_memo[raw_value]
+
+    def get_european_sea(self, raw_value):
+        """
+        :param raw_value:
+        :return: the first European sea in the value, capitalised, else None
+        """
+        if raw_value not in self._european_sea_memo:
+            match = self.europe_sea_matcher.search(raw_value)
+            self._european_sea_memo[raw_value] = None if match is None else capitalise(raw_value[match[0]:match[1]])
+        return self._european_sea_memo[raw_value]
+
+    def map_distinct(self, series, function):
+        """
+        :param series: pandas Series
+        :param function: of one distinct value
+        :return: Series of function(value), computed once per distinct value
+        """
+        (codes, uniques) = pd.factorize(series, use_na_sentinel = False)
+        distinct_results = pd.Series([function(value) for value in uniques], dtype = object)
+        return pd.Series(distinct_results.to_numpy()[codes], index = series.index, dtype = object)
+
+    def clean_country_series(self, series):
+        return self.map_distinct(series, self.clean_country)
+
+    def get_european_sea_series(self, series):
+        return self.map_distinct(series, self.get_european_sea)
+
+
 def main():
     print("running main in geography.py")
     geography = Geography()
@@ -17,10 +17,14 @@ import argparse
 
 from collections import Counter
 
-from geography import Geography
+from geography import Geography, CountryMatcher
+from tag_decoder import add_env_tag_columns
+from readrun_dataset import save_readrun_frame, load_readrun_frame, get_dataset_dir, has_query_type_partitions
+from readrun_sync import sync_env_readrun_detail
+from readrun_windows import download_readrun_windows, clear_readrun_windows
 from taxonomy import *
 from eDNA_utilities import pickle_data_structure, unpickle_data_structure, my_coloredFormatter, run_webservice, \
-    run_webservice_with_params, get_shorter_list, print_value_count_table, capitalise
+    run_webservice_with_params, get_shorter_list, print_value_count_table
 from ena_api_calls import setup_run_api_call
 
 logger = logging.getLogger(name = 'mylogger')
@@ -32,7 +36,7 @@ pd.set_option('max_colwidth', None)
 
 def get_query_params(checklist_type):
     my_params = {
-        "srv": "https://www.ebi.ac.uk/ena/portal/api/search",
+        "srv": get_ena_portal_url() + "search",
         "query": ""
     }
 
@@ -97,10 +101,14 @@ def get_all_checklist_types():
     return checklist_types
 
 
-def get_env_readrun_detail(total_records_to_return):
+def get_env_readrun_detail(total_records_to_return, incremental=False, window_by="first_public"):
     """
 
     :param total_records_to_return: if 0, this means return all.
+    :param incremental: if True, each query_type is first brought up to date with the records changed since
+                        the last sync, see sync_env_readrun_detail()
+    :param window_by: a query_type not there yet is downloaded as concurrent, resumable windows by first_public
+                      or checklist, see download_readrun_windows(), None for a single search
     :return: records as a list
     """
 
@@ -121,31 +129,32 @@ def get_env_readrun_detail(total_records_to_return):
 
 
     checklist_types = get_all_checklist_types()
+    env_read_run_detail_dataset = "env_readrun_detail"   # partitioned by query_type and checklist
     combined_record_list = []
     for checklist_type in checklist_types: #currently does a search of the default templates and then a search of the environmental ones
         logger.info(f"++++Doing the main search for environmental data via -->{checklist_type}<-- +++")
+        if incremental:
+            sync_env_readrun_detail(checklist_type, env_read_run_detail_dataset)
+        # the old pickle of this query_type is only read if the dataset has no partition of it yet
         if checklist_type == "default_checklists":
             env_read_run_detail_file = "read_run_allinsdc_defaultgeneric.json.pickle"
-            env_read_run_detail_jsonfile = "read_run_allinsdc_defaultgeneric.json"
         else:
             env_read_run_detail_file = "read_run_allinsdc_detail.pickle"
-            env_read_run_detail_jsonfile = "read_run_allinsdc_detail.json"
-
-        if os.path.exists(env_read_run_detail_file):
-            logger.info(f"{env_read_run_detail_file} exists, so can unpickle it")
-            record_list = unpickle_data_structure(env_read_run_detail_file)
-        # elif os.path.exists(env_read_run_detail_jsonfile):
-        #     logger.info(f"{env_read_run_detail_jsonfile} exists, so using that")
-        #     with open(env_read_run_detail_jsonfile, "r") as f:
-        #         record_list = json.load(f)
-        #         length = len(record_list)
-        #         for i in range(length):
-        #             # record = record_list[i]
-        #             record_list[i]["query_type"] = checklist_type
-        #         pickle_data_structure(record_list, env_read_run_detail_file)
+
+        df_read_run = load_readrun_frame(env_read_run_detail_dataset, filters = {'query_type': [checklist_type]},
+                                         pickle_file = env_read_run_detail_file)
+        if df_read_run is not None and len(df_read_run) > 0:
+            logger.info(f"{env_read_run_detail_dataset} has {len(df_read_run)} {checklist_type} records, so using them")
+            if not has_query_type_partitions(get_dataset_dir(env_read_run_detail_dataset),
+                                             {'query_type': [checklist_type]}):   # i.e. it was from the pickle
+                save_readrun_frame(df_read_run, env_read_run_detail_dataset)
+            record_list = df_read_run.to_dict('records')
         else:
             #query_params_json = get_query_params(checklist_type)
-            record_list = setup_run_api_call(checklist_type, limit)
+            if window_by is None:
+                record_list = setup_run_api_call(checklist_type, limit)
+            else:
+                record_list = download_readrun_windows(checklist_type, window_by = window_by).to_dict('records')
             logger.info(f"Finished running {checklist_type}")
 
             logger.info(f"got {len(record_list)} records")
@@ -154,10 +163,10 @@ def get_env_readrun_detail(total_records_to_return):
             for i in range(length):
                 # record = record_list[i]
                 record_list[i]["query_type"] = checklist_type
-            with open(env_read_run_detail_jsonfile, 'w') as f:
-                json.dump(record_list, f)
-            logger.info(f"Writing records to pickle: {env_read_run_detail_file}")
-            pickle_data_structure(record_list, env_read_run_detail_file)
+            logger.info(f"Writing records to the {checklist_type} partition of {env_read_run_detail_dataset}")
+            save_readrun_frame(record_list, env_read_run_detail_dataset)
+            if window_by is not None:   # all the windows are now in the dataset
+                clear_readrun_windows(checklist_type)
 
         logger.info(f"record_list length: {len(record_list)}")
 
@@ -245,33 +254,6 @@ def get_env_sample_ids():
     return record_list
 
 
-def select_first_part(value):
-    """
-    select just the first part of value before the :
-    :param value:
-    :return:
-    """
-
-    my_list = value.split(":")
-    if my_list[0] == "GAZ":
-        target_term = my_list[1]
-    else:
-        target_term = my_list[0]
-    val1_list = target_term.split(";")
-    val1 = val1_list[0]
-
-    if len(val1) > 0:
-        return val1
-    else:
-        return "missing"
-
-    # #logger.info(value[:value.find(":")])
-    # if value.find(":") >= 0:
-    #     return value[:value.find(":")+1]
-    # else:
-    #     return value
-
-
 def get_presence_or_absence_col(df, col_name):
     # col with and without values
     # FFS isnull etc. did not work
@@ -445,7 +427,8 @@ def process_geographical_data(old_df):
     """
     logger.info(f"process geographical data rows in={len(old_df)}")
 
-    df = old_df.copy()
+    # only whole columns are assigned, so a shallow copy is enough, rather than copying all the rows
+    df = old_df.copy(deep = False)
     # if 'country_clean' in df.columns:
     #     logger.info("geographical data already processed, so skip and return df")
     #     return df
@@ -464,99 +447,23 @@ def process_geographical_data(old_df):
     # print_value_count_table(df.broad_scale_environmental_context)
 
     geography_obj = Geography()
-    insdc_country_set = geography_obj.get_insdc_full_country_set()
-    insdc_country_set.add("United States of America")
-    insdc_country_set.add("missing")
-    logger.debug(f"insdc_country_list: {sorted(insdc_country_set)}")
-    lower_country_dict = {}
-    for country in insdc_country_set:
-        # logger.info(f"country: --->{country}<----")
-        lc_country = str(country).lower()
-        lower_country_dict[lc_country] = country
-    countries_re = re.compile("|".join(insdc_country_set), re.IGNORECASE)
-    blank_re = re.compile("^[,.] ?$|^$")
-    special_country_dict = {
-        "USA": "United States of America",
-        "United States": "United States of America",
-        "US": "United States of America",
-        "UK": "United Kingdom",
-        "England": "United Kingdom",
-        "Wales": "United Kingdom",
-        "Scotland": "United Kingdom",
-        "Macedonia": "Northern Macedonia",
-        "Tasmania": "Australia",
-        "Yenisei river": "Mongolia",
-        "NULL": "missing",
-        "MISSING": "missing",
-        "Cote d'Ivoire": "Cote d'Ivoire",
-        "Faroe": "Faroe Islands",
-        "Temperate Northern Atlantic": "Atlantic Ocean",
-        "Atlantic": "Atlantic Ocean",
-        "Antarctic Peninsula": "Antarctica",
-        "PuertoRico": "Puerto Rico",
-        "Korea": 'South Korea',
-        "KOREA": 'South Korea',
-        "korea": 'South Korea',
-        "Darwin, Norther Territory": "Australia",
-        'Vietnam': 'Viet Nam',
-        "Nabanhe": "China",
-        "Hanzhong": "China"
-    }
-    special_country_list = list(special_country_dict.keys())
-    special_countries_re = re.compile("|".join(special_country_list), re.IGNORECASE)
-
-    def extra_country_clean(value):
-        """
-        extra country clean to do a level of cleaning ip in addition to the easy ones.
-        :param value:
-        :return:
-        """
-        if value in special_country_dict:
-            return special_country_dict[value]
-        elif value in insdc_country_set:
-            return value
-
-        match = countries_re.search(value)
-        if match:
-            match_group = match.group()
-            logger.debug(f"insdc_country_clean: {value} and {match} and '{match_group}'")
-            if match_group in special_country_dict:
-                return special_country_dict[match_group]
-            elif match_group.lower() in lower_country_dict:  # copes with all upper and all lower case countries
-                return lower_country_dict[match_group.lower()]
-
-            return match.group()
-
-        match = special_countries_re.search(value)
-        if match:
-            logger.debug(f"special_country_clean: {value} and {match} and '{match.group()}'")
-            if match.group() in special_country_dict:
-                return special_country_dict[match.group()]
-            return match.group()
-        elif blank_re.search(value):
-            return "Unknown"
-        else:
-            logger.debug(f"insdc_country_clean:, not match for '{value}'")
-            return value
-
-    df['country_clean'] = df['country'].apply(select_first_part)
-    df['country_clean'] = df['country_clean'].apply(extra_country_clean)
+    # the country and sea names are compiled once, and each distinct raw country value is only cleaned once
+    country_matcher = CountryMatcher(geography_obj)
+    df['country_clean'] = country_matcher.clean_country_series(df['country'])
     logger.info(f"country_clean={df['country_clean'].value_counts()}")
     df_country_clean_count = df['country_clean'].value_counts().to_frame('count').reset_index()
     outfile = "clean_country.tsv"
     logger.info(f"df_country_clean_count={df_country_clean_count} the cleaner list is here {outfile}")
     df_country_clean_count.to_csv(outfile, sep = '\t', index = False)
 
-    df['continent'] = df['country_clean'].apply(geography_obj.get_continent)
+    # continent, ocean, european_sea, is_eu and is_europe in one look up per distinct country
+    geography_obj.add_annotation_columns(df, 'country_clean')
     logger.info(f"continent_counts={df.continent.value_counts()}")
-    df['ocean'] = df['country_clean'].apply(geography_obj.get_ocean)
-
 
     logger.info(f"First doing a naive european sea search, then more comprehensive one")
-    df['european_sea'] = df['country_clean'].apply(geography_obj.get_european_sea)
     logger.info(f"df['european_sea'].value_counts()={df['european_sea'].value_counts()}")
 
-    df['is_european_sea'] = df['european_sea'].apply(has_a_value)
+    df['is_european_sea'] = df['european_sea'].notna()
     df_europe = df.query('continent == "europe" | is_european_sea')
     # df_europe = df.query('is_european_sea')
     #df_europe = df.query('continent == "europe"')
@@ -575,22 +482,8 @@ def process_geographical_data(old_df):
     df_europe_seas['has_geographical_coordinates'] = df_europe_seas['has_geographical_coordinates'].mask(df_europe_seas['lat'].isna(), False)
     print_value_count_table(df_europe_seas.has_geographical_coordinates)
 
-    # creating this pattern ready for the get_european_sea_value function
-    europe_sea_list = list(geography_obj.europe_sea_set)
-    logger.info(f"european_sea_list={europe_sea_list}")
-    combined_list_joined = "|".join(europe_sea_list)
-    europe_sea_re = re.compile(combined_list_joined, re.IGNORECASE)
-    # df['match_european_sea'] = df['country_clean'].str.match(europe_sea_re)
-
-    def get_european_sea_value(value):
-        match = europe_sea_re.search(value)
-        if match is None:
-            return None
-        rtn_value = capitalise(match.group())
-        # logger.info(rtn_value)
-        return rtn_value
-
-    df['european_sea'] = df['country'].apply(get_european_sea_value)
+    logger.info(f"european_sea_list={list(geography_obj.europe_sea_set)}")
+    df['european_sea'] = country_matcher.get_european_sea_series(df['country'])
     logger.info(f"df['european_sea'].value_counts()={df['european_sea'].value_counts()}")
     print_value_count_table(df.european_sea)
 
@@ -693,25 +586,12 @@ def filter_for_aquatic(df):
     # df = df.head(10000)
     logger.info(df.columns)
 
-    aquatic_pattern = re.compile('marine|freshwater|coastal|brackish')
+    aquatic_pattern = 'marine|freshwater|coastal|brackish'
     aquatic_biome_pattern = re.compile(
         'marine|ocean|freshwater|coastal|brackish|estuar|fresh '
         'water|groundwater|glacial_spring|^sea|seawater|lake|river|wastewater|waste water|stormwater',
         re.IGNORECASE)
 
-    def local_process_env_tags(value):
-        my_tag_list = value.split(';')
-
-        my_env_tags = [s for s in my_tag_list if "env_" in s]
-
-        return my_env_tags
-
-    def test_if_aquatic(value):
-        if re.search(aquatic_pattern, value):
-            return True
-
-        return False
-
     def test_if_ocean(value):
         if len(value) == 0 or value == 'not ocean':
             return False
@@ -728,10 +608,12 @@ def filter_for_aquatic(df):
     # print_value_count_table(df.tag)
     # logger.info(df.tag.head(50))
     # df['env_tax'] = df['tag'].str.extract("(env_tax:[^;]*)")[0]
-    df['env_tag'] = df['tag'].apply(local_process_env_tags)
-    df['env_tags'] = df['env_tag'].apply(lambda x: ';'.join(x))
+    tag_decoder = add_env_tag_columns(df)   # each distinct tag string is decoded once
     # print_value_count_table(df.env_tags)
-    df['aquatic'] = df['env_tags'].apply(test_if_aquatic)
+    if tag_decoder is not None:
+        df['aquatic'] = tag_decoder.get_env_tag_pattern_mask(aquatic_pattern)
+    else:   # i.e. the env_tags were decoded already
+        df['aquatic'] = df['env_tags'].fillna("").str.contains(aquatic_pattern).to_numpy()
     logging.info(f"aquatic= {df['aquatic'].value_counts()}")
     df_aquatic = df[df['aquatic'] == True]
     df_remainder = df[df['aquatic'] == False]
@@ -766,7 +648,7 @@ def filter_for_aquatic(df):
     return df_aquatic
 
 
-def main():
+def main(incremental=False):
 
 
     # df_all_study_details = analyse_all_study_details(get_all_study_details())
@@ -783,7 +665,7 @@ def main():
     total_records_to_retrieve = 100000
     total_records_to_retrieve = 0
 
-    env_readrun_detail = get_env_readrun_detail(total_records_to_retrieve)
+    env_readrun_detail = get_env_readrun_detail(total_records_to_retrieve, incremental = incremental)
     logging.info(f"env_readrun_detail len= {len(env_readrun_detail)}")
     sys.exit("exiting early")
 
@@ -792,9 +674,8 @@ def main():
 
     sys.exit("Stopping this early as got what I need...")
     df_env_readrun_detail = filter_for_aquatic(df_env_readrun_detail)
-    df_aquatic_env_readrun_detail_pickle = "df_aquatic_env_readrun_detail.pickle"
-    pickle_data_structure(df_env_readrun_detail, df_aquatic_env_readrun_detail_pickle)
-    logger.info(f"writing to = {df_aquatic_env_readrun_detail_pickle}")
+    df_aquatic_env_readrun_detail_dataset = save_readrun_frame(df_env_readrun_detail, "df_aquatic_env_readrun_detail")
+    logger.info(f"writing to = {df_aquatic_env_readrun_detail_dataset}")
     logger.info("WTF")
     # sys.exit()
     # logger.info(f"pickled to {df_aquatic_env_readrun_detail_pickle}")
@@ -828,6 +709,9 @@ if __name__ == '__main__':
     parser.add_argument("-d", "--debug_status",
                         help = "Debug status i.e.True if selected, is verbose",
                         required = False, action = "store_true")
+    parser.add_argument("-i", "--incremental",
+                        help = "Only fetch the read_run records changed since the last sync, and upsert them",
+                        required = False, action = "store_true")
 
     parser.parse_args()
     args = parser.parse_args()
@@ -838,4 +722,4 @@ if __name__ == '__main__':
         logger.setLevel(level = logging.INFO)
     logger.info(prog_des)
 
-    main()
+    main(incremental = args.incremental)
@@ -7,12 +7,16 @@ __docformat___ = 'reStructuredText'
 chmod a+x get_taxononomy_scientific_name.py
 """
 
-import requests
 import xml.etree.ElementTree as ET
 
+import os
+import sys
 from eDNA_utilities import logger
+# the one shared pooled ENA/EBI HTTP session, ena_http_session.py, is in scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ena_http_session import http_get
+from taxonomy_store import get_taxonomy_store
 import argparse
-import sys
 
 
 def get_taxonomy_root(taxid):
@@ -22,7 +26,7 @@ def get_taxonomy_root(taxid):
     """
     # curl -s https://www.ebi.ac.uk/ena/browser/api/xml/797283 | xq | sed 's/@//g' | jq '.TAXON_SET.taxon | .scientificName'
     url = r'https://www.ebi.ac.uk/ena/browser/api/xml/' + str(taxid)
-    r = requests.get(url)
+    r = http_get(url)
 
     if r.status_code == 200:
         # print(r.text)
@@ -46,10 +50,24 @@ def get_pretty_taxonomy_scientific_name(taxid):
 
 def get_pretty_taxonomy_rankings(taxid):
     """
+    from the local taxonomy store if it can, otherwise from the browser XML
     :param tax
     # example root(1);unclassified entries(2787823);unclassified sequences(12908);metagenomes(408169);ecological metagenomes(410657);ant fungus garden metagenome(797283)
     :return: get_pretty_taxonomy_rankings string
     """
+    store = get_taxonomy_store()
+    if store is not None:
+        pretty_taxonomy_rankings = store.get_pretty_taxonomy_rankings(taxid)
+        if pretty_taxonomy_rankings is not None:
+            return pretty_taxonomy_rankings
+    return get_pretty_taxonomy_rankings_from_xml(taxid)
+
+def get_pretty_taxonomy_rankings_from_xml(taxid):
+    """
+    one browser XML call per taxon
+    :param tax
+    :return: get_pretty_taxonomy_rankings string
+    """
     root = get_taxonomy_root(taxid)
     logger.info(root)
     taxon = root.find('.//taxon')
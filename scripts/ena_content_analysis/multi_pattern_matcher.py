@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Script of multi_pattern_matcher.py is to find the first of many literal patterns in a string, in one pass
+
+An Aho-Corasick automaton is built once from all the patterns (e.g. the ~260 INSDC country and sea names),
+so a search is a single walk over the characters of the string, whatever the number of patterns, rather than
+trying a huge regular expression alternation at each position.
+The patterns are literal, not regular expressions, and matching is case-insensitive by default.
+Where several patterns match, the leftmost wins, and of those starting at the same place the longest.
+
+usage:
+    matcher = MultiPatternMatcher(['Niger', 'Nigeria', 'North Sea'])
+    matcher.search("sediment, nigeria coast")     # (10, 17, 'Nigeria')
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x multi_pattern_matcher.py
+"""
+
+import logging
+from collections import deque
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+class MultiPatternMatcher:
+    """
+    Aho-Corasick automaton over a list of literal patterns
+    """
+
+    def __init__(self, patterns, ignore_case=True):
+        """
+        :param patterns: iterable of strings, empty ones are ignored
+        :param ignore_case:
+        """
+        self.ignore_case = ignore_case
+        self.pattern_by_key = {}
+        for pattern in patterns:
+            if pattern:
+                self.pattern_by_key.setdefault(self.normalise(pattern), pattern)
+        self.max_length = max((len(key) for key in self.pattern_by_key), default = 0)
+        self.build_automaton()
+        logger.debug(f"MultiPatternMatcher of {len(self.pattern_by_key)} patterns, {len(self.goto)} states")
+
+    def normalise(self, text):
+        """
+        lower cases, but keeps the positions in text, i.e. a character whose lower case is longer is left as it is
+        """
+        if not self.ignore_case:
+            return text
+        lower_text = text.lower()
+        if len(lower_text) == len(text):
+            return lower_text
+        return "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+    def build_automaton(self):
+        """
+        the trie (goto), its failure links and, per state, the lengths of the patterns ending there
+        """
+        self.goto = [{}]
+        self.output = [()]
+        for key in self.pattern_by_key:
+            state = 0
+            for char in key:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.output.append(())
+                state = next_state
+            self.output[state] = (len(key),)
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:   # breadth first, so the failure state of each state is done before it is needed
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def search(self, text):
+        """
+        :param text:
+        :return: (start, end, pattern) of the leftmost (then longest) match, None if there is none.
+                 text[start:end] is the matched text in its own case, pattern is as it was given
+        """
+        if not isinstance(text, str) or not self.pattern_by_key:
+            return None
+        key_text = self.normalise(text)
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        best = None
+        for position, char in enumerate(key_text):
+            if best is not None and position - best[0] >= self.max_length:
+                break   # nothing still to be found can start at or before best
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length in output[state]:
+                start = position + 1 - length
+                if best is None or start < best[0] or (start == best[0] and position + 1 > best[1]):
+                    best = (start, position + 1)
+        if best is None:
+            return None
+        return best[0], best[1], self.pattern_by_key[key_text[best[0]:best[1]]]
+
+
+def main():
+    matcher = MultiPatternMatcher(['Niger', 'Nigeria', 'North Sea', 'Sea'])
+    for text in ["sediment, nigeria coast", "NORTH SEA", "Sargasso Sea", "nothing"]:
+        print(text, matcher.search(text))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Script of portal_api_metrics.py is to record the metrics of every portal API request
+
+For each request the bytes, the latency split into connect, time to first byte and download, the parse time
+and the retry number are kept, so when a run is slow it is clear whether the time went on the network,
+the server or the decoding. At the end of the run a summary with p50/p95/p99 latencies and the throughput
+is logged and a JSON metrics file is written in the working directory, next to the other outputs.
+
+usage:
+    metrics = get_portal_metrics()
+    if metrics is not None:
+        metrics.record_response(url, response, parse_s = parse_s, retries = attempt)
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x portal_api_metrics.py
+"""
+
+import atexit
+import json
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+def get_percentile(sorted_values, percent):
+    """
+    linear interpolation between the closest ranks, as numpy.percentile does by default
+    :param sorted_values: list, already sorted
+    :param percent: 0 to 100
+    :return: float or None if no values
+    """
+    if len(sorted_values) == 0:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class PortalApiMetrics:
+    """
+    thread safe store of the per request metrics
+    """
+
+    timing_keys = ["connect_s", "ttfb_s", "download_s", "parse_s", "total_s"]
+
+    def __init__(self):
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def record_request(self, url, status, timing=None, parse_s=0.0, retries=0, from_cache=False, result_type=""):
+        """
+        :param url:
+        :param status: http status code, or e.g. "timeout"
+        :param timing: the response.timing dict from ena_http_session, None for a cache hit or no response
+        :param parse_s: seconds spent decoding the body
+        :param retries: 0 for the first try of a request
+        :param from_cache:
+        :param result_type: e.g. sample, read_run
+        :return: the record
+        """
+        timing = timing or {}
+        record = {
+            "time": time.time(),
+            "url": url,
+            "result_type": result_type,
+            "status": status,
+            "from_cache": from_cache,
+            "retries": retries,
+            "bytes": timing.get("bytes", 0),
+            "wire_bytes": timing.get("wire_bytes", 0),
+            "connect_s": timing.get("connect_s", 0.0),
+            "ttfb_s": timing.get("ttfb_s", 0.0),
+            "download_s": timing.get("download_s", 0.0),
+            "parse_s": parse_s
+        }
+        record["total_s"] = timing.get("total_s", 0.0) + parse_s
+        with self._lock:
+            self.requests.append(record)
+        return record
+
+    def record_response(self, url, response, parse_s=0.0, retries=0, result_type=""):
+        """
+        record_request for a requests response or a CachedResponse
+        """
+        return self.record_request(url, response.status_code, getattr(response, "timing", None), parse_s, retries,
+                                   getattr(response, "from_cache", False), result_type)
+
+    def reset(self):
+        with self._lock:
+            self.requests = []
+
+    def get_summary(self):
+        """
+        the latency percentiles are only over the requests that went to the server
+        :return: dict
+        """
+        with self._lock:
+            requests = list(self.requests)
+        network_requests = [record for record in requests if not record["from_cache"]]
+        summary = {
+            "requests": len(requests),
+            "network_requests": len(network_requests),
+            "cache_hits": len(requests) - len(network_requests),
+            "errors": sum(1 for record in requests if record["status"] != 200),
+            "retries": sum(1 for record in requests if record["retries"] > 0),
+            "bytes": sum(record["bytes"] for record in network_requests),
+            "wire_bytes": sum(record["wire_bytes"] for record in network_requests)
+        }
+        if len(network_requests) > 0:
+            run_start = min(record["time"] - record["total_s"] for record in network_requests)
+            run_end = max(record["time"] for record in network_requests)
+            span_s = max(run_end - run_start, 1e-9)
+            summary["span_s"] = round(span_s, 3)
+            summary["requests_per_s"] = round(len(network_requests) / span_s, 3)
+            summary["bytes_per_s"] = round(summary["bytes"] / span_s, 1)
+        for key in self.timing_keys:
+            values = sorted(record[key] for record in network_requests)
+            summary[key] = {
+                "sum": round(sum(values), 4),
+                "p50": get_percentile(values, 50),
+                "p95": get_percentile(values, 95),
+                "p99": get_percentile(values, 99)
+            }
+        return summary
+
+    def print_summary(self):
+        out_string = "*** Summary of the portal API requests ***\n"
+        for key, value in self.get_summary().items():
+            if isinstance(value, dict):
+                value = " ".join(f"{stat}={round(stat_value, 4) if stat_value is not None else None}"
+                                 for stat, stat_value in value.items())
+            out_string += f"{key.ljust(30)}: {value}\n"
+        return out_string
+
+    def write_metrics_file(self, metrics_file):
+        with self._lock:
+            requests = list(self.requests)
+        with open(metrics_file, "w") as f:
+            json.dump({"summary": self.get_summary(), "requests": requests}, f, indent = 1)
+        logger.info(f"written the portal API metrics to {metrics_file}")
+
+
+_metrics_settings = {
+    "enabled": True,
+    "metrics_file": "portal_api_metrics.json",    # in the working dir, next to the other outputs
+    "write_at_exit": True
+}
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def configure_portal_metrics(enabled=None, metrics_file=None, write_at_exit=None):
+    """
+    :param enabled: False stops any recording
+    :param metrics_file:
+    :param write_at_exit: if True the summary is logged and the metrics file written when the run ends
+    :return: the settings dict
+    """
+    if enabled is not None:
+        _metrics_settings["enabled"] = enabled
+    if metrics_file is not None:
+        _metrics_settings["metrics_file"] = metrics_file
+    if write_at_exit is not None:
+        _metrics_settings["write_at_exit"] = write_at_exit
+    return _metrics_settings
+
+
+def get_portal_metrics():
+    """
+    lazily creates the shared metrics, registering the run end summary
+    :return: PortalApiMetrics or None if disabled
+    """
+    global _metrics
+    if not _metrics_settings["enabled"]:
+        return None
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = PortalApiMetrics()
+                atexit.register(write_run_end_summary)
+    return _metrics
+
+
+def write_run_end_summary():
+    """
+    logs the summary and writes the metrics file, if there were any requests
+    """
+    if _metrics is None or len(_metrics.requests) == 0 or not _metrics_settings["write_at_exit"]:
+        return
+    logger.info(_metrics.print_summary())
+    _metrics.write_metrics_file(_metrics_settings["metrics_file"])
+
+
+def main():
+    metrics = PortalApiMetrics()
+    metrics.record_request("https://www.ebi.ac.uk/ena/portal/api/search", 200,
+                           {"connect_s": 0.05, "ttfb_s": 0.4, "download_s": 0.1, "total_s": 0.55, "bytes": 1000})
+    print(metrics.print_summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""Script of portal_api_stand_in.py is to run a local stand-in for the ENA portal API, for offline testing and benchmarking
+
+Serves /ena/portal/api/search, /count and /filereport from synthetic sample, read_run, taxon and study tables,
+generated from a seed so they are the same each run. The latency and error rate can be injected to see how the
+chunked calls behave when the server is slow or flaky, and a max_body_bytes gives a 413 for bigger POSTs.
+Only the bits of the portal API that this code uses are there: result, fields, includeAccessions (+ type),
+query (field="value" with * wildcards, tax_eq, tax_tree, not_tax_tree, AND, OR, NOT and brackets),
+format json/tsv, limit and offset.
+
+usage:
+    with PortalApiStandIn(n_samples=10000, latency=0.05, error_rate=0.01) as stand_in:
+        configure_portal_url(stand_in.get_url())
+        ...
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x portal_api_stand_in.py
+"""
+
+import argparse
+import fnmatch
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+def get_primary_key_by_result_type():
+    return {
+        "study": "study_accession",
+        "sample": "sample_accession",
+        "read_run": "run_accession",
+        "taxon": "tax_id"
+    }
+
+
+def get_accession_type_fields():
+    """
+    the includeAccessionType values mapped to the field that they match on
+    """
+    return {
+        "study": "study_accession", "study_accession": "study_accession",
+        "sample": "sample_accession", "sample_accession": "sample_accession",
+        "run": "run_accession", "run_accession": "run_accession", "read_run": "run_accession",
+        "experiment": "experiment_accession", "experiment_accession": "experiment_accession",
+        "taxon": "tax_id", "tax_id": "tax_id"
+    }
+
+
+class SyntheticPortalTables:
+    """
+    the synthetic study, sample, read_run and taxon tables, all values are strings as from the real portal
+    """
+
+    countries = ["United Kingdom", "Spain", "Brazil", "Japan", "Kenya", "USA: Alaska", "Atlantic Ocean",
+                 "Pacific Ocean", "Norway", "Australia", "", "not collected"]
+    checklists = ["ERC000011", "ERC000012", "ERC000020", "ERC000022", "ERC000024", "ERC000025", "ERC000027",
+                  "ERC000055", ""]
+    library_strategies = ["AMPLICON", "WGS", "RNA-Seq", "WGA", "OTHER"]
+    library_sources = ["METAGENOMIC", "GENOMIC", "TRANSCRIPTOMIC", "METATRANSCRIPTOMIC"]
+    instrument_platforms = ["ILLUMINA", "OXFORD_NANOPORE", "PACBIO_SMRT", "ION_TORRENT"]
+    target_genes = ["16S rRNA", "18S rRNA", "COI", "ITS", "12S", ""]
+    tags = ["", "env_tax:marine", "env_tax:freshwater;env_geo:freshwater", "env_tax:terrestrial",
+            "env_tax:marine;env_tax:brackish;env_geo:coastal", "env_geo:marine;env_geo:terrestrial",
+            "pathogen;pathogen:bacterium;env_tax:marine"]
+    tax_divisions = ["PRO", "ENV", "FUN", "PLN", "INV", "VRT", "MAM"]
+
+    def __init__(self, n_studies=100, n_samples=10000, n_runs=20000, n_taxa=2000, seed=42):
+        self.rng = random.Random(seed)
+        self.taxon = self.make_taxa(max(n_taxa, 3))
+        self.study = self.make_studies(max(n_studies, 1))
+        self.sample = self.make_samples(max(n_samples, 1))
+        self.read_run = self.make_runs(n_runs)
+        self.by_result_type = {"study": self.study, "sample": self.sample, "read_run": self.read_run,
+                               "taxon": self.taxon}
+        self._indexes = {}
+        self._index_lock = threading.Lock()
+
+    def make_taxa(self, n_taxa):
+        rng = self.rng
+        taxa = [{"tax_id": "1", "parent": None, "scientific_name": "root", "rank": "no rank", "tax_division": "UNC",
+                 "tag": "", "tax_lineage": "1", "lineage": ""},
+                {"tax_id": "9606", "parent": "1", "scientific_name": "Homo sapiens", "rank": "species",
+                 "tax_division": "HUM", "tag": "", "tax_lineage": "1;9606", "lineage": "Homo; "}]
+        for tax_id in range(2, n_taxa):
+            parent = taxa[rng.randrange(0, len(taxa))] if tax_id < 20 else taxa[rng.randrange(len(taxa) // 2, len(taxa))]
+            if parent["tax_id"] == "9606":
+                parent = taxa[0]
+            name = f"Synthetica {tax_id}"
+            taxa.append({"tax_id": str(tax_id), "parent": parent["tax_id"], "scientific_name": name, "rank": "species",
+                         "tax_division": rng.choice(self.tax_divisions), "tag": rng.choice(self.tags),
+                         "tax_lineage": parent["tax_lineage"] + ";" + str(tax_id),
+                         "lineage": parent["lineage"] + name.split()[0] + "; "})
+        return taxa
+
+    def make_studies(self, n_studies):
+        return [{"study_accession": f"PRJEB{10000 + i}", "secondary_study_accession": f"ERP{10000 + i}",
+                 "study_title": f"Synthetic study {i}"} for i in range(n_studies)]
+
+    def make_samples(self, n_samples):
+        rng = self.rng
+        samples = []
+        for i in range(n_samples):
+            study = rng.choice(self.study)
+            taxon = rng.choice(self.taxon[1:])
+            checklist = rng.choice(self.checklists)
+            samples.append({
+                "sample_accession": f"SAMEA{1000000 + i}",
+                "secondary_sample_accession": f"ERS{1000000 + i}",
+                "study_accession": study["study_accession"],
+                "study_title": study["study_title"],
+                "tax_id": taxon["tax_id"],
+                "scientific_name": taxon["scientific_name"],
+                "tag": taxon["tag"],
+                "country": rng.choice(self.countries),
+                "lat": f"{rng.uniform(-90, 90):.4f}",
+                "lon": f"{rng.uniform(-180, 180):.4f}",
+                "collection_date": rng.choice([f"{rng.randint(1940, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                                               str(rng.randint(1990, 2025)), "missing", ""]),
+                "checklist": checklist,
+                "environmental_sample": rng.choice(["true", "false"]),
+                "ncbi_reporting_standard": "" if checklist else rng.choice(["generic", "MIMS.me.water.6.0", "ENV"]),
+                "broad_scale_environmental_context": rng.choice(["marine biome", "freshwater biome", "terrestrial biome", ""]),
+                "environmental_medium": rng.choice(["sea water", "soil", "sediment", "fresh water", ""]),
+                "target_gene": rng.choice(self.target_genes),
+                "sample_collection": rng.choice(["filtering", "grab sample", ""]),
+                "description": f"Synthetic sample {i}",
+                "sample_description": f"Synthetic sample {i}"
+            })
+        return samples
+
+    def make_runs(self, n_runs):
+        rng = self.rng
+        runs = []
+        for i in range(n_runs):
+            sample = self.sample[i % len(self.sample)] if i < len(self.sample) else rng.choice(self.sample)
+            run = dict(sample)
+            del run["secondary_sample_accession"]
+            first_public = f"{rng.randint(2010, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            run.update({
+                "run_accession": f"ERR{10000000 + i}",
+                "experiment_accession": f"ERX{10000000 + i}",
+                "library_strategy": rng.choice(self.library_strategies),
+                "library_source": rng.choice(self.library_sources),
+                "instrument_platform": rng.choice(self.instrument_platforms),
+                "first_public": first_public,
+                "last_updated": first_public,
+                "fastq_ftp": f"ftp.sra.ebi.ac.uk/vol1/fastq/ERR{10000000 + i}.fastq.gz",
+                "fastq_bytes": str(rng.randint(10 ** 5, 10 ** 9))
+            })
+            runs.append(run)
+        return runs
+
+    def get_index(self, result_type, field):
+        """
+        lazily built dict of field value to the rows with it
+        """
+        key = (result_type, field)
+        if key not in self._indexes:
+            with self._index_lock:
+                if key not in self._indexes:
+                    index = {}
+                    for row in self.by_result_type[result_type]:
+                        index.setdefault(row.get(field, ""), []).append(row)
+                    self._indexes[key] = index
+        return self._indexes[key]
+
+    def get_subtree_tax_ids(self, tax_id):
+        return {row["tax_id"] for row in self.taxon if tax_id in row["tax_lineage"].split(";")}
+
+
+class QueryParseError(Exception):
+    pass
+
+
+def tokenise_query(query):
+    """
+    :param query: e.g. '(environmental_sample=true OR (CHECKLIST="ERC000012")) AND not_tax_tree(9606)'
+    :return: list of tokens
+    """
+    token_re = re.compile(r'\s*(\(|\)|[A-Za-z_]+\(\s*\d+\s*\)|[A-Za-z_]+\s*(?:>=|<=|=|>|<)\s*"[^"]*"|[A-Za-z_]+\s*(?:>=|<=|=|>|<)\s*[^\s()]+|AND\b|OR\b|NOT\b)',
+                          re.IGNORECASE)
+    tokens = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        match = token_re.match(query, pos)
+        if match is None:
+            raise QueryParseError(f"can not parse the query at: {query[pos:pos + 30]}")
+        tokens.append(match.group(1).strip())
+        pos = match.end()
+        while pos < len(query) and query[pos].isspace():
+            pos += 1
+    return tokens
+
+
+class QueryParser:
+    """
+    recursive descent parser, giving a predicate function of a row
+    N.B. a run of field="X" OR field="Y" ... on the same field becomes a set look up, as the packed queries can have
+    thousands of clauses
+    """
+
+    def __init__(self, tables, tokens):
+        self.tables = tables
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos].upper() if self.pos < len(self.tokens) else None
+
+    def parse(self):
+        predicate = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise QueryParseError(f"unexpected {self.tokens[self.pos]}")
+        return predicate
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.peek() == "OR":
+            self.pos += 1
+            terms.append(self.parse_and())
+        if len(terms) == 1:
+            return terms[0]
+        set_terms = {}
+        other_terms = []
+        for term in terms:
+            if getattr(term, "equals", None) is not None:
+                set_terms.setdefault(term.equals[0], set()).add(term.equals[1])
+            else:
+                other_terms.append(term)
+        for field, values in set_terms.items():
+            other_terms.append(lambda row, field=field, values=values: row.get(field, "").lower() in values)
+        return lambda row: any(term(row) for term in other_terms)
+
+    def parse_and(self):
+        factors = [self.parse_not()]
+        while self.peek() == "AND":
+            self.pos += 1
+            factors.append(self.parse_not())
+        if len(factors) == 1:
+            return factors[0]
+        return lambda row: all(factor(row) for factor in factors)
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.pos += 1
+            inner = self.parse_not()
+            return lambda row: not inner(row)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        if self.pos >= len(self.tokens):
+            raise QueryParseError("query ended early")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        if token == "(":
+            predicate = self.parse_or()
+            if self.peek() != ")":
+                raise QueryParseError("missing )")
+            self.pos += 1
+            return predicate
+        function_match = re.fullmatch(r'([A-Za-z_]+)\(\s*(\d+)\s*\)', token)
+        if function_match:
+            return self.make_tax_predicate(function_match.group(1).lower(), function_match.group(2))
+        (field, operator, value) = re.fullmatch(r'([A-Za-z_]+)\s*(>=|<=|=|>|<)\s*(.*)', token).groups()
+        field = field.lower()
+        value = value.strip().strip('"').lower()
+        if operator != "=":   # e.g. last_updated>=2024-01-01, the YYYY-MM-DD dates compare as strings
+            compare = {">=": str.__ge__, "<=": str.__le__, ">": str.__gt__, "<": str.__lt__}[operator]
+            return lambda row: row.get(field, "") != "" and compare(row.get(field, "").lower(), value)
+        if "*" in value:
+            return lambda row: fnmatch.fnmatchcase(row.get(field, "").lower(), value)
+
+        def equals(row):
+            return row.get(field, "").lower() == value
+        equals.equals = (field, value)
+        return equals
+
+    def make_tax_predicate(self, function_name, tax_id):
+        if function_name == "tax_eq":
+            return lambda row: row.get("tax_id") == tax_id
+        subtree = self.tables.get_subtree_tax_ids(tax_id)
+        if function_name == "tax_tree":
+            return lambda row: row.get("tax_id") in subtree
+        if function_name == "not_tax_tree":
+            return lambda row: row.get("tax_id") not in subtree
+        raise QueryParseError(f"{function_name} is not supported")
+
+
+class PortalApiStandIn:
+    """
+    stand_in = PortalApiStandIn(n_samples=1000)
+    stand_in.start()
+    url = stand_in.get_url()     # e.g. http://127.0.0.1:43123/ena/portal/api/
+    stand_in.stop()
+    """
+
+    def __init__(self, n_studies=100, n_samples=10000, n_runs=20000, n_taxa=2000, latency=0.0,
+                 latency_per_record=0.0, error_rate=0.0, error_statuses=(500, 503), seed=42, host="127.0.0.1", port=0,
+                 max_body_bytes=None):
+        self.tables = SyntheticPortalTables(n_studies, n_samples, n_runs, n_taxa, seed)
+        self.latency = latency
+        self.latency_per_record = latency_per_record
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.max_body_bytes = max_body_bytes   # None for no limit
+        self.host = host
+        self.port = port
+        self._rng = random.Random(seed)
+        self._stats_lock = threading.Lock()
+        self.request_total = 0
+        self.error_total = 0
+        self.bytes_total = 0
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), PortalApiRequestHandler)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+        logger.info(f"portal API stand-in serving at {self.get_url()}")
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get_url(self):
+        return f"http://{self.host}:{self.port}/ena/portal/api/"
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {"requests": self.request_total, "errors": self.error_total, "bytes": self.bytes_total}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.request_total = self.error_total = self.bytes_total = 0
+
+    def record_request(self, status, size):
+        with self._stats_lock:
+            self.request_total += 1
+            self.bytes_total += size
+            if status != 200:
+                self.error_total += 1
+
+    def pick_injected_error(self):
+        with self._stats_lock:
+            if self.error_rate > 0 and self._rng.random() < self.error_rate:
+                return self._rng.choice(self.error_statuses)
+        return None
+
+    def select_rows(self, params):
+        """
+        :param params: dict of the request params
+        :return: list of the matching rows
+        """
+        result_type = params.get("result", "")
+        if result_type not in self.tables.by_result_type:
+            raise QueryParseError(f"result={result_type} is not supported")
+        include_accessions = params.get("includeAccessions", "")
+        if include_accessions:
+            accession_type = params.get("includeAccessionType", params.get("include_accession_type", ""))
+            field = get_accession_type_fields().get(accession_type, get_primary_key_by_result_type()[result_type])
+            index = self.tables.get_index(result_type, field)
+            rows = []
+            for accession in dict.fromkeys(include_accessions.split(",")):
+                rows.extend(index.get(accession.strip(), []))
+        else:
+            rows = self.tables.by_result_type[result_type]
+        query = params.get("query", "")
+        if query:
+            predicate = QueryParser(self.tables, tokenise_query(query)).parse()
+            rows = [row for row in rows if predicate(row)]
+        offset = int(params.get("offset", 0) or 0)
+        limit = int(params.get("limit", 0) or 0)
+        rows = rows[offset:]
+        if limit > 0:
+            rows = rows[:limit]
+        return rows
+
+    def select_filereport_rows(self, params):
+        result_type = params.get("result", "read_run")
+        accession = params.get("accession", "")
+        rows = []
+        for field in ("run_accession", "experiment_accession", "sample_accession", "study_accession"):
+            if field in self.tables.by_result_type[result_type][0]:
+                rows.extend(self.tables.get_index(result_type, field).get(accession, []))
+        return rows
+
+    @staticmethod
+    def format_rows(rows, params, default_format):
+        result_type = params.get("result", "")
+        fields = [field for field in params.get("fields", "").split(",") if field]
+        if not fields:
+            fields = [get_primary_key_by_result_type().get(result_type, "accession")]
+        records = [{field: row.get(field, "") for field in fields} for row in rows]
+        if params.get("format", default_format) == "tsv":
+            lines = ["\t".join(fields)] + ["\t".join(record[field] for field in fields) for record in records]
+            return "\n".join(lines) + "\n", "text/plain"
+        return json.dumps(records), "application/json"
+
+
+class PortalApiRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, as with the real portal
+    disable_nagle_algorithm = True  # else the body, written after the headers, waits on a delayed ACK
+
+    def log_message(self, format, *args):
+        logger.debug("stand-in " + format % args)
+
+    def do_GET(self):
+        self.handle_portal_request(dict(parse_qsl(urlsplit(self.path).query, keep_blank_values = True)))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8")
+        stand_in = self.server.stand_in
+        if stand_in.max_body_bytes is not None and length > stand_in.max_body_bytes:
+            self.send_text(413, f"the body of {length} bytes is over {stand_in.max_body_bytes}", "text/plain")
+            return
+        params = dict(parse_qsl(urlsplit(self.path).query, keep_blank_values = True))
+        params.update(parse_qsl(body, keep_blank_values = True))
+        self.handle_portal_request(params)
+
+    def handle_portal_request(self, params):
+        stand_in = self.server.stand_in
+        endpoint = urlsplit(self.path).path.rstrip("/").rsplit("/", 1)[-1]
+        status = 200
+        try:
+            if endpoint == "search":
+                rows = stand_in.select_rows(params)
+                (text, content_type) = stand_in.format_rows(rows, params, "json")
+            elif endpoint == "count":
+                rows = stand_in.select_rows(dict(params, limit = 0))
+                (text, content_type) = (str(len(rows)), "text/plain")
+            elif endpoint == "filereport":
+                rows = stand_in.select_filereport_rows(params)
+                (text, content_type) = stand_in.format_rows(rows, params, "tsv")
+            else:
+                (status, rows, text, content_type) = (404, [], f"{endpoint} is not a supported endpoint", "text/plain")
+        except (QueryParseError, ValueError) as err:
+            (status, rows, text, content_type) = (400, [], str(err), "text/plain")
+        time.sleep(stand_in.latency + stand_in.latency_per_record * len(rows))
+        injected_status = stand_in.pick_injected_error()
+        if injected_status is not None:
+            (status, text, content_type) = (injected_status, "injected error", "text/plain")
+        self.send_text(status, text, content_type)
+
+    def send_text(self, status, text, content_type):
+        body = text.encode("utf-8")
+        # before the reply, so the stats are up to date when it arrives
+        self.server.stand_in.record_request(status, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    prog_des = "Run a local stand-in for the ENA portal API, serving synthetic data"
+    parser = argparse.ArgumentParser(description = prog_des)
+    parser.add_argument("-p", "--port", type = int, default = 8765, required = False)
+    parser.add_argument("-s", "--n_samples", type = int, default = 10000, required = False)
+    parser.add_argument("-r", "--n_runs", type = int, default = 20000, required = False)
+    parser.add_argument("-l", "--latency", type = float, default = 0.0, required = False,
+                        help = "seconds added to every request")
+    parser.add_argument("-e", "--error_rate", type = float, default = 0.0, required = False,
+                        help = "fraction of the requests given a 5xx")
+    parser.add_argument("-b", "--max_body_bytes", type = int, default = None, required = False,
+                        help = "POST bodies bigger than this are given a 413")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.INFO)
+    stand_in = PortalApiStandIn(n_samples = args.n_samples, n_runs = args.n_runs, latency = args.latency,
+                                error_rate = args.error_rate, port = args.port, max_body_bytes = args.max_body_bytes)
+    stand_in.start()
+    print(f"export ENA_PORTAL_API_URL={stand_in.get_url()}")
+    try:
+        stand_in.thread.join()
+    except KeyboardInterrupt:
+        stand_in.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Script of portal_response_cache.py is to provide a persistent on-disk cache of ENA portal API responses
+
+The cache is a SQLite file keyed on a hash of the URL plus the normalised params, so it replaces the
+ad-hoc un-keyed pickles. Each result type (taxon, sample, read_run etc.) has its own time to live,
+the file is size bounded with least recently used eviction and hits/misses are counted.
+A single response over max_entry_bytes is not cached, so that a caller streaming a big body need not keep it all.
+It is off unless switched on, e.g. export ENA_PORTAL_CACHE=1, as it serves responses up to their TTL old,
+and the file is in the script directory, so every run shares the one cache wherever it is started from.
+
+usage:
+    configure_portal_cache(enabled = True)
+    cache = get_portal_cache()
+    text = cache.get(url, params)
+    if text is None:
+        cache.put(url, params, response.text)
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x portal_response_cache.py
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl
+
+logger = logging.getLogger(name = 'mylogger')
+
+ONE_DAY = 24 * 60 * 60
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_default_ttl_by_result_type():
+    """
+    seconds each result type is trusted for, taxonomy changes rarely, the run and sample records daily
+    :return: dict
+    """
+    return {
+        "taxon": 30 * ONE_DAY,
+        "study": 7 * ONE_DAY,
+        "sample": ONE_DAY,
+        "read_run": ONE_DAY,
+        "read_experiment": ONE_DAY
+    }
+
+
+class CachedResponse:
+    """
+    enough of a requests.Response for the portal API callers, which only look at status_code and text
+    """
+
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+        self.status_code = 200
+        self.from_cache = True
+
+    def json(self):
+        return json.loads(self.text)
+
+    def __repr__(self):
+        return f"<CachedResponse [{self.status_code}]>"
+
+
+class PortalResponseCache:
+    """
+    SQLite backed cache of portal API response bodies
+    N.B. the connection is shared between threads, so all access is behind a lock
+    """
+
+    def __init__(self, db_file, max_bytes=2 * 1024 ** 3, ttl_by_result_type=None, default_ttl=ONE_DAY,
+                 max_entry_bytes=64 * 1024 ** 2):
+        self.db_file = db_file
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_bytes, max_entry_bytes)
+        self.ttl_by_result_type = get_default_ttl_by_result_type()
+        if ttl_by_result_type is not None:
+            self.ttl_by_result_type.update(ttl_by_result_type)
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread = False, isolation_level = None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS response_cache (
+                                  cache_key TEXT PRIMARY KEY,
+                                  url TEXT,
+                                  result_type TEXT,
+                                  body TEXT,
+                                  size INTEGER,
+                                  created REAL,
+                                  last_accessed REAL)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_last_accessed ON response_cache(last_accessed)")
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+
+    @staticmethod
+    def normalise_params(url, params):
+        """
+        folds any query string in the url into the params, so the same query written either way shares a key
+        :param url:
+        :param params: dict or None
+        :return: (base_url, sorted list of (key, value) string pairs)
+        """
+        split_url = urlsplit(url)
+        base_url = f"{split_url.scheme}://{split_url.netloc}{split_url.path}"
+        all_params = dict(parse_qsl(split_url.query, keep_blank_values = True))
+        if params:
+            all_params.update(params)
+        return base_url, sorted((str(key), str(value).strip()) for key, value in all_params.items())
+
+    def make_key(self, url, params):
+        base_url, norm_params = self.normalise_params(url, params)
+        return hashlib.sha256(json.dumps([base_url, norm_params]).encode("utf-8")).hexdigest()
+
+    def get_result_type(self, url, params):
+        base_url, norm_params = self.normalise_params(url, params)
+        return dict(norm_params).get("result", "")
+
+    def get_ttl(self, result_type):
+        return self.ttl_by_result_type.get(result_type, self.default_ttl)
+
+    def get(self, url, params):
+        """
+        :param url:
+        :param params:
+        :return: the cached body text, or None if not there or expired
+        """
+        cache_key = self.make_key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT body, result_type, created, size FROM response_cache WHERE cache_key = ?",
+                                     (cache_key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            body, result_type, created, size = row
+            if now - created > self.get_ttl(result_type):
+                self._conn.execute("DELETE FROM response_cache WHERE cache_key = ?", (cache_key,))
+                self.total_bytes -= size
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE response_cache SET last_accessed = ? WHERE cache_key = ?", (now, cache_key))
+            self.hits += 1
+        return body
+
+    def put(self, url, params, body):
+        """
+        stores the body, then evicts the least recently used entries if over max_bytes.
+        A body over max_entry_bytes is not stored
+        :param url:
+        :param params:
+        :param body: response text
+        :return:
+        """
+        cache_key = self.make_key(url, params)
+        result_type = self.get_result_type(url, params)
+        size = len(body.encode("utf-8"))
+        if size > self.max_entry_bytes:
+            logger.debug(f"not caching {url} as {size} bytes is over the max_entry_bytes of {self.max_entry_bytes}")
+            return
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM response_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+            if old is not None:
+                self.total_bytes -= old[0]
+            self._conn.execute("INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (cache_key, url, result_type, body, size, now, now))
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        drops least recently used entries until back under 90% of max_bytes, is called with the lock held
+        """
+        target_bytes = int(self.max_bytes * 0.9)
+        cursor = self._conn.execute("SELECT cache_key, size FROM response_cache ORDER BY last_accessed")
+        to_delete = []
+        for cache_key, size in cursor:
+            if self.total_bytes <= target_bytes:
+                break
+            to_delete.append((cache_key,))
+            self.total_bytes -= size
+        self._conn.executemany("DELETE FROM response_cache WHERE cache_key = ?", to_delete)
+        self.evictions += len(to_delete)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+            self.total_bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups > 0 else 0.0,
+            "entries": entries,
+            "total_bytes": self.total_bytes
+        }
+
+    def print_summary(self):
+        out_string = f"*** Summary of portal response cache {self.db_file} ***\n"
+        for key, value in self.get_stats().items():
+            out_string += f"{key.ljust(30)}: {value}\n"
+        return out_string
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_default_cache_file():
+    """
+    :return: in the script directory, rather than the working dir, so that there is the one cache
+    """
+    return os.path.join(script_dir, "portal_api_cache.sqlite")
+
+
+_cache_settings = {
+    # off unless e.g. export ENA_PORTAL_CACHE=1, as the responses it serves can be up to their TTL old
+    "enabled": os.environ.get("ENA_PORTAL_CACHE", "") == "1",
+    "db_file": get_default_cache_file(),
+    "max_bytes": 2 * 1024 ** 3,
+    "max_entry_bytes": 64 * 1024 ** 2,
+    "ttl_by_result_type": None
+}
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure_portal_cache(enabled=None, db_file=None, max_bytes=None, ttl_by_result_type=None, max_entry_bytes=None):
+    """
+    change the settings of the shared cache, the next get_portal_cache() rebuilds it
+    e.g. configure_portal_cache(enabled=True) to use the cache, by default every call goes to the portal
+    :param enabled:
+    :param db_file:
+    :param max_bytes:
+    :param ttl_by_result_type: dict of result type to seconds, is merged into the defaults
+    :param max_entry_bytes: biggest single response body that is cached
+    :return: the settings dict
+    """
+    global _cache
+    with _cache_lock:
+        if enabled is not None:
+            _cache_settings["enabled"] = enabled
+        if db_file is not None:
+            _cache_settings["db_file"] = db_file
+        if max_bytes is not None:
+            _cache_settings["max_bytes"] = max_bytes
+        if ttl_by_result_type is not None:
+            _cache_settings["ttl_by_result_type"] = ttl_by_result_type
+        if max_entry_bytes is not None:
+            _cache_settings["max_entry_bytes"] = max_entry_bytes
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+    return _cache_settings
+
+
+def get_portal_cache():
+    """
+    lazily opens the shared cache
+    :return: PortalResponseCache or None if caching is disabled
+    """
+    global _cache
+    if not _cache_settings["enabled"]:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PortalResponseCache(_cache_settings["db_file"],
+                                             max_bytes = _cache_settings["max_bytes"],
+                                             ttl_by_result_type = _cache_settings["ttl_by_result_type"],
+                                             max_entry_bytes = _cache_settings["max_entry_bytes"])
+                logger.info(f"portal API responses are cached in {_cache.db_file}, so may be up to their TTL old "
+                            f"(default {_cache.default_ttl}s, {_cache.ttl_by_result_type}); "
+                            f"configure_portal_cache(enabled=False) or unset ENA_PORTAL_CACHE to always go "
+                            f"to the portal")
+    return _cache
+
+
+def main():
+    configure_portal_cache(enabled = True)
+    cache = get_portal_cache()
+    print(cache.print_summary())
+
+
+if __name__ == '__main__':
+    main()
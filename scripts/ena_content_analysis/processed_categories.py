@@ -14,6 +14,8 @@ import argparse
 from ena_portal_api import ena_portal_api_call, get_ena_portal_url, chunk_portal_api_call
 from itertools import islice
 import sys
+import pandas as pd
+from accession_bitmap import AccessionBitmap, get_intersection, get_union
 
 
 class ProcessedCategory:
@@ -29,6 +31,7 @@ class ProcessedCategory:
         #intialise:
         self._category = category
         self._sample_accs_by_specific_category = sample_accs_by_specific_category
+        self._sample_bitmap = None
 
     def print_summary(self):
         print(f"category={self._category}")
@@ -49,12 +52,25 @@ class ProcessedCategory:
     def get_sample_collection_obj(self):
         return self._sample_accs_by_specific_category['sample_collection_obj']
 
+    def get_category(self):
+        return self._category
+
+    def get_sample_bitmap(self):
+        """
+        the sample_acc_list as an AccessionBitmap, made once
+        :return: AccessionBitmap
+        """
+        if self._sample_bitmap is None:
+            self._sample_bitmap = AccessionBitmap.from_accessions(self.get_sample_acc_list())
+        return self._sample_bitmap
+
 class ProcessedCategories:
     """
     processed_categories_obj = processed_categories(sample_accs_by_category ):
     """
     def __init__(self, sample_accs_by_category):
         self._sample_accs_by_category = sample_accs_by_category
+        self._category_obj_by_category = {}
 
     def print_summary(self):
         logger.info(self.get_category_list())
@@ -78,6 +94,42 @@ class ProcessedCategories:
         logger.info("...............................................................")
         return objects
 
+    def get_category_obj(self, category):
+        """
+        :param category:
+        :return: ProcessedCategory, made once
+        """
+        if category not in self._category_obj_by_category:
+            self._category_obj_by_category[category] = ProcessedCategory(category,
+                                                                         self._sample_accs_by_category[category])
+        return self._category_obj_by_category[category]
+
+    def get_intersection(self, categories):
+        """
+        :param categories: list of category names
+        :return: AccessionBitmap of the samples in all of them
+        """
+        return get_intersection([self.get_category_obj(category).get_sample_bitmap() for category in categories])
+
+    def get_union(self, categories):
+        """
+        :param categories: list of category names
+        :return: AccessionBitmap of the samples in any of them
+        """
+        return get_union([self.get_category_obj(category).get_sample_bitmap() for category in categories])
+
+    def get_overlap_table(self, categories=None):
+        """
+        the number of samples in common for each pair of categories, the diagonal is the category total
+        :param categories: defaults to all
+        :return: DataFrame
+        """
+        if categories is None:
+            categories = self.get_category_list()
+        bitmaps = [self.get_category_obj(category).get_sample_bitmap() for category in categories]
+        return pd.DataFrame([[len(row_bitmap & column_bitmap) for column_bitmap in bitmaps] for row_bitmap in bitmaps],
+                            index = categories, columns = categories)
+
 def main():
     pass
 
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""Script of readrun_dataset.py is to store the read_run detail intermediates as a partitioned Parquet dataset
+
+Replaces the pickles (and the duplicate .json) of the read_run records. The dataset is a directory
+<name>.parquet/query_type=.../checklist=.../*.parquet, with the string columns dictionary encoded and zstd
+compressed, so it is a fraction of the size of the pickle. A reader only reads the columns it asks for and,
+with filters on query_type or checklist, only those partition directories.
+Where there is no dataset yet, but the old pickle is there, that is read instead (and filtered the same way).
+As the pickles were one per query_type, that is also the case where the query_type asked for has no partition yet.
+
+usage:
+    save_readrun_frame(df, "env_readrun_detail")
+    df = load_readrun_frame("env_readrun_detail", columns = ['run_accession', 'tax_id'],
+                            filters = {'query_type': ['environmental_checklists']})
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x readrun_dataset.py
+"""
+
+import logging
+import os
+from urllib.parse import quote
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(name = 'mylogger')
+
+EMPTY_PARTITION = "_empty_"   # a directory can not be called checklist= so "" is stored as this
+
+
+def get_readrun_partition_cols():
+    return ['query_type', 'checklist']
+
+
+def get_dataset_dir(name):
+    """
+    :param name: e.g. env_readrun_detail
+    :return: the dataset directory, in the working dir as with the pickles
+    """
+    return f"{name}.parquet"
+
+
+def get_partition_filters(filters, partition_cols):
+    """
+    :param filters: dict of column to a value or a list of values e.g. {'query_type': ['default_checklists']}
+    :param partition_cols:
+    :return: list of pyarrow filter tuples, or None
+    """
+    if not filters:
+        return None
+    filter_list = []
+    for column, values in filters.items():
+        if isinstance(values, str):
+            values = [values]
+        if column in partition_cols:
+            values = [value if value != "" else EMPTY_PARTITION for value in values]
+        filter_list.append((column, 'in', list(values)))
+    return filter_list
+
+
+def get_partition_dir(dataset_dir, partition_values):
+    """
+    :param dataset_dir:
+    :param partition_values: list of (column, value) in the partition_cols order e.g. [('query_type', 'default_checklists')]
+    :return: the hive partition directory, as written by write_readrun_dataset()
+    """
+    segments = [f"{column}={quote(value if value != '' else EMPTY_PARTITION, safe = '')}"
+                for (column, value) in partition_values]
+    return os.path.join(dataset_dir, *segments)
+
+
+def write_readrun_dataset(df, dataset_dir, partition_cols=None):
+    """
+    writes df as a hive partitioned Parquet dataset.
+    Only the partitions present in df are replaced, so e.g. one query_type at a time can be (re)written
+    :param df: DataFrame
+    :param dataset_dir:
+    :param partition_cols: defaults to get_readrun_partition_cols()
+    :return: number of rows written
+    """
+    if partition_cols is None:
+        partition_cols = get_readrun_partition_cols()
+    df = df.copy()
+    for column in partition_cols:
+        if column not in df.columns:
+            df[column] = ""
+        df[column] = df[column].fillna("").astype(str).replace("", EMPTY_PARTITION)
+    table = pa.Table.from_pandas(df, preserve_index = False)
+    pq.write_to_dataset(table, root_path = dataset_dir, partition_cols = partition_cols,
+                        existing_data_behavior = 'delete_matching', use_dictionary = True, compression = 'zstd')
+    logger.info(f"written {len(df)} rows to the dataset {dataset_dir} partitioned by {partition_cols}")
+    return len(df)
+
+
+def get_dataset_schema(dataset_dir, partition_cols=None, as_category=False):
+    """
+    the schema unified over every file, as pyarrow otherwise takes it from the first file only, and a column
+    that was added later (e.g. to environment_fields_to_retrieve) would be silently dropped
+    :param dataset_dir:
+    :param partition_cols: defaults to get_readrun_partition_cols(), these are read as plain strings
+    :param as_category: if True the string columns are read dictionary encoded
+    :return: pyarrow schema
+    """
+    if partition_cols is None:
+        partition_cols = get_readrun_partition_cols()
+    dataset = pq.ParquetDataset(dataset_dir, partitioning = 'hive')
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.fragments],
+                              promote_options = 'permissive')
+    fields = []
+    for field in schema:
+        if field.name in partition_cols:
+            continue
+        if as_category and (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+            field = pa.field(field.name, pa.dictionary(pa.int32(), field.type))
+        fields.append(field)
+    fields.extend(pa.field(column, pa.string()) for column in partition_cols)
+    return pa.schema(fields)
+
+
+def read_readrun_dataset(dataset_dir, columns=None, filters=None, memory_map=False, as_category=False,
+                         partition_cols=None):
+    """
+    :param dataset_dir:
+    :param columns: list of the columns wanted, None for all
+    :param filters: see get_partition_filters(), on the partition columns only the matching directories are read
+    :param memory_map: memory map the files rather than reading them into buffers
+    :param as_category: if True the dictionary encoded columns stay as pandas categories, else plain strings
+    :param partition_cols: defaults to get_readrun_partition_cols()
+    :return: DataFrame
+    """
+    if partition_cols is None:
+        partition_cols = get_readrun_partition_cols()
+    schema = get_dataset_schema(dataset_dir, partition_cols, as_category)
+    if columns is not None:   # a column that no file has yet is left out, rather than failing the read
+        columns = [column for column in columns if column in schema.names]
+    table = pq.read_table(dataset_dir, columns = columns, filters = get_partition_filters(filters, partition_cols),
+                          memory_map = memory_map, partitioning = 'hive', schema = schema)
+    df = table.to_pandas()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and (column in partition_cols or not as_category):
+            df[column] = df[column].astype(object)
+        if column in partition_cols:
+            df[column] = df[column].replace(EMPTY_PARTITION, "")
+            if as_category:
+                df[column] = df[column].astype('category')
+    logger.info(f"read {len(df)} rows, {len(df.columns)} columns from the dataset {dataset_dir}")
+    return df
+
+
+def has_query_type_partitions(dataset_dir, filters):
+    """
+    :param dataset_dir:
+    :param filters: see get_partition_filters()
+    :return: False if the dataset does not exist, or filters has query_types none of which have a partition in it
+    """
+    if not os.path.isdir(dataset_dir):
+        return False
+    query_types = (filters or {}).get('query_type')
+    if query_types is None:
+        return True
+    if isinstance(query_types, str):
+        query_types = [query_types]
+    return any(os.path.isdir(get_partition_dir(dataset_dir, [('query_type', query_type)]))
+               for query_type in query_types)
+
+
+def save_readrun_frame(df, name, partition_cols=None):
+    """
+    :param df: DataFrame or list of record dicts
+    :param name: e.g. df_aquatic_env_readrun_detail, see get_dataset_dir()
+    :param partition_cols:
+    :return: the dataset directory
+    """
+    if not isinstance(df, pd.DataFrame):
+        df = pd.DataFrame.from_records(df)
+    dataset_dir = get_dataset_dir(name)
+    write_readrun_dataset(df, dataset_dir, partition_cols)
+    return dataset_dir
+
+
+def load_readrun_frame(name, columns=None, filters=None, memory_map=False, as_category=False, pickle_file=None,
+                       partition_cols=None):
+    """
+    the dataset if there is one, else the old pickle (DataFrame or list of records), with the same
+    column and filter selection, else None. The pickle is also read where the dataset exists, but not the
+    query_type partitions asked for, i.e. one query_type was migrated to the dataset but not yet the other
+    :param name: see get_dataset_dir()
+    :param columns:
+    :param filters: see get_partition_filters()
+    :param memory_map:
+    :param as_category:
+    :param pickle_file: defaults to <name>.pickle
+    :param partition_cols: defaults to get_readrun_partition_cols()
+    :return: DataFrame or None
+    """
+    dataset_dir = get_dataset_dir(name)
+    if pickle_file is None:
+        pickle_file = f"{name}.pickle"
+    if has_query_type_partitions(dataset_dir, filters) or (os.path.isdir(dataset_dir) and
+                                                           not os.path.exists(pickle_file)):
+        return read_readrun_dataset(dataset_dir, columns, filters, memory_map, as_category, partition_cols)
+    if not os.path.exists(pickle_file):
+        return None
+    logger.warning(f"nothing of {filters} in {dataset_dir} yet, so reading {pickle_file}, "
+                   f"save_readrun_frame() would write it to the dataset")
+    df = pd.read_pickle(pickle_file)
+    if not isinstance(df, pd.DataFrame):
+        df = pd.DataFrame.from_records(df)
+    for column, values in (filters or {}).items():
+        if isinstance(values, str):
+            values = [values]
+        df = df[df[column].fillna("").isin(values)]
+    if columns is not None:   # as with the dataset, a column it does not have is left out
+        df = df[[column for column in columns if column in df.columns]]
+    return df
+
+
+def main():
+    df = pd.DataFrame({'run_accession': ['ERR1', 'ERR2', 'ERR3'], 'tax_id': ['1', '2', '3'],
+                       'query_type': ['default_checklists', 'environmental_checklists', 'environmental_checklists'],
+                       'checklist': ['ERC000011', '', 'ERC000012']})
+    save_readrun_frame(df, "test_readrun_dataset")
+    print(load_readrun_frame("test_readrun_dataset", columns = ['run_accession', 'checklist'],
+                             filters = {'query_type': 'environmental_checklists'}))
+
+
+if __name__ == '__main__':
+    main()
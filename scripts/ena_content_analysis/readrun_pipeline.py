@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Script of readrun_pipeline.py is to run the read_run analysis stages as a lazy plan over the read_run dataset
+
+The stages are only recorded, with the columns each of them reads, until collect(). The dataset is then
+scanned once, with the row filters (e.g. library_strategy in [...]) pushed down into the Parquet read, so the
+rows filtered away are never loaded, and only the union of the columns the stages read (the projection).
+The stages are then run in order on that one frame: each adds its columns to it, or returns a filtered
+frame, so there is no copy of the full frame between them.
+run() is the same plan on a frame that is already loaded, i.e. the row filters are applied first, in memory.
+As the rows filtered away are never loaded, a report on them (e.g. the value counts before the filters) is
+registered with report_before_filters(), and collect() gives it a separate scan of only the columns it reads.
+
+usage:
+    pipeline = LazyReadrunPipeline("env_readrun_detail", filters = {'query_type': ['environmental_checklists']})
+    pipeline.filter_isin('library_strategy', ['AMPLICON', 'WGS'])
+    pipeline.stage("clean_df", clean_df, ['lat', 'lon'])
+    logger.info(pipeline.explain())
+    df = pipeline.collect()
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x readrun_pipeline.py
+"""
+
+import logging
+import sys
+import time
+import pandas as pd
+from readrun_dataset import get_dataset_dir, load_readrun_frame
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+class LazyReadrunPipeline:
+    """
+    the plan: partition filters, row filters and the stages, in order
+    """
+
+    def __init__(self, name, filters=None, pickle_file=None, columns=None):
+        """
+        :param name: the read_run dataset, see get_dataset_dir()
+        :param filters: on the partition columns, see get_partition_filters()
+        :param pickle_file: read if there is no dataset, see load_readrun_frame()
+        :param columns: any extra columns to read, as well as those the stages read
+        """
+        self.name = name
+        self.filters = dict(filters or {})
+        self.pickle_file = pickle_file
+        self.extra_columns = list(columns or [])
+        self.row_filters = {}
+        self.stages = []
+        self.reports_before_filters = []
+
+    def filter_isin(self, column, values):
+        """
+        keeps the rows where column is one of values, pushed down into the dataset read
+        :return: self, so the calls can be chained
+        """
+        if isinstance(values, str):
+            values = [values]
+        self.row_filters[column] = list(values)
+        return self
+
+    def stage(self, stage_name, function, columns):
+        """
+        :param stage_name: for the log and explain()
+        :param function: of the frame, returning the (new) frame, or None where it only reports on it
+        :param columns: the dataset columns the function reads, that are not added by an earlier stage.
+                        Any not in the dataset are left out of the read, None if it needs them all
+        :return: self
+        """
+        self.stages.append((stage_name, function, None if columns is None else list(columns)))
+        return self
+
+    def report_before_filters(self, report_name, function, columns):
+        """
+        :param report_name: for the log and explain()
+        :param function: of the frame before the row filters (but after the partition filters), its return is ignored
+        :param columns: the dataset columns the function reads
+        :return: self
+        """
+        self.reports_before_filters.append((report_name, function, list(columns)))
+        return self
+
+    def get_scan_columns(self):
+        """
+        :return: the projection, in the order first needed, None for all the columns
+        """
+        scan_columns = []
+        for columns in [self.extra_columns, list(self.row_filters)] + [columns for (_, _, columns) in self.stages]:
+            if columns is None:
+                return None
+            scan_columns.extend(column for column in columns if column not in scan_columns)
+        return scan_columns
+
+    def get_scan_filters(self):
+        """
+        :return: the partition filters and the row filters, see get_partition_filters()
+        """
+        return {**self.filters, **self.row_filters}
+
+    def explain(self):
+        """
+        :return: multi-line string of the plan
+        """
+        scan_columns = self.get_scan_columns()
+        lines = [f"scan {get_dataset_dir(self.name)}",
+                 f"    columns: {'all' if scan_columns is None else ', '.join(scan_columns)}",
+                 f"    filters: {self.get_scan_filters()}"]
+        lines.extend(f"before the filters: {report_name} of {', '.join(columns)}"
+                     for (report_name, _, columns) in self.reports_before_filters)
+        lines.extend(f"{position}. {stage_name}" for position, (stage_name, _, _) in enumerate(self.stages, 1))
+        return "\n".join(lines)
+
+    def apply_row_filters(self, df, filters=None):
+        """
+        the filters, in memory, for run() or where the read could not push them down
+        :param df:
+        :param filters: None for get_scan_filters()
+        """
+        mask = None
+        if filters is None:
+            filters = self.get_scan_filters()
+        for column, values in filters.items():
+            column_mask = df[column].fillna("").isin(values)
+            mask = column_mask if mask is None else mask & column_mask
+        return df if mask is None or mask.all() else df[mask]
+
+    def run_reports_before_filters(self, df):
+        for (report_name, function, columns) in self.reports_before_filters:
+            function(df[[column for column in columns if column in df.columns]])
+            logger.info(f"pipeline report {report_name} done, rows={len(df)}")
+
+    def run_stages(self, df):
+        for (stage_name, function, _) in self.stages:
+            start_time = time.perf_counter()
+            result = function(df)
+            if result is not None:
+                df = result
+            logger.info(f"pipeline stage {stage_name} done in {time.perf_counter() - start_time:.1f}s, "
+                        f"rows={len(df)}")
+        return df
+
+    def collect(self):
+        """
+        scans the dataset with the filters and projection pushed down, then runs the stages
+        :return: DataFrame, after the last stage
+        """
+        if self.reports_before_filters:
+            report_columns = list(dict.fromkeys(column for (_, _, columns) in self.reports_before_filters
+                                                for column in columns))
+            df = load_readrun_frame(self.name, columns = report_columns, filters = self.filters, memory_map = True,
+                                    pickle_file = self.pickle_file)
+            if df is not None:
+                self.run_reports_before_filters(df)
+        df = load_readrun_frame(self.name, columns = self.get_scan_columns(), filters = self.get_scan_filters(),
+                                memory_map = True, pickle_file = self.pickle_file)
+        if df is None:
+            logger.error(f"neither the {get_dataset_dir(self.name)} dataset nor the pickle exist")
+            sys.exit(1)
+        logger.info(f"pipeline scan of {self.name} rows={len(df)} columns={list(df.columns)}")
+        return self.run_stages(df)
+
+    def run(self, df):
+        """
+        the same plan on a frame that is already loaded
+        :param df: DataFrame
+        :return: DataFrame, after the last stage
+        """
+        if self.reports_before_filters:
+            df = self.apply_row_filters(df, self.filters)
+            self.run_reports_before_filters(df)
+        return self.run_stages(self.apply_row_filters(df))
+
+
+def main():
+    df = pd.DataFrame({'run_accession': ['ERR1', 'ERR2', 'ERR3'], 'library_strategy': ['WGS', 'AMPLICON', 'OTHER'],
+                       'lat': ['1.5', '', '3']})
+    pipeline = LazyReadrunPipeline("test_readrun_dataset").filter_isin('library_strategy', ['WGS', 'AMPLICON'])
+    pipeline.stage("lat", lambda df: df.assign(lat = pd.to_numeric(df['lat'], errors = 'coerce')), ['lat'])
+    print(pipeline.explain())
+    print(pipeline.run(df))
+
+
+if __name__ == '__main__':
+    main()
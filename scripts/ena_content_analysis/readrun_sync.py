@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Script of readrun_sync.py is to incrementally sync the environmental read_run records into the local dataset
+
+Rather than re-downloading the whole environmental (or default checklist) result set, the high-water mark is
+taken from the records already in that query_type partition of the dataset (the latest last_updated, or
+first_public where there is no last_updated), and only the records with last_updated on or after it are
+queried. These are upserted on run_accession: a run that is already there is replaced, a new one is added.
+Only the checklist partitions the changed runs are in (or have moved out of) are rewritten.
+The query is inclusive of the high-water mark day, as last_updated is only a date, so re-running is harmless.
+N.B. runs that are suppressed or made private upstream are not seen by the delta, a full sync drops them.
+
+usage:
+    sync_stats = sync_env_readrun_detail("environmental_checklists", "env_readrun_detail")
+    sync_stats = sync_env_readrun_detail("default_checklists", "env_readrun_detail", full = True)
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x readrun_sync.py
+"""
+
+import logging
+import os
+import shutil
+import pandas as pd
+from ena_api_calls import setup_run_api_batches
+from readrun_dataset import get_dataset_dir, get_partition_dir, read_readrun_dataset, write_readrun_dataset
+
+logger = logging.getLogger(name = 'mylogger')
+
+_readrun_key = "run_accession"
+
+
+def get_high_water_mark(dataset_dir, query_type):
+    """
+    :param dataset_dir:
+    :param query_type: e.g. environmental_checklists
+    :return: the latest last_updated (or first_public) YYYY-MM-DD in that partition, None if there is nothing
+    """
+    if not os.path.isdir(get_partition_dir(dataset_dir, [('query_type', query_type)])):
+        return None
+    df = read_readrun_dataset(dataset_dir, columns = ['first_public', 'last_updated'],
+                              filters = {'query_type': [query_type]})
+    if 'last_updated' not in df.columns:   # written before these fields were retrieved
+        return None
+    dates = df['last_updated'].fillna("")
+    if 'first_public' in df.columns:
+        dates = dates.where(dates != "", df['first_public'].fillna(""))
+    dates = dates[dates != ""]
+    if len(dates) == 0:
+        return None
+    return dates.max()
+
+
+def fetch_readrun_frame(query_type, updated_since=None):
+    """
+    :param query_type:
+    :param updated_since: YYYY-MM-DD or None for everything
+    :return: DataFrame of the records, with the query_type column
+    """
+    frames = [pd.DataFrame.from_records(record_batch)
+              for record_batch in setup_run_api_batches(query_type, 0, updated_since = updated_since)]
+    frames = [frame for frame in frames if len(frame) > 0]
+    df = pd.concat(frames, ignore_index = True) if frames else pd.DataFrame(columns = [_readrun_key, 'checklist'])
+    df['query_type'] = query_type
+    return df
+
+
+def upsert_readrun_frame(df_delta, dataset_dir, query_type):
+    """
+    upserts the records on run_accession into the query_type partition
+    :param df_delta: DataFrame of the new or changed records
+    :param dataset_dir:
+    :param query_type:
+    :return: (inserted, updated) counts
+    """
+    df_delta = df_delta.drop_duplicates(_readrun_key, keep = 'last').copy()
+    df_delta['checklist'] = df_delta['checklist'].fillna("")
+    df_delta['query_type'] = query_type
+    if os.path.isdir(get_partition_dir(dataset_dir, [('query_type', query_type)])):
+        df_located = read_readrun_dataset(dataset_dir, columns = [_readrun_key, 'checklist'],
+                                          filters = {'query_type': [query_type]})
+        df_located = df_located[df_located[_readrun_key].isin(df_delta[_readrun_key])]
+        checklists = set(df_delta['checklist']) | set(df_located['checklist'])
+        df_old = read_readrun_dataset(dataset_dir, filters = {'query_type': [query_type],
+                                                              'checklist': sorted(checklists)})
+    else:
+        df_located = pd.DataFrame(columns = [_readrun_key, 'checklist'])
+        checklists = set(df_delta['checklist'])
+        df_old = pd.DataFrame(columns = df_delta.columns)
+
+    df_merged = pd.concat([df_old[~df_old[_readrun_key].isin(df_delta[_readrun_key])], df_delta],
+                          ignore_index = True)
+    # a column only in the old or only in the new records is "" elsewhere, as in the portal responses
+    df_merged = df_merged.astype(object).fillna("")
+    # write_readrun_dataset only replaces the partitions it writes, so one that the runs all moved out of goes here
+    for checklist in checklists - set(df_merged['checklist']):
+        shutil.rmtree(get_partition_dir(dataset_dir, [('query_type', query_type), ('checklist', checklist)]))
+    if len(df_merged) > 0:
+        write_readrun_dataset(df_merged, dataset_dir)
+    updated = len(df_located)
+    return len(df_delta) - updated, updated
+
+
+def sync_env_readrun_detail(query_type, name="env_readrun_detail", full=False):
+    """
+    :param query_type: environmental_checklists or default_checklists, see get_all_checklist_types()
+    :param name: the dataset, see get_dataset_dir()
+    :param full: if True, or there is no high-water mark yet, everything is fetched and the partition replaced
+    :return: dict of the sync stats
+    """
+    dataset_dir = get_dataset_dir(name)
+    high_water_mark = None if full else get_high_water_mark(dataset_dir, query_type)
+    if high_water_mark is None:
+        logger.info(f"full sync of {query_type} into {dataset_dir}")
+        df_fetched = fetch_readrun_frame(query_type)
+        query_type_dir = get_partition_dir(dataset_dir, [('query_type', query_type)])
+        if os.path.isdir(query_type_dir):
+            shutil.rmtree(query_type_dir)
+    else:
+        logger.info(f"incremental sync of {query_type} into {dataset_dir}, last_updated>={high_water_mark}")
+        df_fetched = fetch_readrun_frame(query_type, updated_since = high_water_mark)
+    (inserted, updated) = upsert_readrun_frame(df_fetched, dataset_dir, query_type)
+    sync_stats = {'query_type': query_type, 'mode': "full" if high_water_mark is None else "incremental",
+                  'high_water_mark': high_water_mark, 'fetched': len(df_fetched), 'inserted': inserted,
+                  'updated': updated}
+    logger.info(f"sync_stats={sync_stats}")
+    return sync_stats
+
+
+def main():
+    for query_type in ["environmental_checklists", "default_checklists"]:
+        print(sync_env_readrun_detail(query_type))
+
+
+if __name__ == '__main__':
+    main()
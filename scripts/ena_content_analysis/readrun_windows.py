@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""Script of readrun_windows.py is to download the environmental read_run query as disjoint windows, concurrently
+
+Rather than one long search of the whole query_type, the query is split into windows that together cover it
+exactly once, either by first_public year or by checklist clause. The windows are fetched in a thread pool
+and each is written to its own partition of a staging dataset <name>.parquet/query_type=.../window=.../
+with a _SUCCESS marker once it is complete. After a crash, or a failed window, re-running only fetches the
+windows without a marker, so the progress made is kept.
+N.B. a run without a first_public (i.e. not public) is in none of the first_public windows.
+
+usage:
+    df = download_readrun_windows("environmental_checklists")
+    df = download_readrun_windows("default_checklists", window_by = "checklist", max_workers = 2)
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x readrun_windows.py
+"""
+
+import datetime
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from ena_api_calls import setup_run_api_batches, get_environment_ena_checklists
+from ena_portal_api import get_default_max_workers
+from readrun_dataset import get_dataset_dir, get_partition_dir, read_readrun_dataset, write_readrun_dataset
+
+logger = logging.getLogger(name = 'mylogger')
+
+_window_marker = "_SUCCESS"   # the _ prefix means the Parquet readers ignore it
+_write_lock = threading.Lock()
+
+
+def get_window_partition_cols():
+    return ['query_type', 'window']
+
+
+def plan_first_public_windows(start_year=2010, end_year=None):
+    """
+    :param start_year: everything first public before this is one window
+    :param end_year: everything first public in or after this is one window, defaults to this year
+    :return: list of (window_id, window_query)
+    """
+    if end_year is None:
+        end_year = datetime.date.today().year
+    windows = [(f"pre-{start_year}", f"first_public<{start_year}-01-01")]
+    for year in range(start_year, end_year):
+        windows.append((str(year), f"first_public>={year}-01-01 AND first_public<{year + 1}-01-01"))
+    windows.append((f"{end_year}-on", f"first_public>={end_year}-01-01"))
+    return windows
+
+
+def plan_checklist_windows(query_type):
+    """
+    one window per checklist clause of the query_type, and one for all the rest
+    :param query_type: environmental_checklists or default_checklists
+    :return: list of (window_id, window_query)
+    """
+    if query_type == 'environmental_checklists':
+        checklists = get_environment_ena_checklists()
+    else:
+        checklists = ["ERC000011"]
+    windows = [(checklist, f'CHECKLIST="{checklist}"') for checklist in checklists]
+    windows.append(("other", "NOT (" + " OR ".join(f'CHECKLIST="{checklist}"' for checklist in checklists) + ")"))
+    return windows
+
+
+def plan_readrun_windows(query_type, window_by="first_public", start_year=2010, end_year=None):
+    """
+    :param query_type:
+    :param window_by: first_public or checklist
+    :param start_year: see plan_first_public_windows()
+    :param end_year:
+    :return: list of (window_id, window_query)
+    """
+    if window_by == "first_public":
+        return plan_first_public_windows(start_year, end_year)
+    elif window_by == "checklist":
+        return plan_checklist_windows(query_type)
+    logger.error(f"window_by={window_by} is not supported, only first_public or checklist")
+    sys.exit(1)
+
+
+def get_window_dir(dataset_dir, query_type, window_id):
+    return get_partition_dir(dataset_dir, [('query_type', query_type), ('window', window_id)])
+
+
+def is_window_complete(dataset_dir, query_type, window_id):
+    return os.path.exists(os.path.join(get_window_dir(dataset_dir, query_type, window_id), _window_marker))
+
+
+def get_window_record_total(dataset_dir, query_type, window_id):
+    """
+    :return: the number of records of a complete window, from its marker
+    """
+    with open(os.path.join(get_window_dir(dataset_dir, query_type, window_id), _window_marker)) as f:
+        return json.load(f)['records']
+
+
+def fetch_readrun_window(dataset_dir, query_type, window_id, window_query):
+    """
+    fetches one window and writes it to its partition, then marks it complete
+    N.B. is run from a thread pool by download_readrun_windows
+    :return: number of records
+    """
+    logger.info(f"fetching the {query_type} window {window_id}: {window_query}")
+    frames = [pd.DataFrame.from_records(record_batch)
+              for record_batch in setup_run_api_batches(query_type, 0, window_query = window_query)]
+    frames = [frame for frame in frames if len(frame) > 0]
+    record_total = sum(len(frame) for frame in frames)
+    window_dir = get_window_dir(dataset_dir, query_type, window_id)
+    with _write_lock:
+        if os.path.isdir(window_dir):   # anything there is from an incomplete earlier try
+            shutil.rmtree(window_dir)
+        if frames:
+            df = pd.concat(frames, ignore_index = True)
+            df['query_type'] = query_type
+            df['window'] = window_id
+            write_readrun_dataset(df, dataset_dir, get_window_partition_cols())
+        os.makedirs(window_dir, exist_ok = True)
+        with open(os.path.join(window_dir, _window_marker), "w") as f:
+            json.dump({'window_query': window_query, 'records': record_total}, f)
+    logger.info(f"{query_type} window {window_id} complete with {record_total} records")
+    return record_total
+
+
+def download_readrun_windows(query_type, name="env_readrun_windows", window_by="first_public", max_workers=None,
+                             start_year=2010, end_year=None):
+    """
+    :param query_type: environmental_checklists or default_checklists
+    :param name: the staging dataset, see get_dataset_dir()
+    :param window_by: see plan_readrun_windows()
+    :param max_workers: windows fetched at once, None uses get_default_max_workers()
+    :param start_year: see plan_first_public_windows()
+    :param end_year:
+    :return: DataFrame of all the windows of the query_type
+    """
+    if max_workers is None:
+        max_workers = get_default_max_workers()
+    dataset_dir = get_dataset_dir(name)
+    windows = plan_readrun_windows(query_type, window_by, start_year, end_year)
+    todo_windows = [(window_id, window_query) for (window_id, window_query) in windows
+                    if not is_window_complete(dataset_dir, query_type, window_id)]
+    logger.info(f"{query_type}: {len(windows)} windows by {window_by}, {len(windows) - len(todo_windows)} "
+                f"already complete, fetching {len(todo_windows)} with max_workers={max_workers}")
+    with ThreadPoolExecutor(max_workers = max(1, max_workers)) as executor:
+        futures = [executor.submit(fetch_readrun_window, dataset_dir, query_type, window_id, window_query)
+                   for (window_id, window_query) in todo_windows]
+        for future in futures:   # re-raises the first failure, the other windows still finish and are kept
+            future.result()
+    window_ids = [window_id for (window_id, window_query) in windows]
+    if sum(get_window_record_total(dataset_dir, query_type, window_id) for window_id in window_ids) == 0:
+        return pd.DataFrame()
+    df = read_readrun_dataset(dataset_dir, filters = {'query_type': [query_type], 'window': window_ids},
+                              partition_cols = get_window_partition_cols())
+    return df.drop(columns = ['window'])
+
+
+def clear_readrun_windows(query_type, name="env_readrun_windows"):
+    """
+    removes the staging partitions of the query_type, so the next download starts afresh
+    """
+    query_type_dir = get_partition_dir(get_dataset_dir(name), [('query_type', query_type)])
+    if os.path.isdir(query_type_dir):
+        shutil.rmtree(query_type_dir)
+
+
+def main():
+    for query_type in ["environmental_checklists", "default_checklists"]:
+        df = download_readrun_windows(query_type)
+        print(query_type, len(df))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,11 +7,53 @@ __docformat___ = 'reStructuredText'
 chmod a+x sample.py
 """
 
+from eDNA_utilities import flag_property
+
+_sample_generation = 0   # bumped on every field, flag or category change of any Sample
+
+
+def get_sample_generation():
+    """
+    SampleCollection rebuilds its sample table when this has changed since the table was built
+    :return: int
+    """
+    return _sample_generation
+
+
+def bump_sample_generation():
+    global _sample_generation
+    _sample_generation += 1
+
+
 class Sample:
     """
     objects for storing the environmental status of each sample
     They also get much annotation added by other function,
+    N.B. there can be millions of these, so they have __slots__ (no per object dict)
+    and the boolean flags are bits of self._flags, see flag_bits (SampleCollection decodes them column-wise)
+    Setting a text field, a flag or the category bumps get_sample_generation(), so the SampleCollection tables
+    are rebuilt
     """
+    text_fields = ('sample_accession', 'study_accession', 'description', 'tax_id', 'environment_biome',
+                   'taxonomic_identity_marker', 'country', 'location_start', 'location_end', 'country_clean',
+                   'source_category')
+    flag_bits = {
+        'is_environmental_sample': 1 << 0,
+        'country_is_european': 1 << 1,
+        'sample_tag_is_freshwater': 1 << 2,
+        'sample_tag_is_marine': 1 << 3,
+        'sample_tag_is_terrestrial': 1 << 4,
+        'sample_tag_is_coastal_brackish': 1 << 5
+    }
+    summary_flags = ('is_environmental_sample', 'country_is_european')   # the flags in get_summary_dict()
+    __slots__ = text_fields + ('taxonomy_obj', '_flags')
+
+    is_environmental_sample = flag_property(flag_bits['is_environmental_sample'], bump_sample_generation)
+    country_is_european = flag_property(flag_bits['country_is_european'], bump_sample_generation)
+    sample_tag_is_freshwater = flag_property(flag_bits['sample_tag_is_freshwater'], bump_sample_generation)
+    sample_tag_is_marine = flag_property(flag_bits['sample_tag_is_marine'], bump_sample_generation)
+    sample_tag_is_terrestrial = flag_property(flag_bits['sample_tag_is_terrestrial'], bump_sample_generation)
+    sample_tag_is_coastal_brackish = flag_property(flag_bits['sample_tag_is_coastal_brackish'], bump_sample_generation)
 
     def __init__(self, sample_accession):
         self.sample_accession = sample_accession
@@ -19,22 +61,22 @@ class Sample:
         self.study_accession = ""
         self.description = ""
         self.tax_id = ""
-        self.is_environmental_sample = False
+        self._flags = 0   # i.e. is_environmental_sample and all the tag flags False
         self.environment_biome = ""
         self.taxonomic_identity_marker = ""
         self.country = ""  # country	locality of sample isolation
         self.location_start = ""
         self.location_end = ""
         self.country_clean = ""
-        #also these, but not defined until later, hence defining as False
-        self.country_is_european = False
-        self.sample_tag_is_freshwater = False
-        self.sample_tag_is_marine = False
-        self.sample_tag_is_terrestrial = False
-        self.sample_tag_is_coastal_brackish = False
+        #also country_is_european and the sample_tag_is_* flags, but not defined until later, hence False
         self.taxonomy_obj = None
         self.source_category = ""
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in Sample.text_fields:   # the flags bump it in their setters
+            bump_sample_generation()
+
     def setCategory(self, category):
         self.source_category = category
 
@@ -48,29 +90,29 @@ class Sample:
 
     
     def get_summary_dict(self):
-        if hasattr(self, 'sample_summary_dict'):
-            return self.sample_summary_dict
-        else:
-            self.sample_summary_dict  ={
-               "sample_accession": self.sample_accession,
-               "is_environmental_sample": self.is_environmental_sample,
-               "study_accession": self.study_accession,
-               "description": self.description,
-               "tax_id": self.tax_id,
-               "environment_biome": self.environment_biome,
-               "taxonomic_identity_marker": self.taxonomic_identity_marker,
-               "country": self.country,
-               "country_clean": self.country_clean,
-               "country_is_european": self.country_is_european,
-               "location_start": self.location_start,
-               "location_end": self.location_end,
-                "category": self.source_category
-             }
-
-            if self.taxonomy_obj != None:
-                self.sample_summary_dict.update(self.taxonomy_obj.get_taxon_dict())
-                #ic(self.sample_summary_dict)
-            return self.sample_summary_dict
+        """
+        N.B. built each time rather than kept on the object, to keep the objects small
+        """
+        sample_summary_dict  ={
+           "sample_accession": self.sample_accession,
+           "is_environmental_sample": self.is_environmental_sample,
+           "study_accession": self.study_accession,
+           "description": self.description,
+           "tax_id": self.tax_id,
+           "environment_biome": self.environment_biome,
+           "taxonomic_identity_marker": self.taxonomic_identity_marker,
+           "country": self.country,
+           "country_clean": self.country_clean,
+           "country_is_european": self.country_is_european,
+           "location_start": self.location_start,
+           "location_end": self.location_end,
+            "category": self.source_category
+         }
+
+        if self.taxonomy_obj != None:
+            sample_summary_dict.update(self.taxonomy_obj.get_taxon_dict())
+            #ic(sample_summary_dict)
+        return sample_summary_dict
         
     def print_values(self):
         out_string = ""
@@ -81,7 +123,7 @@ class Sample:
         for field in sorted(summary_dict.keys()):
             out_string += f"{field.ljust(30)}: {summary_dict[field]}\n"
 
-        if hasattr(self,"taxonomy_obj") and self.taxonomy_obj != None:
+        if self.taxonomy_obj != None:
             taxonomy_obj = self.taxonomy_obj
             print(taxonomy_obj.print_summary())
 
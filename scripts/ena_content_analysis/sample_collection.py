@@ -13,12 +13,15 @@ import sys
 import os
 import argparse
 import random
-from sample import Sample
+from sample import Sample, get_sample_generation
+from accession_bitmap import AccessionBitmap, get_accession_interner
 import time
 from itertools import islice
+from operator import attrgetter
 from ena_portal_api import *
 from taxonomy import generate_taxon_collection, taxon
 from datetime import datetime
+import numpy as np
 import pandas as pd
 from eDNA_utilities import logger
 pd.set_option('display.max_rows', 500)
@@ -30,20 +33,22 @@ class SampleCollection:
     SampleCollection class of samples
     the initialisation is quite basic, as it then get added to
     some of the methods are lazy (just in time), but do store the data structures in case used again
+    The samples are either Sample objects (put_sample_set) or, in columnar mode, just a table (put_sample_table).
+    Either way the set/list methods are boolean masks over get_sample_table(), so no loops over the samples.
     """
 
     def __init__(self, category):
         self.type = "SampleCollection"
         self.category = category
         self.sample_obj_dict = {}
-        self.environmental_sample_set = set()
+        self.sample_set = set()
+        self._sample_table = None
+        self._sample_table_generation = None   # get_sample_generation() when _sample_table was built
+        self._pending_sample_rows = []   # columnar mode: rows added by add_sample(), concatenated on next use
+        self._sample_obj_array = None   # the Sample objects in the same order as the rows of _sample_table
+        self._tax_flag_masks = {}   # from addTaxonomyAnnotation
+        self._sample_positions = None   # the interned sample_accession of each row of _sample_table
         self.environmental_study_accession_set = set()
-        self.european_environmental_set = set()
-        self.european_sample_set = set()
-        self.freshwater_sample_tag_set = set() #
-        self.marine_sample_tag_set = set()
-        self.terrestrial_sample_tag_set = set()
-        self.coastal_brackish_sample_tag_set = set()
         self._get_aquatic_sample_acc_by_sample_tag = set() # aquatic populated on decorate_sample_tags
         self.freshwater_sample_acc_tag_set = set()
         self.marine_sample_acc_tag_set = set()
@@ -57,6 +62,125 @@ class SampleCollection:
 
     def put_sample_set(self, sample_set):
         self.sample_set = sample_set
+        self.invalidate_sample_table()
+
+    def add_sample(self, sample_obj):
+        """
+        :param sample_obj: Sample, in columnar mode it is buffered as a row, and the rows added since the
+                           table was last used are concatenated onto it in one go by get_sample_table()
+        """
+        if self.is_columnar():
+            row = {field: getattr(sample_obj, field) for field in Sample.text_fields}
+            row.update({flag: getattr(sample_obj, flag) for flag in Sample.flag_bits})
+            self._pending_sample_rows.append(row)
+        else:
+            self.sample_set.add(sample_obj)
+        self.invalidate_sample_table()
+
+    def invalidate_sample_table(self):
+        """
+        drops the sample table and everything aligned with its rows, so they are rebuilt on next use
+        N.B. the taxonomy masks go too, so addTaxonomyAnnotation() needs running again
+        """
+        if not self.is_columnar():
+            self._sample_table = None
+        self._sample_obj_array = None
+        self._sample_positions = None
+        self._tax_flag_masks = {}
+        self._all_sample_accs_set = set()
+        self._all_read_run_accs_set = set()
+        if hasattr(self, '_sample_df'):
+            del self._sample_df
+
+    def put_sample_table(self, sample_df):
+        """
+        columnar mode: the collection is stored as the table, no Sample objects are made.
+        Missing Sample.text_fields columns are filled with "" and missing Sample.flag_bits columns with False
+        :param sample_df: DataFrame, one row per sample, with at least a sample_accession column
+        """
+        sample_df = sample_df.reset_index(drop = True).copy()
+        self.sample_set = None
+        self._pending_sample_rows = []
+        self.invalidate_sample_table()
+        for field in Sample.text_fields:
+            if field not in sample_df.columns:
+                sample_df[field] = ""
+        for flag in Sample.flag_bits:
+            if flag not in sample_df.columns:
+                sample_df[flag] = False
+            sample_df[flag] = sample_df[flag].fillna(False).astype(bool)
+        self._sample_table = sample_df
+
+    def is_columnar(self):
+        return self.sample_set is None
+
+    def get_sample_table(self):
+        """
+        one row per sample: the Sample.text_fields and a boolean column for each of the Sample.flag_bits.
+        From the Sample objects it is built column by column, the flags decoded from their _flags
+        with a numpy bit mask per flag.
+        N.B. is kept, but rebuilt if any Sample field, flag or category has been set since, see
+        get_sample_generation(). The rows stay in the same order, so what is aligned with them is still good;
+        add_sample() drops all that
+        :return: DataFrame
+        """
+        if self.is_columnar():
+            if self._pending_sample_rows:
+                pending_df = pd.DataFrame(self._pending_sample_rows)
+                self._pending_sample_rows = []
+                self._sample_table = pd.concat([self._sample_table, pending_df], ignore_index = True)
+            return self._sample_table
+        if self._sample_table is not None and len(self._sample_table) != len(self.sample_set):
+            self.invalidate_sample_table()   # i.e. the sample_set was changed directly, not by add_sample()
+        if self._sample_table is not None and self._sample_table_generation == get_sample_generation():
+            return self._sample_table
+        if hasattr(self, '_sample_df'):
+            del self._sample_df
+        self._sample_table_generation = get_sample_generation()
+        sample_obj_list = list(self.sample_set)
+        sample_columns = {}
+        for field in Sample.text_fields:
+            sample_columns[field] = list(map(attrgetter(field), sample_obj_list))
+        flags = np.fromiter(map(attrgetter('_flags'), sample_obj_list), dtype = np.int64, count = len(sample_obj_list))
+        for flag, bit in Sample.flag_bits.items():
+            sample_columns[flag] = (flags & bit) != 0
+        self._sample_obj_array = np.empty(len(sample_obj_list), dtype = object)
+        self._sample_obj_array[:] = sample_obj_list
+        self._sample_table = pd.DataFrame(sample_columns)
+        return self._sample_table
+
+    def get_sample_mask(self, flag):
+        """
+        :param flag: one of Sample.flag_bits e.g. 'country_is_european'
+        :return: boolean numpy array, aligned with the rows of get_sample_table()
+        """
+        return self.get_sample_table()[flag].to_numpy()
+
+    def get_sample_accessions_by_mask(self, mask):
+        return self.get_sample_table()['sample_accession'].to_numpy()[mask].tolist()
+
+    def get_sample_positions(self):
+        """
+        :return: numpy int64 array, the interned position of the sample_accession of each row of get_sample_table()
+        """
+        if self._sample_positions is None:
+            self._sample_positions = get_accession_interner().intern(self.get_sample_table()['sample_accession'])
+        return self._sample_positions
+
+    def get_category_bitmap(self, flag=None):
+        """
+        the samples with a flag as an AccessionBitmap, for fast set algebra with other categories/collections
+        e.g. collection.get_category_bitmap('is_environmental_sample') & collection.get_category_bitmap('isMarine')
+        :param flag: one of Sample.flag_bits, or of taxon.flag_bits after addTaxonomyAnnotation(). None for all
+        :return: AccessionBitmap
+        """
+        if flag is None:
+            return AccessionBitmap.from_positions(self.get_sample_positions())
+        if flag in taxon.flag_bits:
+            mask = self.get_tax_flag_mask(flag)
+        else:
+            mask = self.get_sample_mask(flag)
+        return AccessionBitmap.from_positions(self.get_sample_positions()[mask])
 
     def get_total_read_run_accession_set(self):
         if len(self._all_read_run_accs_set) > 0:
@@ -77,10 +201,7 @@ class SampleCollection:
         return sample_acc_list
 
     def get_european_sample_accession_list(self):
-        if hasattr(self, 'european_sample_accession_list'):
-            return self.european_sample_accession_list
-        self.european_sample_accession_list = self.get_sample_accession_list(self.european_sample_set)
-        return self.european_sample_accession_list
+        return self.get_sample_accessions_by_mask(self.get_sample_mask('country_is_european'))
 
     #freshwater_sample_tag_set
     def get_sample_tag_list(self, tag_name):
@@ -93,34 +214,13 @@ class SampleCollection:
         if tag_name not in allowable_tags:
             logger.info(f"Error: the tag_name {tag_name} is unknown in get_sample_tag_list")
             return []
-        sample_tag_list = tag_name + '_sample_tag_list'
-        if tag_name == 'freshwater' and hasattr(self, sample_tag_list):
-            return self.freshwater_sample_tag_list
-        elif tag_name == 'marine' and hasattr(self, sample_tag_list):
-            return self.marine_sample_tag_list
-        elif tag_name == 'coastal_brackish' and hasattr(self, sample_tag_list):
-            return self.coastal_brackish_sample_tag_list
-        elif tag_name == 'terrestrial' and hasattr(self, sample_tag_list):
-            return self.terrestrial_sample_tag_list
-
-        if tag_name == 'freshwater':
-             self.freshwater_sample_tag_list = self.get_sample_accession_list(self.freshwater_sample_tag_set)
-             return self.freshwater_sample_tag_list
-        elif tag_name == 'marine':
-            self.marine_sample_tag_list = self.get_sample_accession_list(self.marine_sample_tag_set)
-            return self.marine_sample_tag_list
-        elif tag_name == 'coastal_brackish':
-            self.coastal_brackish_sample_tag_list = self.get_sample_accession_list(self.coastal_brackish_sample_tag_set)
-            return self.coastal_brackish_sample_tag_list
-        elif tag_name == 'terrestrial':
-            self.terrestrial_sample_tag_list = self.get_sample_accession_list(self.terrestrial_sample_tag_set)
-            return self.terrestrial_sample_tag_list
+        return self.get_sample_accessions_by_mask(self.get_sample_mask('sample_tag_is_' + tag_name))
 
 
     def get_total_archive_sample_size(self):
         if hasattr(self, 'total_archive_sample_size') and self.total_archive_sample_size > 0:
             return self.total_archive_sample_size
-        url='https://www.ebi.ac.uk/ena/portal/api/count?result=sample&dataPortal=ena'
+        url = get_ena_portal_url() + 'count?result=sample&dataPortal=ena'
         (total, response) = ena_portal_api_call_basic(url)
         self.total_archive_sample_size = total
         logger.info(self.total_archive_sample_size)
@@ -128,29 +228,32 @@ class SampleCollection:
 
     def get_sample_coll_df(self):
         """
-        put all into a big column orientated dict. Tried to do in a field independent way
-        then generate the df.
-        There is probably a more efficient way to do this.
+        the get_summary_dict() fields of every sample as a df, built from get_sample_table() plus,
+        if the samples have them, the taxonomy fields. The taxon dicts are only made once per taxon object.
         :return: self._sample_df
         """
-        print("++++++++++++++++++++++++++++++++++++++++++++")
         if hasattr(self, '_sample_df'):
             return self._sample_df
-        else:
-            count = 0
-            columns_list = []
-            coll_dict = {}
-            for sample_obj in self.sample_set:
-                sample_dict = sample_obj.get_summary_dict()
-                if count == 0:   # first time around
-                    columns_list = sorted(sample_dict.keys())
-                    for field in columns_list:
-                        coll_dict[field] = []
-                for field in columns_list:
-                    coll_dict[field].append(sample_dict[field])
-                count += 1
-            self._sample_df = pd.DataFrame.from_dict(coll_dict)
-            return self._sample_df
+        summary_columns = list(Sample.text_fields) + list(Sample.summary_flags)   # i.e. not the sample_tag_is_* flags
+        sample_df = self.get_sample_table()[summary_columns].rename(columns = {'source_category': 'category'})
+        if not self.is_columnar():
+            taxon_obj_list = list(map(attrgetter('taxonomy_obj'), self._sample_obj_array))
+            taxon_dict_by_obj_id = {}
+            for taxon_obj in taxon_obj_list:
+                if taxon_obj is not None and id(taxon_obj) not in taxon_dict_by_obj_id:
+                    taxon_dict_by_obj_id[id(taxon_obj)] = taxon_obj.get_taxon_dict()
+            if len(taxon_dict_by_obj_id) > 0:
+                taxon_df = pd.DataFrame.from_dict(taxon_dict_by_obj_id, orient = 'index')
+                taxon_df = taxon_df.reindex([id(taxon_obj) if taxon_obj is not None else None
+                                             for taxon_obj in taxon_obj_list]).reset_index(drop = True)
+                has_taxon = pd.Series([taxon_obj is not None for taxon_obj in taxon_obj_list])
+                # as with get_summary_dict(), the taxon tax_id wins where there is a taxon
+                sample_df['tax_id'] = taxon_df['tax_id'].where(has_taxon, sample_df['tax_id'])
+                for column in taxon_df.columns:
+                    if column != 'tax_id':
+                        sample_df[column] = taxon_df[column]
+        self._sample_df = sample_df[sorted(sample_df.columns)]
+        return self._sample_df
 
     def addSampleEnvironmentAnnotation(self):
         pass
@@ -163,55 +266,65 @@ class SampleCollection:
         self.tax_isTerrestrial_set - sample_obj
         self.tax_isCoastal_set - sample_obj
         self.tax_isFreshwater_set - sample_obj
+        (in columnar mode the sets are of sample_accession, as there are no Sample objects)
+        As a batch: the sample tax_ids are joined once against the taxon flag table, giving a mask per flag,
+        see get_tax_flag_mask(), and only the counts are logged.
         :return:
         """
-        logger.info(len(self.sample_set))
-        for sample_obj in self.sample_set:
-            self.tax_id_set.add(sample_obj.tax_id)
-        logger.info(len(self.tax_id_set))
+        sample_table = self.get_sample_table()
+        sample_tax_ids = sample_table['tax_id'].astype(str)
+        self.tax_id_set.update(sample_tax_ids.unique())
+        logger.info(f"{len(sample_table)} samples with {len(self.tax_id_set)} distinct tax_ids")
         tax_id_list = sorted(self.tax_id_set)
-        self.tax_isMarine_set = set()
-        self.tax_isTerrestrial_set = set()
-        self.tax_isCoastal_set = set()
-        self.tax_isFreshwater_set = set()
 
         taxon_collection_obj = generate_taxon_collection(tax_id_list)
-        for sample_obj in self.sample_set:
-            #logger.info(sample_obj.tax_id)
-
-            #logger.info(sample_obj.print_values())
-            taxonomy_obj = taxon_collection_obj.get_taxon_obj_by_id(sample_obj.tax_id)
-            if taxonomy_obj and hasattr(taxonomy_obj, 'tax_id'):
+        taxon_flag_table = taxon_collection_obj.get_taxon_flag_table()
+        positions = taxon_flag_table.index.get_indexer(sample_tax_ids)   # -1 where no taxon
+        is_found = positions >= 0
+        missing_tax_ids = set(sample_tax_ids[~is_found]) - {''}
+        if len(missing_tax_ids) > 0:
+            logger.info(f"ERROR: {len(missing_tax_ids)} tax_ids not found, for {int((~is_found).sum())} samples e.g. "
+                        f"{sorted(missing_tax_ids)[0:5]}")
+
+        self._tax_flag_masks = {}
+        for flag in taxon.flag_bits:
+            flag_values = np.append(taxon_flag_table[flag].to_numpy(), False)   # so -1 picks False
+            self._tax_flag_masks[flag] = flag_values[positions]
+            logger.info(f"\t{flag} samples: {int(self._tax_flag_masks[flag].sum())}")
+
+        if self.is_columnar():
+            sample_members = sample_table['sample_accession'].to_numpy()
+        else:
+            sample_members = self._sample_obj_array
+            taxon_obj_array = np.empty(len(taxon_flag_table) + 1, dtype = object)
+            taxon_obj_array[:] = [taxon_collection_obj.tax_id_dict[tax_id] for tax_id in taxon_flag_table.index] + \
+                                 [taxon_collection_obj.get_dummy_taxon_obj()]   # i.e. the dummy for -1
+            for sample_obj, taxonomy_obj in zip(sample_members, taxon_obj_array[positions]):
                 sample_obj.taxonomy_obj = taxonomy_obj  # this is very important!
-                #logger.info(sample_obj.taxonomy_obj.tax_id)
-                if taxonomy_obj.isMarine:
-                    #logger.info(f"\tmarine {sample_obj.taxonomy_obj.tax_id}")
-                    self.tax_isMarine_set.add(sample_obj)
-                if taxonomy_obj.isTerrestrial:
-                    logger.info(f"\tterrestrial {sample_obj.taxonomy_obj.tax_id}")
-                    self.tax_isTerrestrial_set.add(sample_obj)
-                if taxonomy_obj.isCoastal:
-                    logger.info("\tcoastal {sample_obj.taxonomy_obj.tax_id}")
-                    self.tax_isCoastal_set.add(sample_obj)
-                if taxonomy_obj.isFreshwater:
-                    logger.info("\tfreshwater {sample_obj.taxonomy_obj.tax_id}")
-                    self.tax_isFreshwater_set.add(sample_obj)
-            else:
-                #logger.info(f"Warning: for {sample_obj.tax_id} generating a dummy")
-                sample_obj.taxonomy_obj = taxon({'tax_id': ''})  # generates a dummy
-        #sys.exit()
+        self.tax_isMarine_set = set(sample_members[self._tax_flag_masks['isMarine']])
+        self.tax_isTerrestrial_set = set(sample_members[self._tax_flag_masks['isTerrestrial']])
+        self.tax_isCoastal_set = set(sample_members[self._tax_flag_masks['isCoastal']])
+        self.tax_isFreshwater_set = set(sample_members[self._tax_flag_masks['isFreshwater']])
+
+    def get_tax_flag_mask(self, flag):
+        """
+        :param flag: one of taxon.flag_bits e.g. 'isMarine', N.B. addTaxonomyAnnotation() must have been run
+        :return: boolean numpy array, aligned with the rows of get_sample_table()
+        """
+        return self._tax_flag_masks[flag]
 
     def get_sample_objs(self):
         return self.sample_set
 
     def get_sample_set_size(self):
+        if self.is_columnar():
+            return int(len(self.get_sample_table()))
         return int(len(self.sample_set))
 
     def get_all_sample_acc_set(self):
         if len(self._all_sample_accs_set) > 0:
             return self._all_sample_accs_set
-        for sample_obj in self.get_sample_objs():
-            self._all_sample_accs_set.add(sample_obj.sample_accession)
+        self._all_sample_accs_set = set(self.get_sample_table()['sample_accession'])
         #logger.info(self._all_sample_accs)
         return self._all_sample_accs_set
 
@@ -249,8 +362,9 @@ class SampleCollection:
         outstring += f"total_ena_sample_size={self.total_archive_sample_size}\n"
         outstring += f"total_ena_tax_id_count={len(self.tax_id_set)}\n"
         outstring += f"environmental_sample_total: {len(self.get_environmental_sample_list())}\n"
-        outstring += f"European_environmental_sample_total: {len(self.european_environmental_set)}\n"
-        outstring += f"European_sample_total: {len(self.european_sample_set)}\n"
+        is_european = self.get_sample_mask('country_is_european')
+        outstring += f"European_environmental_sample_total: {int((self.get_sample_mask('is_environmental_sample') & is_european).sum())}\n"
+        outstring += f"European_sample_total: {int(is_european.sum())}\n"
         outstring += f"environmental_study_total: {len(self.get_environmental_study_accession_list())}\n"
 
         outstring += '#####################################\n'
@@ -270,7 +384,6 @@ class SampleCollection:
         outstring += f"  total_ena_tax_freshwater_count of samples={len(self.tax_isFreshwater_set)}\n"
 
         outstring +='#####################################\n'
-        sample_obj1 = random.choice(list(self.sample_set))
         # outstring += f"Random sample:\n{sample_obj1.print_values()}\n"
 
         # print('#####################################')
@@ -285,50 +398,51 @@ class SampleCollection:
         return outstring
 
     def get_sample_collection_stats(self):
-
+        """
+        by_sample_id and by_study_id dicts, from the columns of get_sample_table().
+        N.B. as before, where a study has several samples by_study_id keeps the last one
+        :return: self.sample_collection_stats_dict
+        """
         if hasattr(self, "sample_collection_stats_dict"):
             return self.sample_collection_stats_dict
-        else:
-            sample_collection_stats_dict = {'by_sample_id': {}, 'by_study_id': {}}
-
-            for sample_obj in self.sample_set:
-                sample_collection_stats_dict['by_sample_id'][sample_obj.sample_accession] = \
-                    {
-                        "sample_accession": sample_obj.sample_accession,
-                         "study_accession": sample_obj.study_accession,
-                         "is_environmental_sample": sample_obj.is_environmental_sample
-                      }
-                if sample_obj.is_environmental_sample:
-                    # print(".", end="")
-                    self.environmental_sample_set.add(sample_obj)
-                    if sample_obj.country_is_european:
-                        self.european_environmental_set.add(sample_obj)
-                if sample_obj.country_is_european:
-                        self.european_sample_set.add(sample_obj)
-                # logger.info(sample_collection_stats_dict['by_study_id'])
-                if sample_obj.study_accession != "":
-                    for study_accession in sample_obj.study_accession.split(';'):
-                      sample_collection_stats_dict['by_study_id'][study_accession] = {'sample_id': { sample_obj.sample_accession : sample_collection_stats_dict['by_sample_id'][sample_obj.sample_accession]} }
-                      self.environmental_study_accession_set.add(study_accession)
-                if sample_obj.sample_tag_is_freshwater:
-                    self.freshwater_sample_tag_set.add(sample_obj)
-                if sample_obj.sample_tag_is_terrestrial:
-                    self.terrestrial_sample_tag_set.add(sample_obj)
-                if sample_obj.sample_tag_is_marine:
-                    self.marine_sample_tag_set.add(sample_obj)
-                if sample_obj.sample_tag_is_coastal_brackish:
-                    self.coastal_brackish_sample_tag_set.add(sample_obj)
-                self.sample_collection_stats_dict = sample_collection_stats_dict
-            self.sample_count = len(sample_collection_stats_dict['by_sample_id'])
-            # logger.info(self.sample_collection_stats_dict)
+        sample_table = self.get_sample_table()
+        sample_collection_stats_dict = {'by_sample_id': {}, 'by_study_id': {}}
+        by_sample_id = sample_collection_stats_dict['by_sample_id']
+        for sample_accession, study_accession, is_environmental_sample in zip(
+                sample_table['sample_accession'].tolist(), sample_table['study_accession'].tolist(),
+                sample_table['is_environmental_sample'].tolist()):
+            by_sample_id[sample_accession] = {
+                "sample_accession": sample_accession,
+                "study_accession": study_accession,
+                "is_environmental_sample": is_environmental_sample
+            }
+
+        # the last sample of each distinct study_accession string, then split, so only the distinct strings are split
+        study_df = sample_table.loc[sample_table['study_accession'] != "", ['study_accession', 'sample_accession']]
+        study_df = study_df.drop_duplicates('study_accession', keep = 'last')
+        study_df = study_df.assign(study_accession = study_df['study_accession'].str.split(';'))
+        study_df = study_df.explode('study_accession').sort_index(kind = 'stable')
+        study_df = study_df.drop_duplicates('study_accession', keep = 'last')
+        for study_accession, sample_accession in zip(study_df['study_accession'].tolist(),
+                                                      study_df['sample_accession'].tolist()):
+            sample_collection_stats_dict['by_study_id'][study_accession] = \
+                {'sample_id': {sample_accession: by_sample_id[sample_accession]}}
+        self.environmental_study_accession_set.update(study_df['study_accession'])
+
+        self.sample_collection_stats_dict = sample_collection_stats_dict
+        self.sample_count = len(by_sample_id)
         return self.sample_collection_stats_dict
 
     def get_environmental_sample_list(self):
         """
           list of object tagged with environment_sample in ENA
+          N.B. in columnar mode there are no Sample objects, so it is their sample_accessions
         :return:
         """
-        return list(self.environmental_sample_set)
+        is_environmental_sample = self.get_sample_mask('is_environmental_sample')
+        if self.is_columnar():
+            return self.get_sample_accessions_by_mask(is_environmental_sample)
+        return self._sample_obj_array[is_environmental_sample].tolist()
 
     def get_environmental_study_accession_list(self):
         return list(self.environmental_study_accession_set)
@@ -69,10 +69,7 @@ def study2sample(study_id_list, study_collection, debug_status):
     # 'https://www.ebi.ac.uk/ena/portal/api/search'
     # curl 'https://www.ebi.ac.uk/ena/portal/api/search?result=sample&query=study_accession%3D%22PRJNA505510%22%20OR%20study_accession%3D%22PRJEB32543%22&fields=sample_accession%2Csample_description%2Cstudy_accession&format=tsv'
 
-    #currently very inefficient doing one call per study_id
-    pre_url = get_ena_portal_url() + "search?" + 'result=' + result_object_type + '&fields=sample_accession&format=tsv'
-    pre_url += '&limit=' + str(limit) + '&query=study_accession' + '%3D'
-
+    # the study_accession="X" OR ... clauses are packed into as few form POSTs as fit, so only a handful of calls
     return_fields = ['sample_accession','study_accession']
     #the following does not work as not as study is not a valid accessionType
     #data = chunk_portal_api_call(get_ena_portal_url() + "search?" + "&includeAccessionType=study", result_object_type, return_fields, study_id_list)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Script of tag_decoder.py is to decode the ENA ';' separated tag strings once per distinct string
+
+The taxon and read_run/sample tag columns have millions of rows but only a few thousand distinct tag strings,
+so the column is factorized and each distinct string is split and decoded once. Anything per row is then a
+numpy take by the factorize codes. Used for the taxon habitat flags, the env_tags and the aquatic filter.
+
+usage:
+    tag_decoder = TagDecoder(df['tag'])
+    df['env_tags'] = tag_decoder.get_env_tag_strings()
+    df['aquatic'] = tag_decoder.get_env_tag_pattern_mask('marine|freshwater|coastal|brackish')
+    or, where the decoded env_tags may already be there from an earlier stage
+    add_env_tag_columns(df)
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x tag_decoder.py
+"""
+
+import logging
+import re
+import sys
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+def split_tag_string(tag_string):
+    """
+    :param tag_string: e.g. 'marine;marine_high_confidence;env_tax:marine'
+    :return: tuple of the tags, empty for "" or a missing value
+    """
+    if not isinstance(tag_string, str) or tag_string == "":
+        return ()
+    return tuple(tag_string.split(';'))
+
+
+def get_env_tags(tag_tuple):
+    """
+    :param tag_tuple:
+    :return: list of the env_ tags e.g. ['env_tax:marine', 'env_geo:marine']
+    """
+    return [tag for tag in tag_tuple if "env_" in tag]
+
+
+def get_habitat_flags(tag_tuple, flag_bit_by_habitat, tax_id=""):
+    """
+    the taxon habitat rule: a habitat is set where there is a <habitat>_medium_confidence or
+    <habitat>_high_confidence tag, low confidence tags are ignored.
+    :param tag_tuple: e.g. ('marine', 'marine_high_confidence', 'terrestrial_low_confidence')
+    :param flag_bit_by_habitat: e.g. {'marine': 1 << 1, 'terrestrial': 1 << 0}
+    :param tax_id: only for the warning
+    :return: int of the bits set
+    """
+    flags = 0
+    for tag in tag_tuple:
+        splits = tag.split("_")
+        if len(splits) == 3 and splits[2] == "confidence" and (splits[1] == "medium" or splits[1] == "high"):
+            if splits[0] in flag_bit_by_habitat:
+                flags |= flag_bit_by_habitat[splits[0]]
+            else:
+                print(f"WARNING: {splits[0]} is not yet handled for {splits[0]} for tax_id:{tax_id}")
+    return flags
+
+
+_habitat_flags_cache = {}   # (tag string, habitat bits) to flags, shared by all the TagDecoders
+
+
+class TagDecoder:
+    """
+    a tag column, factorized, with each distinct tag string split once
+    """
+
+    def __init__(self, tag_series):
+        """
+        :param tag_series: pandas Series (or list) of ';' separated tag strings
+        """
+        tag_series = pd.Series(tag_series)
+        self.index = tag_series.index
+        (self.codes, uniques) = pd.factorize(tag_series, use_na_sentinel = True)
+        self.unique_tag_strings = list(uniques)
+        # a trailing empty entry, so that the -1 codes of missing values pick it
+        self.unique_tag_tuples = [split_tag_string(tag_string) for tag_string in self.unique_tag_strings] + [()]
+        logger.debug(f"TagDecoder {len(self.codes)} rows, {len(self.unique_tag_strings)} distinct tag strings")
+
+    def get_unique_total(self):
+        return len(self.unique_tag_strings)
+
+    def take(self, unique_values, dtype=object):
+        """
+        :param unique_values: a value for each of the unique_tag_tuples (including the trailing empty one)
+        :param dtype:
+        :return: numpy array, one value per row
+        """
+        unique_array = np.empty(len(unique_values), dtype = dtype)
+        unique_array[:] = unique_values
+        return unique_array[self.codes]
+
+    def get_vocabulary(self):
+        """
+        :return: sorted list of every distinct tag
+        """
+        return sorted({tag for tag_tuple in self.unique_tag_tuples for tag in tag_tuple})
+
+    def get_tag_mask(self, tag):
+        """
+        :param tag: e.g. 'env_tax:marine'
+        :return: boolean numpy array, True where the row has the tag
+        """
+        return self.take([tag in tag_tuple for tag_tuple in self.unique_tag_tuples], dtype = bool)
+
+    def get_one_hot(self, tags=None):
+        """
+        the one-hot tag matrix
+        :param tags: the columns wanted, defaults to get_vocabulary()
+        :return: boolean DataFrame, one column per tag
+        """
+        if tags is None:
+            tags = self.get_vocabulary()
+        return pd.DataFrame({tag: self.get_tag_mask(tag) for tag in tags}, index = self.index)
+
+    def get_bitmask(self, tags):
+        """
+        :param tags: list of up to 63 tags, the first is bit 0 and so on
+        :return: int64 numpy array, bit n set where the row has tags[n]
+        """
+        if len(tags) > 63:
+            logger.error(f"get_bitmask can only pack 63 tags, {len(tags)} were given")
+            sys.exit(1)
+        bit_by_tag = {tag: 1 << position for position, tag in enumerate(tags)}
+        unique_bits = [sum(bit_by_tag.get(tag, 0) for tag in set(tag_tuple)) for tag_tuple in self.unique_tag_tuples]
+        return self.take(unique_bits, dtype = np.int64)
+
+    def get_habitat_flags(self, flag_bit_by_habitat):
+        """
+        see get_habitat_flags(), per row. The flags of each distinct tag string are kept across all the TagDecoders,
+        as e.g. the taxon_collection of each sample category has many of the same taxon tags
+        :return: int64 numpy array
+        """
+        habitat_key = tuple(sorted(flag_bit_by_habitat.items()))
+        unique_flags = []
+        for tag_string, tag_tuple in zip(self.unique_tag_strings + [""], self.unique_tag_tuples):
+            cache_key = (tag_string, habitat_key)
+            if cache_key not in _habitat_flags_cache:
+                _habitat_flags_cache[cache_key] = get_habitat_flags(tag_tuple, flag_bit_by_habitat)
+            unique_flags.append(_habitat_flags_cache[cache_key])
+        return self.take(unique_flags, dtype = np.int64)
+
+    def get_env_tag_lists(self):
+        """
+        N.B. the rows of the same tag string share one list, so do not change them in place
+        :return: numpy object array of lists of the env_ tags
+        """
+        return self.take([get_env_tags(tag_tuple) for tag_tuple in self.unique_tag_tuples])
+
+    def get_env_tag_strings(self):
+        """
+        :return: numpy object array of the env_ tags joined by ';' e.g. 'env_tax:marine;env_geo:marine'
+        """
+        return self.take([';'.join(get_env_tags(tag_tuple)) for tag_tuple in self.unique_tag_tuples])
+
+    def get_env_tag_pattern_mask(self, pattern):
+        """
+        :param pattern: regular expression searched for in the joined env_ tags
+        :return: boolean numpy array
+        """
+        pattern = re.compile(pattern)
+        return self.take([pattern.search(';'.join(get_env_tags(tag_tuple))) is not None
+                          for tag_tuple in self.unique_tag_tuples], dtype = bool)
+
+
+def add_env_tag_columns(df, tag_column='tag'):
+    """
+    adds env_tag (lists of the env_ tags) and env_tags (them joined by ';') decoded from the tag column, unless the
+    frame already has env_tags e.g. from filter_for_aquatic(), so the tags of a frame are decoded only once,
+    by whichever stage gets to them first
+    :param df: DataFrame, changed in place
+    :param tag_column:
+    :return: the TagDecoder, None if env_tags was already there
+    """
+    if 'env_tags' in df.columns:
+        return None
+    tag_decoder = TagDecoder(df[tag_column])
+    df['env_tag'] = tag_decoder.get_env_tag_lists()
+    df['env_tags'] = tag_decoder.get_env_tag_strings()
+    return tag_decoder
+
+
+def main():
+    tag_decoder = TagDecoder(['marine;marine_high_confidence;env_tax:marine', '', 'env_geo:terrestrial',
+                              'marine;marine_high_confidence;env_tax:marine'])
+    print(tag_decoder.get_env_tag_strings())
+    print(tag_decoder.get_habitat_flags({'marine': 1, 'terrestrial': 2}))
+    print(tag_decoder.get_one_hot())
+
+
+if __name__ == '__main__':
+    main()
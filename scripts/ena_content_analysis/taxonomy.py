@@ -7,39 +7,66 @@ __docformat___ = 'reStructuredText'
 chmod a+x taxonomy.py
 """
 
-from eDNA_utilities import logger
+from eDNA_utilities import logger, flag_property
 import os
 import pickle
+import numpy as np
+import pandas as pd
 from ena_portal_api import ena_portal_api_call, get_ena_portal_url, chunk_portal_api_call
+from taxonomy_store import get_taxonomy_store
+from tag_decoder import TagDecoder, get_habitat_flags
 
 class taxon:
     """
         self.scientific_name
         self.tax_id
         self.tax_list
+    N.B. one per tax_id, so there can be very many: __slots__ (no per object dict),
+    the tag_list is a tuple and the isX flags are bits of self._flags
     """
+    flag_bits = {
+        'isTerrestrial': 1 << 0,
+        'isMarine': 1 << 1,
+        'isCoastal': 1 << 2,
+        'isFreshwater': 1 << 3
+    }
+    flag_bit_by_habitat = {
+        'terrestrial': flag_bits['isTerrestrial'],
+        'marine': flag_bits['isMarine'],
+        'coastal': flag_bits['isCoastal'],
+        'freshwater': flag_bits['isFreshwater']
+    }
+    __slots__ = ('scientific_name', 'tax_id', 'tag_list', '_flags')
+
+    isTerrestrial = flag_property(flag_bits['isTerrestrial'])
+    isMarine = flag_property(flag_bits['isMarine'])
+    isCoastal = flag_property(flag_bits['isCoastal'])
+    isFreshwater = flag_property(flag_bits['isFreshwater'])
+
     def print_summary(self):
        out_string = ""
-       for property in self.get_taxon_dict():
-           out_string += f"{property.ljust(30)}: {self.taxon_dict[property]}\n"
+       taxon_dict = self.get_taxon_dict()
+       for property in taxon_dict:
+           out_string += f"{property.ljust(30)}: {taxon_dict[property]}\n"
 
        return out_string
 
     def get_taxon_dict(self):
-        if not hasattr(self,'taxon_dict'):
-            self.taxon_dict = {
+        """
+        N.B. built each time rather than kept on the object, to keep the objects small
+        """
+        return {
             'scientific_name': self.scientific_name,
             'tax_id': self.tax_id,
-            'tag_list': self.tag_list,
+            'tag_list': list(self.tag_list),
             'isTerrestrial': self.isTerrestrial,
             'isMarine': self.isMarine,
             'isCoastal': self.isCoastal,
             'isFreshwater': self.isFreshwater
             }
-        return self.taxon_dict
 
 
-    def __init__(self, hit):
+    def __init__(self, hit, flags=None):
         """
         :param hit:
             # {'scientific_name': 'Chloephaga melanoptera',
@@ -47,46 +74,35 @@ class taxon:
             #     'tax_division': 'VRT',
             #     'tax_id': '8860'},
         #fails safe, but where high or medium confidence they are marked True
-
+        :param flags: the habitat bits if already decoded, e.g. by taxon_collection from the whole tag column
         """
         #intialise:
         self.scientific_name = ''
         self.tax_id = ''
-        self.tag_list = []
-        self.isTerrestrial = False
-        self.isMarine = False
-        self.isCoastal = False
-        self.isFreshwater = False
+        self.tag_list = ()
 
         if hit['tax_id'] != "":
             self.scientific_name = hit['scientific_name']
             self.tax_id = hit['tax_id']
-            self.tag_list = sorted(hit['tag'].split(';'))
+            self.tag_list = tuple(sorted(hit['tag'].split(';')))
         # else: #ie. create a dummy {tax_id = ''}
 
-        for tag in self.tag_list:
-           splits = tag.split("_")
-           #logger.info(f"inspecting tags {splits}")
-           if len(splits)==3 and splits[2] == "confidence" and (splits[1] == "medium" or splits[1] == "high"):
-               #logger.info(splits[0])
-               if splits[0] == "terrestrial":
-                   self.isTerrestrial = True
-               elif splits[0] == "marine":
-                   self.isMarine = True
-               elif splits[0] == "coastal":
-                    self.isCoastal = True
-               elif  splits[0] == "freshwater":
-                    self.isFreshwater = True
-               else:
-                   print(f"WARNING: {splits[0]} is not yet handled for {splits[0]} for tax_id:{self.tax_id}")
+        if flags is None:
+            flags = get_habitat_flags(self.tag_list, self.flag_bit_by_habitat, self.tax_id)
+        self._flags = flags
 
 
 class taxon_collection:
     def __init__(self, hit_list):
         self.tax_id_dict = {}
         self.tax_obj_list = []
-        for hit in hit_list:
-            taxon_obj = taxon(hit)
+        self.dummy_taxon_obj = taxon({'tax_id': ''})
+        self._taxon_flag_table = None
+        # the habitat tags decoded once per distinct tag string, rather than per taxon
+        tag_decoder = TagDecoder([hit.get('tag', '') if hit['tax_id'] != "" else "" for hit in hit_list])
+        flags_list = tag_decoder.get_habitat_flags(taxon.flag_bit_by_habitat).tolist()
+        for hit, flags in zip(hit_list, flags_list):
+            taxon_obj = taxon(hit, flags)
             self.tax_id_dict[taxon_obj.tax_id] = taxon_obj
             self.tax_obj_list.append(taxon_obj)
 
@@ -112,6 +128,20 @@ class taxon_collection:
 
     def get_dummy_taxon_obj(self):
         return self.dummy_taxon_obj
+
+    def get_taxon_flag_table(self):
+        """
+        one row per tax_id, with a boolean column for each of the taxon.flag_bits, for joining samples to
+        :return: DataFrame indexed by tax_id
+        """
+        if self._taxon_flag_table is not None:
+            return self._taxon_flag_table
+        taxon_obj_list = list(self.tax_id_dict.values())
+        flags = np.array([taxon_obj._flags for taxon_obj in taxon_obj_list], dtype = np.int64)
+        flag_columns = {flag: (flags & bit) != 0 for flag, bit in taxon.flag_bits.items()}
+        self._taxon_flag_table = pd.DataFrame(flag_columns, index = pd.Index(list(self.tax_id_dict.keys()),
+                                                                             name = 'tax_id'))
+        return self._taxon_flag_table
     
         
 
@@ -191,7 +221,7 @@ def clean_tax_list(mylist):
                 # print(f"Warning bad tax id entry, ignoring: {id} and replacing with {new_id}")
         else:
             new_set.add(id)
-    return list(new_set), bad_id_dict
+    return sorted(new_set), bad_id_dict   # sorted so the chunks, and so the cache keys, are the same each run
 
 def create_taxonomy_hash(tax_list):
     """
@@ -221,16 +251,27 @@ def create_taxonomy_hash(tax_list):
     ena_search_url = f"{ena_portal_api_url}search?"
     # print(f"{ena_search_url} {with_obj_type} {taxonomy_rtn_fields} {tax_list}")
 
-    tax_combined_data_picklefile = 'tax_combined_data_pickle'
-    if os.path.isfile(tax_combined_data_picklefile):
-        print(f"WARNING: am using {tax_combined_data_picklefile} which is just a subset")
-        combined_data = pickle.load(open(tax_combined_data_picklefile, "rb"))
-    else:
-        combined_data = chunk_portal_api_call(ena_search_url, with_obj_type, taxonomy_rtn_fields, None, tax_list)
-        pickle.dump(combined_data, open(tax_combined_data_picklefile, "wb"))
+    # the chunks are cached by the portal response cache, so re-runs only fetch new or expired chunks
+    combined_data = chunk_portal_api_call(ena_search_url, with_obj_type, taxonomy_rtn_fields, None, tax_list)
 
     return combined_data, bad_id_hash
 
+def get_taxonomy_records(tax_list):
+    """
+    the taxon records from the local taxonomy store, which only goes to the portal for the taxa it lacks,
+    or straight from the portal if the store is disabled.
+    :param tax_list:
+    :return: list of the records (as create_taxonomy_hash), bad_id_hash
+    """
+    store = get_taxonomy_store()
+    if store is None:
+        return create_taxonomy_hash(tax_list)
+    (tax_list, bad_id_hash) = clean_tax_list(tax_list)
+    wanted_ids = tax_list + sorted(set(bad_id_hash.values()) - set(tax_list))
+    store.refresh(wanted_ids)
+    record_by_tax_id = store.get_records_by_tax_id(wanted_ids)
+    return [record_by_tax_id[tax_id] for tax_id in wanted_ids if tax_id in record_by_tax_id], bad_id_hash
+
 def create_taxonomy_hash_by_tax_id(tax_list):
     """
     Also fudge fixes for many bad_tax_ids e.g. if ';'
@@ -246,7 +287,7 @@ def create_taxonomy_hash_by_tax_id(tax_list):
     :return:
     """
 
-    hash_col, bad_id_hash = create_taxonomy_hash(tax_list)
+    hash_col, bad_id_hash = get_taxonomy_records(tax_list)
     by_tax_id = {}
     for record in hash_col:
         # print(f"record = {record}")
@@ -269,7 +310,7 @@ def create_taxonomy_hash_by_tax_id(tax_list):
 
 
 def generate_taxon_collection(tax_id_list):
-    combined_data = create_taxonomy_hash(tax_id_list)
+    (combined_data, bad_id_hash) = get_taxonomy_records(tax_id_list)
     taxon_collection_obj = taxon_collection(combined_data)
     logger.info(taxon_collection_obj.print_summary())
 
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Script of taxonomy_interval_index.py is to answer tax_tree / subtree membership questions locally
+
+Each taxon gets a pre-order (nested set) interval [start, end] from a depth first walk of the tree built
+from the tax_lineage strings we already fetch. X is under Y when start(Y) <= start(X) <= end(Y),
+i.e. two integer comparisons, so a whole DataFrame column can be filtered with one vectorised range test,
+the local equivalent of the portal tax_tree() / not_tax_tree().
+
+usage:
+    interval_index = TaxonomyIntervalIndex(df['tax_lineage'].unique())
+    fungi_mask = interval_index.get_subtree_mask(df['tax_id'], '4751')
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x taxonomy_interval_index.py
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(name = 'mylogger')
+
+
+class TaxonomyIntervalIndex:
+    """
+    nested set numbering of the taxonomy tree given by a collection of tax_lineage strings
+    """
+
+    def __init__(self, tax_lineages):
+        """
+        :param tax_lineages: iterable of strings e.g. '1;131567;2;1783272;1239;91061;186826;81852;1350;1352'
+        """
+        self.children_by_tax_id = {}
+        self.parent_by_tax_id = {}
+        for tax_lineage in tax_lineages:
+            self.add_tax_lineage(tax_lineage)
+        self.start_by_tax_id = {}
+        self.end_by_tax_id = {}
+        self.build_intervals()
+
+    def add_tax_lineage(self, tax_lineage):
+        if not isinstance(tax_lineage, str) or tax_lineage == "":
+            return
+        parent_id = None
+        for tax_id in tax_lineage.strip(';').split(';'):
+            tax_id = tax_id.strip()
+            if tax_id not in self.parent_by_tax_id:
+                self.parent_by_tax_id[tax_id] = parent_id
+                if parent_id is not None:
+                    self.children_by_tax_id.setdefault(parent_id, []).append(tax_id)
+            parent_id = tax_id
+
+    def build_intervals(self):
+        """
+        iterative depth first walk, so the depth of the taxonomy is not limited by the recursion limit
+        """
+        roots = sorted(tax_id for tax_id, parent_id in self.parent_by_tax_id.items() if parent_id is None)
+        counter = 0
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                (tax_id, is_done) = stack.pop()
+                if is_done:
+                    self.end_by_tax_id[tax_id] = counter - 1
+                    continue
+                self.start_by_tax_id[tax_id] = counter
+                counter += 1
+                stack.append((tax_id, True))
+                for child_id in sorted(self.children_by_tax_id.get(tax_id, []), reverse = True):
+                    stack.append((child_id, False))
+        logger.debug(f"TaxonomyIntervalIndex of {counter} taxa from {len(roots)} roots")
+
+    def get_taxon_total(self):
+        return len(self.start_by_tax_id)
+
+    def get_interval(self, tax_id):
+        """
+        :param tax_id:
+        :return: (start, end) or None if not in the index
+        """
+        tax_id = str(tax_id)
+        if tax_id not in self.start_by_tax_id:
+            return None
+        return self.start_by_tax_id[tax_id], self.end_by_tax_id[tax_id]
+
+    def is_under(self, tax_id, ancestor_id):
+        """
+        N.B. a taxon counts as under itself, as with tax_tree()
+        :return: boolean
+        """
+        position = self.start_by_tax_id.get(str(tax_id))
+        interval = self.get_interval(ancestor_id)
+        if position is None or interval is None:
+            return False
+        return interval[0] <= position <= interval[1]
+
+    def get_positions(self, tax_id_series):
+        """
+        the pre-order start of each row's taxon, -1 if not in the index.
+        The dict look ups are only done for the distinct values.
+        :param tax_id_series:
+        :return: numpy int array
+        """
+        (codes, uniques) = pd.factorize(pd.Series(tax_id_series).astype(str))
+        unique_positions = np.array([self.start_by_tax_id.get(tax_id, -1) for tax_id in uniques] + [-1],
+                                    dtype = np.int64)
+        return unique_positions[codes]   # codes of -1 i.e. missing values pick the trailing -1
+
+    def get_subtree_mask(self, tax_id_series, ancestor_ids):
+        """
+        e.g. df[interval_index.get_subtree_mask(df['tax_id'], '4751')]      for the fungi
+             df[~interval_index.get_subtree_mask(df['tax_id'], '9606')]     like not_tax_tree(9606)
+        :param tax_id_series:
+        :param ancestor_ids: a tax_id or a list of them
+        :return: boolean numpy array
+        """
+        if isinstance(ancestor_ids, (str, int)):
+            ancestor_ids = [ancestor_ids]
+        positions = self.get_positions(tax_id_series)
+        mask = np.zeros(len(positions), dtype = bool)
+        for ancestor_id in ancestor_ids:
+            interval = self.get_interval(ancestor_id)
+            if interval is None:
+                logger.warning(f"{ancestor_id} is not in the taxonomy interval index, so nothing is under it")
+                continue
+            mask |= (positions >= interval[0]) & (positions <= interval[1])
+        return mask
+
+
+def main():
+    interval_index = TaxonomyIntervalIndex(['1;131567;2759;33154;4751;451864', '1;131567;2759;33154;33208;9606'])
+    print(interval_index.is_under('451864', '4751'))
+    print(interval_index.get_subtree_mask(pd.Series(['451864', '9606', '']), '4751'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Script of taxonomy_store.py is to keep a persistent local copy of the ENA taxonomy, so lookups need no network
+
+The store is a SQLite file with a taxon table keyed on tax_id and a taxon_ancestor table, one row per
+(ancestor, taxon) pair from the tax_lineage, so that lineage and subtree questions are an index look up.
+It can be filled in bulk by streaming a whole subtree from the portal, and is refreshed incrementally:
+only the tax_ids that are not in the store, or were fetched more than max_age ago, go to the portal.
+Tax_ids that the portal does not know are remembered too, so that they are not asked for on every run.
+It is off unless switched on, e.g. export ENA_TAXONOMY_STORE=1, as its taxa can be up to max_age old,
+and the file is in the script directory, so every run shares the one store wherever it is started from.
+
+usage:
+    configure_taxonomy_store(enabled = True)
+    store = get_taxonomy_store()
+    store.refresh(tax_id_list)
+    record_by_tax_id = store.get_records_by_tax_id(tax_id_list)
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x taxonomy_store.py
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from adaptive_chunking import IncompleteChunkedCallError
+from ena_portal_api import chunk_portal_api_call, ena_portal_api_stream, get_ena_portal_url
+
+logger = logging.getLogger(name = 'mylogger')
+
+ONE_DAY = 24 * 60 * 60
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_taxonomy_store_fields():
+    """
+    the portal taxon fields kept in the store
+    :return: list
+    """
+    return ['tax_id', 'tax_division', 'tag', 'scientific_name', 'tax_lineage', 'lineage']
+
+
+def get_sql_chunks(my_list, chunk_size=900):
+    """
+    to stay under the SQLite limit on the number of ? in a statement
+    """
+    for pos in range(0, len(my_list), chunk_size):
+        yield my_list[pos:pos + chunk_size]
+
+
+class TaxonomyStore:
+    """
+    SQLite backed taxonomy, N.B. all access is behind a lock, so can be shared between threads
+    """
+
+    def __init__(self, db_file, max_age=30 * ONE_DAY):
+        self.db_file = db_file
+        self.max_age = max_age
+        self.portal_fetch_total = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread = False, isolation_level = None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS taxon (
+                                  tax_id TEXT PRIMARY KEY,
+                                  scientific_name TEXT,
+                                  tax_division TEXT,
+                                  tag TEXT,
+                                  tax_lineage TEXT,
+                                  lineage TEXT,
+                                  found INTEGER,
+                                  last_fetched REAL)""")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS taxon_ancestor (
+                                  ancestor_id TEXT,
+                                  tax_id TEXT,
+                                  depth INTEGER,
+                                  PRIMARY KEY (ancestor_id, tax_id)) WITHOUT ROWID""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS taxon_ancestor_tax_id ON taxon_ancestor(tax_id)")
+
+    def upsert_records(self, records, fetched_time=None):
+        """
+        adds or replaces the records, and their rows in the ancestor index, in one transaction
+        :param records: list of portal taxon dicts, with at least the get_taxonomy_store_fields()
+        :param fetched_time: defaults to now
+        :return: number of records
+        """
+        if fetched_time is None:
+            fetched_time = time.time()
+        taxon_rows = []
+        ancestor_rows = []
+        for record in records:
+            tax_id = record['tax_id']
+            taxon_rows.append((tax_id, record.get('scientific_name', ''), record.get('tax_division', ''),
+                               record.get('tag', ''), record.get('tax_lineage', ''), record.get('lineage', ''),
+                               1, fetched_time))
+            for depth, ancestor_id in enumerate(record.get('tax_lineage', '').split(';')):
+                if ancestor_id != '':
+                    ancestor_rows.append((ancestor_id, tax_id, depth))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM taxon_ancestor WHERE tax_id = ?", [(row[0],) for row in taxon_rows])
+            self._conn.executemany("INSERT OR REPLACE INTO taxon VALUES (?, ?, ?, ?, ?, ?, ?, ?)", taxon_rows)
+            self._conn.executemany("INSERT OR REPLACE INTO taxon_ancestor VALUES (?, ?, ?)", ancestor_rows)
+            self._conn.execute("COMMIT")
+        return len(taxon_rows)
+
+    def mark_not_found(self, tax_ids, fetched_time=None):
+        """
+        remembers the tax_ids that the portal had nothing for, so they are only asked for again after max_age
+        """
+        if fetched_time is None:
+            fetched_time = time.time()
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO taxon (tax_id, found, last_fetched) VALUES (?, 0, ?)",
+                                   [(tax_id, fetched_time) for tax_id in tax_ids])
+
+    def get_ids_to_fetch(self, tax_ids):
+        """
+        :param tax_ids:
+        :return: sorted list of the tax_ids that are not in the store, or are older than max_age
+        """
+        wanted = sorted({str(tax_id) for tax_id in tax_ids if str(tax_id) != ''})
+        fresh = set()
+        oldest_ok = time.time() - self.max_age
+        with self._lock:
+            for chunk in get_sql_chunks(wanted):
+                cursor = self._conn.execute(
+                    f"SELECT tax_id FROM taxon WHERE last_fetched >= ? AND tax_id IN ({','.join('?' * len(chunk))})",
+                    [oldest_ok] + chunk)
+                fresh.update(row[0] for row in cursor)
+        return [tax_id for tax_id in wanted if tax_id not in fresh]
+
+    def refresh(self, tax_ids, force=False, max_retries=None, checkpoint_file=None):
+        """
+        incremental refresh: fetches from the portal only the tax_ids that are missing or stale
+        If some chunks could not be fetched, what was fetched is still stored, but only the tax_ids of the
+        chunks that were fetched can be marked not found, then the IncompleteChunkedCallError is re-raised
+        :param tax_ids:
+        :param force: if True fetches all of them
+        :param max_retries: see chunk_portal_api_call()
+        :param checkpoint_file: see chunk_portal_api_call()
+        :return: number of tax_ids fetched
+        """
+        if force:
+            to_fetch = sorted({str(tax_id) for tax_id in tax_ids if str(tax_id) != ''})
+        else:
+            to_fetch = self.get_ids_to_fetch(tax_ids)
+        if len(to_fetch) == 0:
+            return 0
+        logger.info(f"fetching {len(to_fetch)} taxa from the portal into the taxonomy store")
+        incomplete_error = None
+        try:
+            records = chunk_portal_api_call(f"{get_ena_portal_url()}search?", "taxon", get_taxonomy_store_fields(),
+                                            None, to_fetch, max_retries = max_retries,
+                                            checkpoint_file = checkpoint_file)
+        except IncompleteChunkedCallError as err:
+            (records, incomplete_error) = (err.data, err)
+        fetched_time = time.time()
+        self.upsert_records(records, fetched_time)
+        not_found = set(to_fetch) - {record['tax_id'] for record in records}
+        if incomplete_error is not None:
+            not_found -= incomplete_error.get_failed_ids()
+        self.mark_not_found(not_found, fetched_time)
+        self.portal_fetch_total += len(to_fetch)
+        if incomplete_error is not None:
+            raise incomplete_error
+        return len(to_fetch)
+
+    def bulk_fill(self, query="tax_tree(1)", batch_size=50000):
+        """
+        streams a whole subtree from the portal into the store, e.g. bulk_fill("tax_tree(4751)") for the fungi
+        :param query: portal taxon query
+        :param batch_size: records per transaction
+        :return: number of records stored
+        """
+        params = {
+            "result": "taxon",
+            "query": query,
+            "fields": ','.join(get_taxonomy_store_fields()),
+            "format": "tsv",
+            "limit": 0
+        }
+        record_total = 0
+        for batch in ena_portal_api_stream(f"{get_ena_portal_url()}search", params, batch_size = batch_size):
+            record_total += self.upsert_records(batch)
+            logger.info(f"bulk_fill stored {record_total} taxa for {query}")
+        return record_total
+
+    def get_records_by_tax_id(self, tax_ids):
+        """
+        N.B. no network, so call refresh first if they may not be there
+        :param tax_ids:
+        :return: dict of tax_id to record dict, only for those found
+        """
+        wanted = sorted({str(tax_id) for tax_id in tax_ids if str(tax_id) != ''})
+        by_tax_id = {}
+        fields = get_taxonomy_store_fields()
+        with self._lock:
+            for chunk in get_sql_chunks(wanted):
+                cursor = self._conn.execute(
+                    f"SELECT {','.join(fields)} FROM taxon WHERE found = 1 AND tax_id IN ({','.join('?' * len(chunk))})",
+                    chunk)
+                for row in cursor:
+                    by_tax_id[row[0]] = dict(zip(fields, row))
+        return by_tax_id
+
+    def get_record(self, tax_id):
+        return self.get_records_by_tax_id([tax_id]).get(str(tax_id))
+
+    def get_descendant_tax_ids(self, ancestor_id):
+        """
+        all the stored taxa in the subtree of ancestor_id, including itself, via the ancestor index
+        :param ancestor_id:
+        :return: set of tax_ids
+        """
+        with self._lock:
+            cursor = self._conn.execute("SELECT tax_id FROM taxon_ancestor WHERE ancestor_id = ?", (str(ancestor_id),))
+            return {row[0] for row in cursor}
+
+    def is_descendant(self, tax_id, ancestor_id):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM taxon_ancestor WHERE ancestor_id = ? AND tax_id = ?",
+                                     (str(ancestor_id), str(tax_id))).fetchone()
+        return row is not None
+
+    def get_pretty_taxonomy_rankings(self, tax_id, fetch_missing=True):
+        """
+        e.g. root(1);unclassified entries(2787823);unclassified sequences(12908);metagenomes(408169);ecological metagenomes(410657);ant fungus garden metagenome(797283)
+        :param tax_id:
+        :param fetch_missing: if True any taxa of the lineage not in the store are fetched first
+        :return: string, or None if not able to
+        """
+        tax_id = str(tax_id)
+        if fetch_missing:
+            self.refresh([tax_id])
+        record = self.get_record(tax_id)
+        if record is None or record['tax_lineage'] == '':
+            return None
+        lineage_ids = record['tax_lineage'].split(';')
+        if fetch_missing:
+            self.refresh(lineage_ids)
+        name_by_tax_id = {key: value['scientific_name'] for key, value in self.get_records_by_tax_id(lineage_ids).items()}
+        if any(lineage_id not in name_by_tax_id for lineage_id in lineage_ids):
+            return None
+        return ";".join(f"{name_by_tax_id[lineage_id]}({lineage_id})" for lineage_id in lineage_ids)
+
+    def get_stats(self):
+        with self._lock:
+            found_total = self._conn.execute("SELECT COUNT(*) FROM taxon WHERE found = 1").fetchone()[0]
+            not_found_total = self._conn.execute("SELECT COUNT(*) FROM taxon WHERE found = 0").fetchone()[0]
+            ancestor_total = self._conn.execute("SELECT COUNT(*) FROM taxon_ancestor").fetchone()[0]
+        return {"taxa": found_total, "not_found": not_found_total, "ancestor_rows": ancestor_total,
+                "portal_fetches": self.portal_fetch_total}
+
+    def print_summary(self):
+        out_string = f"*** Summary of taxonomy store {self.db_file} ***\n"
+        for key, value in self.get_stats().items():
+            out_string += f"{key.ljust(30)}: {value}\n"
+        return out_string
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_default_taxonomy_store_file():
+    """
+    :return: in the script directory, rather than the working dir, so that there is the one store
+    """
+    return os.path.join(script_dir, "taxonomy_store.sqlite")
+
+
+_store_settings = {
+    # off unless e.g. export ENA_TAXONOMY_STORE=1, as the taxa it serves can be up to max_age old
+    "enabled": os.environ.get("ENA_TAXONOMY_STORE", "") == "1",
+    "db_file": get_default_taxonomy_store_file(),
+    "max_age": 30 * ONE_DAY
+}
+_store = None
+_store_lock = threading.Lock()
+
+
+def configure_taxonomy_store(enabled=None, db_file=None, max_age=None):
+    """
+    change the settings of the shared store, the next get_taxonomy_store() reopens it
+    :param enabled: True to use the store, False (the default) makes the taxonomy lookups go straight to the portal
+    :param db_file:
+    :param max_age: seconds before a stored taxon is fetched again
+    :return: the settings dict
+    """
+    global _store
+    with _store_lock:
+        if enabled is not None:
+            _store_settings["enabled"] = enabled
+        if db_file is not None:
+            _store_settings["db_file"] = db_file
+        if max_age is not None:
+            _store_settings["max_age"] = max_age
+        if _store is not None:
+            _store.close()
+            _store = None
+    return _store_settings
+
+
+def get_taxonomy_store():
+    """
+    lazily opens the shared store
+    :return: TaxonomyStore or None if disabled
+    """
+    global _store
+    if not _store_settings["enabled"]:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TaxonomyStore(_store_settings["db_file"], max_age = _store_settings["max_age"])
+                logger.info(f"taxa are looked up in the store {_store_settings['db_file']}, so may be up to "
+                            f"{_store_settings['max_age'] // ONE_DAY} days old; "
+                            f"configure_taxonomy_store(enabled=False) or unset ENA_TAXONOMY_STORE to always go "
+                            f"to the portal")
+    return _store
+
+
+def main():
+    configure_taxonomy_store(enabled = True)
+    store = get_taxonomy_store()
+    store.refresh(['9606', '8860', '1'])
+    print(store.get_pretty_taxonomy_rankings('8860'))
+    print(store.print_summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import unittest
+from accession_bitmap import *
+from processed_categories import ProcessedCategories
+
+
+class TestAccessionBitmap(unittest.TestCase):
+
+    def setUp(self):
+        self.interner = AccessionInterner()
+        self.environmental = AccessionBitmap.from_accessions(['SAMEA1', 'SAMEA2', 'SAMEA3'], self.interner)
+        self.european = AccessionBitmap.from_accessions(['SAMEA3', 'SAMEA2', 'SAMEA4'], self.interner)
+
+    def test_intern(self):
+        self.assertEqual(list(self.interner.intern(['SAMEA4', 'SAMEA5', 'SAMEA1'])), [3, 4, 0])
+        self.assertEqual(self.interner.get_total(), 5)
+
+    def test_set_algebra(self):
+        self.assertEqual((self.environmental & self.european).get_accessions(), ['SAMEA2', 'SAMEA3'])
+        self.assertEqual(len(self.environmental | self.european), 4)
+        self.assertEqual((self.environmental - self.european).get_accessions(), ['SAMEA1'])
+        self.assertEqual((self.environmental ^ self.european).get_accessions(), ['SAMEA1', 'SAMEA4'])
+        self.assertEqual(get_intersection([self.environmental, self.european, self.environmental]),
+                         self.environmental & self.european)
+        self.assertIn('SAMEA1', self.environmental)
+        self.assertNotIn('SAMEA4', self.environmental)
+        self.assertNotIn('SAMEA99', self.environmental)
+        self.assertFalse(AccessionBitmap.from_accessions([], self.interner))
+
+    def test_different_interners(self):
+        with self.assertRaises(ValueError):
+            self.environmental & AccessionBitmap.from_accessions(['SAMEA1'], AccessionInterner())
+
+    def test_processed_categories(self):
+        processed_categories_obj = ProcessedCategories({
+            'marine': {'sample_acc_list': ['SAMEA1', 'SAMEA2'], 'sample_collection_obj': None},
+            'freshwater': {'sample_acc_list': ['SAMEA2', 'SAMEA3', 'SAMEA4'], 'sample_collection_obj': None}})
+        self.assertEqual(processed_categories_obj.get_intersection(['marine', 'freshwater']).get_accessions(),
+                         ['SAMEA2'])
+        self.assertEqual(len(processed_categories_obj.get_union(['marine', 'freshwater'])), 4)
+        overlap_table = processed_categories_obj.get_overlap_table()
+        self.assertEqual(overlap_table.loc['freshwater', 'marine'], 1)
+        self.assertEqual(overlap_table.loc['freshwater', 'freshwater'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
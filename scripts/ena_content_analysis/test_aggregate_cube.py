@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+import pandas as pd
+from aggregate_cube import *
+
+
+class TestAggregateCube(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        size = 2000
+        self.df = pd.DataFrame({
+            'continent': rng.choice(['europe', 'asia', 'africa', None], size),
+            'country_clean': rng.choice(['France', 'Spain', 'Japan', 'Kenya', None], size),
+            'ocean': pd.Categorical(rng.choice(['not ocean', 'Pacific Ocean', 'Atlantic Ocean'], size)),
+            'collection_year': pd.array(rng.choice([2001, 2002, None], size), dtype = 'Int64')})
+        self.dimensions = ['continent', 'country_clean', 'ocean', 'collection_year']
+        self.cube = AggregateCube(self.df, self.dimensions)
+
+    def test_counts_as_groupby(self):
+        for path_list in [['continent'], ['continent', 'country_clean'], ['ocean'], ['collection_year', 'ocean'],
+                          self.dimensions]:
+            expected = self.df.groupby(path_list, observed = True).size().to_frame('record_count').reset_index()
+            pd.testing.assert_frame_equal(self.cube.counts(path_list), expected, check_dtype = False)
+        self.assertLess(len(self.cube.cube_df), len(self.df))
+        self.assertEqual(self.cube.cube_df['record_count'].sum(), len(self.df))
+
+    def test_where(self):
+        df = self.df[self.df['continent'] == 'europe']
+        expected = df.groupby(['ocean'], observed = True).size().to_frame('count').reset_index()
+        pd.testing.assert_frame_equal(
+            self.cube.counts(['ocean'], name = 'count', where = lambda cube_df: cube_df['continent'] == 'europe'),
+            expected, check_dtype = False)
+
+    def test_not_a_dimension(self):
+        with self.assertRaises(SystemExit):
+            self.cube.counts(['lineage'])
+
+
+if __name__ == '__main__':
+    unittest.main()
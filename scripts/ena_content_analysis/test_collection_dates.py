@@ -0,0 +1,41 @@
+import unittest
+import pandas as pd
+from collection_dates import *
+from analyse_environmental_info import collection_date_year, create_year_bins
+
+
+class TestCollectionDates(unittest.TestCase):
+
+    def setUp(self):
+        self.raw_dates = pd.Series(["2019", "2019-05-01", "12/03/19", "1/2/2019 10:00", "1.2.2001", "12.3.99 x",
+                                    "circa 1999 or so", "a =123 1999 b", "05", "19", "2030", "missing",
+                                    "not collected", "N/A", "restricted access", "-", "", "12-Jan-2019 noon",
+                                    "2019-05-01T10:00:00Z", "May 2018", "0099", "85", "2019"],
+                                   index = range(100, 123))
+
+    def test_same_year_as_collection_date_year(self):
+        years = CollectionDateNormaliser().get_collection_years(self.raw_dates)
+        expected = pd.to_numeric(self.raw_dates.apply(collection_date_year), errors = 'coerce').astype('Int64')
+        self.assertEqual(list(years.index), list(self.raw_dates.index))
+        self.assertEqual(years.fillna(-1).tolist(), expected.fillna(-1).tolist())
+        self.assertEqual(years[102], 2019)
+        self.assertEqual(years[106], 1999)
+        self.assertTrue(pd.isna(years[111]))
+
+    def test_memo_table(self):
+        normaliser = CollectionDateNormaliser()
+        normaliser.get_collection_years(self.raw_dates)
+        self.assertEqual(len(normaliser.year_by_raw), self.raw_dates.nunique())
+        years = normaliser.get_collection_years(pd.Series(["2019", "1/1/2020"]))
+        self.assertEqual(years.tolist(), [2019, 2020])
+        self.assertEqual(len(normaliser.year_by_raw), self.raw_dates.nunique() + 1)
+
+    def test_year_bins(self):
+        years = pd.Series(list(range(1940, 2026)) + [None], dtype = 'Int64')
+        expected = [create_year_bins(int(year)) if not pd.isna(year) else None for year in years]
+        self.assertEqual(get_collection_year_bins(years).tolist(), expected)
+        self.assertEqual(create_year_bins(1949), "1950-pre")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from distinct_value_cache import DistinctValueCache
+from analyse_environmental_info import get_barcoding_genes
+
+
+class TestDistinctValueCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmp_dir.name, "barcoding_genes_cache.pickle")
+        self.calls = []
+        self.target_genes = pd.Series(["16S rRNA", "COI", "16S rRNA", "ITS2", "", "16S rRNA", None, "rbcL and matK"],
+                                      index = range(10, 18))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def counted_get_barcoding_genes(self, value):
+        self.calls.append(value)
+        return get_barcoding_genes(value)
+
+    def test_map_series(self):
+        cache = DistinctValueCache(self.counted_get_barcoding_genes)
+        results = cache.map_series(self.target_genes)
+        self.assertEqual(list(results.index), list(self.target_genes.index))
+        for (value, result) in zip(self.target_genes, results):
+            self.assertEqual(result, get_barcoding_genes(value) if isinstance(value, str) else None)
+        self.assertEqual(len(self.calls), 5)
+        cache.map_series(self.target_genes)
+        self.assertEqual(len(self.calls), 5)
+
+    def test_persisted(self):
+        DistinctValueCache(self.counted_get_barcoding_genes, self.cache_file, version = "1").map_series(self.target_genes)
+        self.assertTrue(os.path.exists(self.cache_file))
+        self.calls = []
+        results = DistinctValueCache(self.counted_get_barcoding_genes, self.cache_file,
+                                     version = "1").map_series(self.target_genes)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(results[11], ["COX1"])
+        DistinctValueCache(self.counted_get_barcoding_genes, self.cache_file, version = "2").map_series(self.target_genes)
+        self.assertEqual(len(self.calls), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+import os
+import tempfile
+import unittest
+from adaptive_chunking import AdaptiveChunkController, IncompleteChunkedCallError, load_failed_chunks, carve_chunks
+from ena_api_calls import setup_run_api_call
+from ena_portal_api import *
+from portal_api_metrics import configure_portal_metrics, get_portal_metrics
+from portal_api_stand_in import PortalApiStandIn
+from portal_response_cache import configure_portal_cache
+from study_collection import StudyCollection, study2sample
+
+
+class TestEnaPortalApi(unittest.TestCase):
+    """
+    runs against the local portal_api_stand_in, so does not need the network
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = PortalApiStandIn(n_studies = 20, n_samples = 1500, n_runs = 2000, n_taxa = 300).start()
+        configure_portal_cache(enabled = False)
+        configure_portal_metrics(write_at_exit = False)
+        configure_portal_url(cls.stand_in.get_url())
+        configure_query_byte_budget(byte_budget = get_default_query_byte_budget(), probe = False)   # whatever the env
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.checkpoint_file = os.path.join(cls.tmp_dir.name, "failed_portal_chunks.jsonl")
+
+    @classmethod
+    def tearDownClass(cls):
+        configure_portal_url(None)
+        get_portal_metrics().reset()    # so nothing is written at exit
+        configure_portal_metrics(write_at_exit = True)
+        cls.stand_in.stop()
+        cls.tmp_dir.cleanup()
+
+    def setUp(self):
+        self.stand_in.error_rate = 0.0
+        self.stand_in.reset_stats()
+
+    def test_chunk_portal_api_call(self):
+        sample_ids = [row["sample_accession"] for row in self.stand_in.tables.sample]
+        data = chunk_portal_api_call(get_ena_portal_url() + "search?", "sample", ["sample_accession", "country"],
+                                     None, sample_ids, checkpoint_file = self.checkpoint_file)
+        self.assertEqual([row["sample_accession"] for row in data], sample_ids)
+        self.assertGreater(self.stand_in.get_stats()["requests"], 1)
+
+    def test_chunk_portal_api_call_survives_errors(self):
+        self.stand_in.error_rate = 0.3
+        controller = AdaptiveChunkController(100, backoff_base = 0.001)
+        sample_ids = [row["sample_accession"] for row in self.stand_in.tables.sample]
+        data = chunk_portal_api_call(get_ena_portal_url() + "search?", "sample", ["sample_accession"], None,
+                                     sample_ids, chunk_controller = controller, checkpoint_file = self.checkpoint_file,
+                                     max_retries = 20)
+        self.assertEqual(len(data), len(sample_ids))
+        self.assertGreater(self.stand_in.get_stats()["errors"], 0)
+        self.assertEqual(load_failed_chunks(self.checkpoint_file), [])
+
+    def test_chunks_are_the_same_after_errors(self):
+        old_db_file = configure_portal_cache()["db_file"]
+        configure_portal_cache(enabled = True, db_file = os.path.join(self.tmp_dir.name, "chunk_cache.sqlite"))
+        sample_ids = [row["sample_accession"] for row in self.stand_in.tables.sample]
+        try:
+            self.stand_in.error_rate = 0.3
+            # the size is pinned, so that only the 5xx retries differ between the runs
+            controller = AdaptiveChunkController(100, min_chunk_size = 100, max_chunk_size = 100, backoff_base = 0.001)
+            data = chunk_portal_api_call(get_ena_portal_url() + "search?", "sample", ["sample_accession"], None,
+                                         sample_ids, chunk_controller = controller,
+                                         checkpoint_file = self.checkpoint_file, max_retries = 20)
+            self.stand_in.error_rate = 0.0
+            self.stand_in.reset_stats()
+            controller = AdaptiveChunkController(100, min_chunk_size = 100, max_chunk_size = 100)
+            cached_data = chunk_portal_api_call(get_ena_portal_url() + "search?", "sample", ["sample_accession"], None,
+                                                sample_ids, chunk_controller = controller,
+                                                checkpoint_file = self.checkpoint_file)
+        finally:
+            configure_portal_cache(enabled = False, db_file = old_db_file)
+        self.assertEqual(cached_data, data)
+        self.assertEqual(self.stand_in.get_stats()["requests"], 0)   # i.e. every chunk was a cache hit
+
+    def test_controller_tunes_chunk_size_and_concurrency(self):
+        controller = AdaptiveChunkController(400, max_concurrency = 8)
+        controller.record_failure(503)
+        controller.record_failure(503)
+        self.assertEqual(controller.get_concurrency(), 2)
+        self.assertEqual(controller.get_chunk_size(), 100)
+        controller.record_failure(400)   # not the server struggling
+        self.assertEqual(controller.get_concurrency(), 2)
+        self.assertEqual(controller.get_chunk_size(), 100)
+        controller.record_failure(413)   # too large, but not overloaded
+        controller.record_failure(413)   # the floor of 400 // 8
+        self.assertEqual((controller.get_chunk_size(), controller.get_concurrency()), (50, 2))
+        for _ in range(20):
+            controller.record_success(1.0)
+        self.assertEqual((controller.get_chunk_size(), controller.get_concurrency()), (1600, 8))
+
+    def test_carve_chunks(self):
+        id_list = [str(pos) for pos in range(10)]
+        self.assertEqual(carve_chunks(id_list, 4, 4, 0), [(4, ['4', '5', '6', '7'])])
+        self.assertEqual(carve_chunks(id_list, 4, 4, 1), [(4, ['4', '5', '6', '7'])])   # not aligned to 8
+        self.assertEqual(carve_chunks(id_list, 0, 4, 1)[0][1], id_list[0:8])
+        self.assertEqual(carve_chunks(id_list, 8, 4, -1), [(8, ['8']), (9, ['9'])])
+        self.assertEqual([offset for (offset, _) in carve_chunks(id_list, 0, 5, -1)], [0, 3])
+
+    def test_too_large_chunks_are_split(self):
+        self.stand_in.max_body_bytes = 2000   # about 110 sample accessions
+        controller = AdaptiveChunkController(400, min_chunk_size = 400, max_chunk_size = 400)
+        sample_ids = [row["sample_accession"] for row in self.stand_in.tables.sample]
+        try:
+            data = chunk_portal_api_call(get_ena_portal_url() + "search?", "sample", ["sample_accession"], None,
+                                         sample_ids, chunk_controller = controller,
+                                         checkpoint_file = self.checkpoint_file, max_retries = 0)
+        finally:
+            self.stand_in.max_body_bytes = None
+        self.assertEqual([row["sample_accession"] for row in data], sample_ids)
+        # each of the 4 blocks (400, 400, 400, 300) is split in half twice, i.e. 1 + 2 + 4 requests, none resent
+        self.assertEqual(self.stand_in.get_stats()["requests"], 4 * 7)
+
+    def test_metrics(self):
+        get_portal_metrics().reset()
+        self.stand_in.error_rate = 1.0
+        controller = AdaptiveChunkController(10, backoff_base = 0.001)
+        with self.assertRaises(IncompleteChunkedCallError) as context:
+            chunk_portal_api_call(get_ena_portal_url() + "search?", "sample", ["sample_accession"], None,
+                                  ["SAMEA1000000"], chunk_controller = controller,
+                                  checkpoint_file = self.checkpoint_file, max_retries = 2)
+        self.assertEqual(context.exception.data, [])
+        self.assertEqual(context.exception.get_failed_ids(), {"SAMEA1000000"})
+        self.stand_in.error_rate = 0.0
+        get_sample_run_accessions(["SAMEA1000000"])
+        summary = get_portal_metrics().get_summary()
+        self.assertEqual(summary["requests"], 4)
+        self.assertEqual(summary["errors"], 3)
+        self.assertEqual(summary["retries"], 2)
+        self.assertGreater(summary["bytes"], 0)
+        self.assertIsNotNone(summary["total_s"]["p99"])
+        os.remove(self.checkpoint_file)
+
+    def test_ena_portal_api_call_streams(self):
+        sample_ids = [row["sample_accession"] for row in self.stand_in.tables.sample[0:50]]
+        params = {"result": "sample", "includeAccessions": ",".join(sample_ids), "includeAccessionType": "sample",
+                  "fields": "sample_accession,country", "format": "json", "limit": 0}
+        (data, response) = ena_portal_api_call(get_ena_portal_url() + "search", params, "sample", sample_ids,
+                                               chunk_size = 7)   # so records and characters are split across chunks
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["sample_accession"] for row in data], sample_ids)
+        self.assertGreater(response.timing["bytes"], 0)
+        self.assertEqual(parse_json_text_chunks(["", " 4", "2"]), 42)
+
+    def test_ena_portal_api_call_caches_streamed_body(self):
+        old_db_file = configure_portal_cache()["db_file"]
+        configure_portal_cache(enabled = True, db_file = os.path.join(self.tmp_dir.name, "portal_cache.sqlite"))
+        try:
+            params = {"result": "sample", "fields": "sample_accession", "format": "json", "limit": 20}
+            (data, _) = ena_portal_api_call(get_ena_portal_url() + "search", params, "sample", [], chunk_size = 64)
+            (cached_data, cached_response) = ena_portal_api_call(get_ena_portal_url() + "search", params, "sample", [])
+        finally:
+            configure_portal_cache(enabled = False, db_file = old_db_file)
+        self.assertEqual(len(data), 20)
+        self.assertEqual(cached_data, data)
+        self.assertTrue(cached_response.from_cache)
+        self.assertEqual(self.stand_in.get_stats()["requests"], 1)
+
+    def test_ena_portal_api_call_does_not_keep_big_bodies(self):
+        old_db_file = configure_portal_cache()["db_file"]
+        configure_portal_cache(enabled = True, db_file = os.path.join(self.tmp_dir.name, "big_body_cache.sqlite"),
+                               max_entry_bytes = 500)
+        try:
+            params = {"result": "sample", "fields": "sample_accession", "format": "json", "limit": 20}
+            (data, _) = ena_portal_api_call(get_ena_portal_url() + "search", params, "sample", [], chunk_size = 64)
+            (uncached_data, uncached_response) = ena_portal_api_call(get_ena_portal_url() + "search", params,
+                                                                     "sample", [])
+            entries = get_portal_cache().get_stats()["entries"]
+        finally:
+            configure_portal_cache(enabled = False, db_file = old_db_file, max_entry_bytes = 64 * 1024 ** 2)
+        self.assertEqual(len(data), 20)
+        self.assertEqual(uncached_data, data)
+        self.assertFalse(getattr(uncached_response, "from_cache", False))
+        self.assertEqual(entries, 0)
+        kept_chunks = []
+        self.assertEqual("".join(keep_text_chunks(["ab", "cd", "ef"], kept_chunks, max_size = 3)), "abcdef")
+        self.assertEqual(kept_chunks, [None])
+
+    def test_query_byte_budget_is_probed(self):
+        self.assertEqual(get_query_byte_budget(get_ena_portal_url() + "search?", "sample", "study_accession",
+                                               "PRJEB000001"), get_default_query_byte_budget())
+        self.assertEqual(self.stand_in.get_stats()["requests"], 0)   # i.e. only probed when switched on
+        self.stand_in.max_body_bytes = 40000
+        configure_query_byte_budget(probe = True)
+        try:
+            url = get_ena_portal_url() + "search?"
+            byte_budget = get_query_byte_budget(url, "sample", "study_accession", "PRJEB000001")
+            probe_total = self.stand_in.get_stats()["requests"]
+            self.assertEqual(get_query_byte_budget(url, "sample", "study_accession", "PRJEB000001"), byte_budget)
+        finally:
+            self.stand_in.max_body_bytes = None
+            configure_query_byte_budget(probe = False)
+        self.assertGreater(byte_budget, 40000 // 2 * 0.8)
+        self.assertLess(byte_budget, 40000)
+        self.assertEqual(self.stand_in.get_stats()["requests"], probe_total)   # i.e. only probed once
+
+    def test_w_ands_keeps_the_order(self):
+        study_ids = [row["study_accession"] for row in self.stand_in.tables.study][::-1]
+        data = chunk_portal_api_call_w_ands(get_ena_portal_url() + "search?", "sample",
+                                            ["sample_accession", "study_accession"], "study_accession",
+                                            study_ids + study_ids[0:2], byte_budget = 1)
+        returned_study_ids = list(dict.fromkeys(row["study_accession"] for row in data))
+        self.assertEqual(returned_study_ids, [study_id for study_id in study_ids if study_id in returned_study_ids])
+        self.assertEqual(self.stand_in.get_stats()["requests"], len(study_ids))
+
+    def test_study2sample(self):
+        study_ids = [row["study_accession"] for row in self.stand_in.tables.study]
+        sample_ids = study2sample(study_ids, StudyCollection(), False)
+        self.assertEqual(sample_ids, sorted(row["sample_accession"] for row in self.stand_in.tables.sample))
+        self.assertEqual(self.stand_in.get_stats()["requests"], 1)
+
+    def test_get_sample_run_accessions(self):
+        sample_ids = [row["sample_accession"] for row in self.stand_in.tables.sample[0:10]]
+        run_ids = get_sample_run_accessions(sample_ids)
+        expected = sorted(row["run_accession"] for row in self.stand_in.tables.read_run
+                          if row["sample_accession"] in sample_ids)
+        self.assertEqual(run_ids, expected)
+
+    def test_setup_run_api_call(self):
+        records = setup_run_api_call("environmental_checklists", 0)
+        self.assertGreater(len(records), 0)
+        self.assertTrue(all(record["tax_id"] != "9606" for record in records))
+
+
+if __name__ == '__main__':
+    unittest.main()
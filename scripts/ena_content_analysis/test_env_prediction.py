@@ -0,0 +1,47 @@
+import unittest
+import pandas as pd
+from env_prediction import *
+
+
+class TestEnvPrediction(unittest.TestCase):
+
+    def test_env_tag_key(self):
+        self.assertEqual(get_env_tag_key('env_geo:marine;env_tax:marine;env_tax:marine'), 'env_tax:marine;env_geo:marine')
+        self.assertEqual(get_env_tag_key('env_tax:terrestrial;env_tax:freshwater'),
+                         'env_tax:freshwater;env_tax:terrestrial')
+        self.assertEqual(get_env_tag_key(None), "")
+
+    def test_table(self):
+        table = get_env_predictor().get_table()
+        self.assertGreaterEqual(len(table), 1024)
+        self.assertEqual(tuple(table.loc['env_tax:marine;env_geo:marine', ['env_prediction', 'env_confidence']]),
+                         ('marine', 'high'))
+        self.assertEqual(tuple(table.loc['env_geo:marine;env_geo:coastal', ['env_prediction', 'env_confidence']]),
+                         ('coastal', 'medium'))
+        self.assertEqual(tuple(table.loc['', ['env_prediction', 'env_confidence', 'env_prediction_hl']]),
+                         ('terrestrial_assumed', 'low', 'terrestrial_assumed'))
+        self.assertEqual(table.loc['env_tax:marine;env_tax:terrestrial', 'ocean_env_prediction'], 'marine')
+        # e.g. two env_geo: tags that are not a handled pair
+        self.assertTrue(pd.isna(table.loc['env_geo:freshwater;env_geo:brackish', 'env_prediction']))
+
+    def test_predict(self):
+        env_tags = pd.Series(['env_tax:marine;env_geo:marine', '', 'env_tax:terrestrial', None,
+                              'env_geo:marine;env_tax:marine', 'env_tax:marine;env_tax:terrestrial'],
+                             index = range(5, 11))
+        ocean = pd.Series(['not ocean', 'not ocean', 'Atlantic Ocean', None, 'not ocean', 'not ocean'],
+                          index = range(5, 11))
+        prediction_df = get_env_predictor().predict(env_tags, ocean)
+        self.assertEqual(list(prediction_df.index), list(env_tags.index))
+        self.assertEqual(list(prediction_df['env_prediction']),
+                         ['marine', 'terrestrial_assumed', 'marine', 'terrestrial_assumed', 'marine', 'mixed'])
+        self.assertEqual(list(prediction_df['env_confidence']), ['high', 'low', 'medium', 'low', 'high', 'low'])
+        self.assertEqual(list(prediction_df['env_prediction_hl']),
+                         ['aquatic', 'terrestrial_assumed', 'aquatic', 'terrestrial_assumed', 'aquatic', 'mixed'])
+
+    def test_not_assigned(self):
+        with self.assertRaises(SystemExit):
+            get_env_predictor().predict(pd.Series(['env_geo:freshwater;env_geo:brackish']))
+
+
+if __name__ == '__main__':
+    unittest.main()
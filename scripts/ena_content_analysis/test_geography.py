@@ -1,5 +1,6 @@
 import unittest
-from geography import Geography
+import pandas as pd
+from geography import Geography, CountryMatcher, clean_insdc_country_term
 
 class TestGeography(unittest.TestCase):
 
@@ -20,5 +21,40 @@ class TestGeography(unittest.TestCase):
         self.assertEqual(clean_insdc_country_term('FRANCE:Paris'), 'France')
         self.assertEqual(clean_insdc_country_term('Antigua and barbuda'), 'Antigua and Barbuda')
 
+    def test_country_matcher(self):
+        country_matcher = CountryMatcher(self.geography)
+        raw_countries = pd.Series(['UK: Norfolk', 'USA: Alaska', 'GAZ:Spain', '', 'near nigeria coast', 'North sea',
+                                   'South Sudan: Juba', '.', 'UK: Norfolk'], index = range(10, 19))
+        self.assertEqual(list(country_matcher.clean_country_series(raw_countries)),
+                         ['United Kingdom', 'United States of America', 'Spain', 'missing', 'Nigeria', 'North Sea',
+                          'South Sudan', 'Unknown', 'United Kingdom'])
+        self.assertEqual(list(country_matcher.clean_country_series(raw_countries).index), list(raw_countries.index))
+        self.assertEqual(list(country_matcher.get_european_sea_series(pd.Series(['north sea: Dogger', 'France']))),
+                         ['North Sea', None])
+
+    def test_annotate(self):
+        countries = pd.Series(['France', 'United Kingdom', 'North Sea', 'Pacific Ocean', 'Kenya', 'Unknown', 'France'],
+                              index = range(5, 12))
+        annotation = self.geography.annotate(countries)
+        self.assertEqual(list(annotation.index), list(countries.index))
+        self.assertEqual(list(annotation['continent']),
+                         ['europe', 'europe', 'ocean', 'ocean', 'africa', 'undetermined', 'europe'])
+        self.assertEqual(list(annotation['ocean'])[2:6], ['North Sea', 'Pacific Ocean', 'not ocean', 'not ocean'])
+        self.assertEqual(list(annotation['european_sea'].isna()), [True, True, False, True, True, True, True])
+        self.assertEqual(list(annotation['is_eu']), [True, False, False, False, False, False, True])
+        self.assertEqual(list(annotation['is_europe']), [True, True, True, False, False, False, True])
+        for country in countries:
+            row = annotation[countries == country].iloc[0]
+            self.assertEqual(row['continent'], self.geography.get_continent(country))
+            self.assertEqual(row['is_europe'], self.geography.is_insdc_country_in_europe(country))
+
+    def test_add_annotation_columns_with_a_duplicated_index(self):
+        df = pd.DataFrame({'country_clean': ['France', 'Kenya', 'North Sea'], 'continent': ['old', 'old', 'old']},
+                          index = [0, 0, 1])
+        self.geography.add_annotation_columns(df)
+        self.assertEqual(len(df), 3)
+        self.assertEqual(list(df['continent']), ['europe', 'africa', 'ocean'])
+        self.assertEqual(list(df['is_eu']), [True, False, False])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,24 @@
+import unittest
+from multi_pattern_matcher import MultiPatternMatcher
+
+
+class TestMultiPatternMatcher(unittest.TestCase):
+
+    def test_search(self):
+        matcher = MultiPatternMatcher(['Niger', 'Nigeria', 'Sea', 'North Sea', 'Falkland Islands (Islas Malvinas)'])
+        self.assertEqual(matcher.search("sediment, NIGERIA coast"), (10, 17, 'Nigeria'))
+        self.assertEqual(matcher.search("Niger delta"), (0, 5, 'Niger'))
+        self.assertEqual(matcher.search("the north sea"), (4, 13, 'North Sea'))
+        self.assertEqual(matcher.search("Sargasso Sea"), (9, 12, 'Sea'))
+        self.assertEqual(matcher.search("Falkland Islands (Islas Malvinas)")[2], 'Falkland Islands (Islas Malvinas)')
+        self.assertIsNone(matcher.search("nothing here"))
+        self.assertIsNone(matcher.search(None))
+
+    def test_case_sensitive(self):
+        matcher = MultiPatternMatcher(['US'], ignore_case = False)
+        self.assertIsNone(matcher.search("Brussels"))
+        self.assertEqual(matcher.search("the US"), (4, 6, 'US'))
+
+
+if __name__ == '__main__':
+    unittest.main()
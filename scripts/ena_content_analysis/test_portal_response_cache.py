@@ -0,0 +1,59 @@
+import os
+import tempfile
+import time
+import unittest
+from portal_response_cache import *
+
+
+class TestPortalResponseCache(unittest.TestCase):
+
+    url = "https://www.ebi.ac.uk/ena/portal/api/search?"
+    params = {'result': 'taxon', 'includeAccessions': '8860,9606', 'format': 'json', 'fields': 'tax_id', 'limit': 0}
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = PortalResponseCache(os.path.join(self.tmp_dir.name, "test_cache.sqlite"))
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(self.cache.get(self.url, self.params))
+        self.cache.put(self.url, self.params, '[{"tax_id": "8860"}]')
+        self.assertEqual(self.cache.get(self.url, self.params), '[{"tax_id": "8860"}]')
+        stats = self.cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_key_is_normalised(self):
+        reordered_params = dict(reversed(list(self.params.items())))
+        self.assertEqual(self.cache.make_key(self.url, self.params), self.cache.make_key(self.url, reordered_params))
+        self.assertEqual(self.cache.make_key(self.url + "result=taxon", {'limit': 0}),
+                         self.cache.make_key(self.url, {'result': 'taxon', 'limit': '0'}))
+
+    def test_expiry_by_result_type(self):
+        self.cache.ttl_by_result_type['taxon'] = 0
+        self.cache.put(self.url, self.params, '[]')
+        time.sleep(0.01)
+        self.assertIsNone(self.cache.get(self.url, self.params))
+        self.assertEqual(self.cache.get_stats()['expired'], 1)
+
+    def test_lru_eviction(self):
+        self.cache.max_bytes = 250
+        for i in range(3):
+            self.cache.put(self.url, {'result': 'sample', 'offset': i}, 'x' * 100)
+            self.cache.get(self.url, {'result': 'sample', 'offset': 0})  # keeps offset 0 recently used
+        self.assertIsNotNone(self.cache.get(self.url, {'result': 'sample', 'offset': 0}))
+        self.assertIsNone(self.cache.get(self.url, {'result': 'sample', 'offset': 1}))
+        self.assertLessEqual(self.cache.get_stats()['total_bytes'], 250)
+
+
+    def test_shared_cache_is_opt_in(self):
+        if os.environ.get("ENA_PORTAL_CACHE", "") != "1":
+            self.assertIsNone(get_portal_cache())
+        self.assertTrue(os.path.isabs(get_default_cache_file()))
+        self.assertEqual(configure_portal_cache()["db_file"], get_default_cache_file())
+
+if __name__ == '__main__':
+    unittest.main()
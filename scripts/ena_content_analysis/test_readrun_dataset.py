@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from readrun_dataset import *
+
+
+class TestReadrunDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.name = os.path.join(self.tmp_dir.name, "env_readrun_detail")
+        self.df = pd.DataFrame({
+            'run_accession': ['ERR1', 'ERR2', 'ERR3', 'ERR4'],
+            'tax_id': ['408172', '256318', '408172', '9606'],
+            'query_type': ['default_checklists', 'environmental_checklists', 'environmental_checklists',
+                           'environmental_checklists'],
+            'checklist': ['ERC000011', '', 'ERC000012', None]})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        save_readrun_frame(self.df, self.name)
+        self.assertTrue(os.path.isdir(get_dataset_dir(self.name)))
+        df = load_readrun_frame(self.name).sort_values('run_accession').reset_index(drop = True)
+        self.assertEqual(list(df['run_accession']), ['ERR1', 'ERR2', 'ERR3', 'ERR4'])
+        self.assertEqual(list(df['checklist']), ['ERC000011', '', 'ERC000012', ''])
+        self.assertEqual(list(df['tax_id']), list(self.df['tax_id']))
+
+    def test_columns_and_partitions(self):
+        save_readrun_frame(self.df, self.name)
+        df = load_readrun_frame(self.name, columns = ['run_accession'],
+                                filters = {'query_type': 'environmental_checklists', 'checklist': ['']})
+        self.assertEqual(list(df.columns), ['run_accession'])
+        self.assertEqual(sorted(df['run_accession']), ['ERR2', 'ERR4'])
+        df = load_readrun_frame(self.name, columns = ['run_accession', 'tax_id'], as_category = True,
+                                memory_map = True)
+        self.assertIsInstance(df['tax_id'].dtype, pd.CategoricalDtype)
+
+    def test_partition_replaced(self):
+        save_readrun_frame(self.df, self.name)
+        save_readrun_frame(pd.DataFrame({'run_accession': ['ERR5'], 'tax_id': ['1'],
+                                         'query_type': ['default_checklists'], 'checklist': ['ERC000011']}),
+                           self.name)
+        df = load_readrun_frame(self.name)
+        self.assertEqual(sorted(df['run_accession']), ['ERR2', 'ERR3', 'ERR4', 'ERR5'])
+
+    def test_pickle_fallback(self):
+        pickle_file = os.path.join(self.tmp_dir.name, "old.pickle")
+        pd.to_pickle(self.df.to_dict('records'), pickle_file)
+        df = load_readrun_frame(self.name, columns = ['run_accession'], filters = {'checklist': ''},
+                                pickle_file = pickle_file)
+        self.assertEqual(list(df['run_accession']), ['ERR2', 'ERR4'])
+        self.assertIsNone(load_readrun_frame(self.name))
+
+    def test_two_pickle_migration(self):
+        """
+        as get_env_readrun_detail(), the pickle of the second query_type is read once the first is in the dataset
+        """
+        pickle_files = {'default_checklists': "read_run_allinsdc_defaultgeneric.json.pickle",
+                        'environmental_checklists': "read_run_allinsdc_detail.pickle"}
+        for query_type, pickle_file in pickle_files.items():
+            pickle_file = os.path.join(self.tmp_dir.name, pickle_file)
+            pd.to_pickle(self.df[self.df['query_type'] == query_type].to_dict('records'), pickle_file)
+            filters = {'query_type': [query_type]}
+            self.assertFalse(has_query_type_partitions(get_dataset_dir(self.name), filters))
+            df = load_readrun_frame(self.name, filters = filters, pickle_file = pickle_file)
+            self.assertGreater(len(df), 0)
+            save_readrun_frame(df, self.name)
+            self.assertTrue(has_query_type_partitions(get_dataset_dir(self.name), filters))
+            os.remove(pickle_file)
+        df = load_readrun_frame(self.name)
+        self.assertEqual(sorted(df['run_accession']), ['ERR1', 'ERR2', 'ERR3', 'ERR4'])
+        self.assertEqual(len(load_readrun_frame(self.name, filters = {'query_type': ['environmental_checklists']})), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from readrun_dataset import save_readrun_frame
+from readrun_pipeline import *
+
+
+class TestReadrunPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.name = os.path.join(self.tmp_dir.name, "env_readrun_detail")
+        self.df = pd.DataFrame({
+            'run_accession': ['ERR1', 'ERR2', 'ERR3', 'ERR4'],
+            'library_strategy': ['WGS', 'AMPLICON', 'OTHER', 'AMPLICON'],
+            'lat': ['1.5', '', '3', 'not a lat'],
+            'study_title': ['a', 'b', 'c', 'd'],
+            'query_type': ['default_checklists', 'environmental_checklists', 'environmental_checklists',
+                           'environmental_checklists'],
+            'checklist': ['ERC000011', '', 'ERC000012', 'ERC000012']})
+        save_readrun_frame(self.df, self.name)
+        self.stage_columns = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_pipeline(self):
+        def clean_lat(df):
+            self.stage_columns.append(sorted(df.columns))
+            df['lat'] = pd.to_numeric(df['lat'], errors = 'coerce')
+            return df
+
+        pipeline = LazyReadrunPipeline(self.name, filters = {'query_type': ['environmental_checklists']})
+        pipeline.filter_isin('library_strategy', ['WGS', 'AMPLICON'])
+        pipeline.stage("clean_lat", clean_lat, ['lat', 'run_accession'])
+        pipeline.stage("has_lat", lambda df: df.loc[df['lat'].notna()], [])
+        pipeline.stage("report", lambda df: None, ['lat', 'missing_column'])
+        return pipeline
+
+    def test_plan(self):
+        pipeline = self.get_pipeline()
+        self.assertEqual(pipeline.get_scan_columns(), ['library_strategy', 'lat', 'run_accession', 'missing_column'])
+        self.assertIn("3. report", pipeline.explain())
+        self.assertIsNone(pipeline.stage("all", lambda df: df, None).get_scan_columns())
+
+    def test_collect(self):
+        df = self.get_pipeline().collect()
+        # only the projected columns and the filtered rows were read
+        self.assertEqual(self.stage_columns, [['lat', 'library_strategy', 'run_accession']])
+        self.assertEqual(list(df['run_accession']), [])
+        self.df.loc[3, 'lat'] = '4'
+        save_readrun_frame(self.df, self.name)
+        self.assertEqual(list(self.get_pipeline().collect()['run_accession']), ['ERR4'])
+
+    def test_report_before_filters(self):
+        reported = []
+        pipeline = self.get_pipeline().report_before_filters("counts", lambda df: reported.append(df),
+                                                             ['library_strategy'])
+        self.assertIn("before the filters: counts of library_strategy", pipeline.explain())
+        pipeline.collect()
+        pipeline.run(self.df)
+        for df in reported:   # the partition filter, but not the library_strategy one
+            self.assertEqual(list(df.columns), ['library_strategy'])
+            self.assertEqual(sorted(df['library_strategy']), ['AMPLICON', 'AMPLICON', 'OTHER'])
+        self.assertEqual(len(reported), 2)
+
+    def test_run(self):
+        self.df.loc[3, 'lat'] = '4'
+        df = self.get_pipeline().run(self.df)
+        self.assertEqual(list(df['run_accession']), ['ERR4'])
+        self.assertEqual(list(df['lat']), [4.0])
+        self.assertEqual(list(self.df['lat']), ['1.5', '', '3', '4'])
+
+
+if __name__ == '__main__':
+    unittest.main()
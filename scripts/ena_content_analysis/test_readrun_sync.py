@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from ena_portal_api import configure_portal_url
+from portal_api_metrics import configure_portal_metrics, get_portal_metrics
+from portal_api_stand_in import PortalApiStandIn
+from portal_response_cache import configure_portal_cache
+from readrun_dataset import get_dataset_dir, load_readrun_frame
+from readrun_sync import *
+
+
+class TestReadrunSync(unittest.TestCase):
+    """
+    runs against the local portal_api_stand_in, so does not need the network
+    """
+
+    def setUp(self):
+        self.stand_in = PortalApiStandIn(n_studies = 10, n_samples = 300, n_runs = 400, n_taxa = 100).start()
+        configure_portal_cache(enabled = False)
+        configure_portal_metrics(write_at_exit = False)
+        configure_portal_url(self.stand_in.get_url())
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.name = os.path.join(self.tmp_dir.name, "env_readrun_detail")
+
+    def tearDown(self):
+        configure_portal_url(None)
+        get_portal_metrics().reset()
+        configure_portal_metrics(write_at_exit = True)
+        self.stand_in.stop()
+        self.tmp_dir.cleanup()
+
+    def get_local_runs(self):
+        df = load_readrun_frame(self.name, filters = {'query_type': ['environmental_checklists']})
+        return df.set_index('run_accession')
+
+    def test_full_then_incremental(self):
+        sync_stats = sync_env_readrun_detail("environmental_checklists", self.name)
+        self.assertEqual(sync_stats['mode'], "full")
+        self.assertEqual(sync_stats['inserted'], sync_stats['fetched'])
+        df_local = self.get_local_runs()
+        self.assertEqual(len(df_local), sync_stats['fetched'])
+        high_water_mark = get_high_water_mark(get_dataset_dir(self.name), "environmental_checklists")
+        self.assertEqual(high_water_mark, df_local['last_updated'].max())
+
+        # one run is changed and moved to another checklist, one new run is made public
+        changed_run = next(row for row in self.stand_in.tables.read_run if row['run_accession'] in df_local.index)
+        changed_run.update({'library_strategy': "CHANGED", 'checklist': "ERC000055", 'last_updated': "2099-01-01"})
+        new_run = dict(changed_run, run_accession = "ERR99999999", first_public = "2099-01-02",
+                       last_updated = "2099-01-02")
+        self.stand_in.tables.read_run.append(new_run)
+
+        sync_stats = sync_env_readrun_detail("environmental_checklists", self.name)
+        self.assertEqual(sync_stats['mode'], "incremental")
+        self.assertEqual(sync_stats['high_water_mark'], high_water_mark)
+        self.assertLess(sync_stats['fetched'], len(df_local))
+        self.assertEqual(sync_stats['inserted'], 1)
+        self.assertGreaterEqual(sync_stats['updated'], 1)
+        df_synced = self.get_local_runs()
+        self.assertEqual(len(df_synced), len(df_local) + 1)
+        self.assertEqual(df_synced.loc[changed_run['run_accession'], 'library_strategy'], "CHANGED")
+        self.assertEqual(df_synced.loc[changed_run['run_accession'], 'checklist'], "ERC000055")
+        self.assertIn("ERR99999999", df_synced.index)
+
+        sync_stats = sync_env_readrun_detail("environmental_checklists", self.name)
+        self.assertEqual((sync_stats['high_water_mark'], sync_stats['fetched'], sync_stats['inserted']),
+                         ("2099-01-02", 1, 0))
+        self.assertEqual(len(self.get_local_runs()), len(df_synced))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from ena_api_calls import setup_run_api_call
+from ena_portal_api import configure_portal_url
+from portal_api_metrics import configure_portal_metrics, get_portal_metrics
+from portal_api_stand_in import PortalApiStandIn
+from portal_response_cache import configure_portal_cache
+from readrun_windows import *
+import readrun_windows
+
+
+class TestReadrunWindows(unittest.TestCase):
+    """
+    runs against the local portal_api_stand_in, so does not need the network
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = PortalApiStandIn(n_studies = 10, n_samples = 300, n_runs = 400, n_taxa = 100).start()
+        configure_portal_cache(enabled = False)
+        configure_portal_metrics(write_at_exit = False)
+        configure_portal_url(cls.stand_in.get_url())
+        cls.expected_runs = sorted(record['run_accession']
+                                   for record in setup_run_api_call("environmental_checklists", 0))
+
+    @classmethod
+    def tearDownClass(cls):
+        configure_portal_url(None)
+        get_portal_metrics().reset()
+        configure_portal_metrics(write_at_exit = True)
+        cls.stand_in.stop()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.name = os.path.join(self.tmp_dir.name, "env_readrun_windows")
+        self.stand_in.reset_stats()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_plan(self):
+        windows = plan_first_public_windows(2012, 2014)
+        self.assertEqual([window_id for (window_id, window_query) in windows], ["pre-2012", "2012", "2013", "2014-on"])
+        self.assertEqual(windows[1][1], "first_public>=2012-01-01 AND first_public<2013-01-01")
+        self.assertEqual(plan_checklist_windows("default_checklists")[-1], ("other", 'NOT (CHECKLIST="ERC000011")'))
+
+    def test_windows_cover_the_query_once(self):
+        for window_by in ["first_public", "checklist"]:
+            df = download_readrun_windows("environmental_checklists", self.name + window_by, window_by = window_by,
+                                          start_year = 2012, end_year = 2020)
+            self.assertEqual(sorted(df['run_accession']), self.expected_runs)
+
+    def test_resume(self):
+        real_fetch_readrun_window = readrun_windows.fetch_readrun_window
+
+        def crash_on_2015(dataset_dir, query_type, window_id, window_query):
+            if window_id == "2015":
+                raise RuntimeError("connection lost")
+            return real_fetch_readrun_window(dataset_dir, query_type, window_id, window_query)
+
+        with mock.patch.object(readrun_windows, 'fetch_readrun_window', side_effect = crash_on_2015):
+            with self.assertRaises(RuntimeError):
+                download_readrun_windows("environmental_checklists", self.name, start_year = 2012, end_year = 2020)
+        dataset_dir = get_dataset_dir(self.name)
+        self.assertFalse(is_window_complete(dataset_dir, "environmental_checklists", "2015"))
+        self.assertTrue(is_window_complete(dataset_dir, "environmental_checklists", "2016"))
+
+        self.stand_in.reset_stats()
+        df = download_readrun_windows("environmental_checklists", self.name, start_year = 2012, end_year = 2020)
+        self.assertEqual(self.stand_in.get_stats()["requests"], 1)
+        self.assertEqual(sorted(df['run_accession']), self.expected_runs)
+
+        clear_readrun_windows("environmental_checklists", self.name)
+        self.assertFalse(is_window_complete(dataset_dir, "environmental_checklists", "2016"))
+
+
+if __name__ == '__main__':
+    unittest.main()
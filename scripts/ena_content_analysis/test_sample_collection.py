@@ -0,0 +1,127 @@
+import unittest
+from unittest import mock
+import pandas as pd
+from sample import Sample
+from sample_collection import SampleCollection
+from taxonomy import taxon_collection
+
+
+class TestSampleCollection(unittest.TestCase):
+    """
+    the same samples as Sample objects and as a table, so the two modes can be compared. No network
+    """
+
+    def setUp(self):
+        self.sample_df = pd.DataFrame({
+            'sample_accession': ['SAMEA1', 'SAMEA2', 'SAMEA3', 'SAMEA4'],
+            'study_accession': ['PRJEB1', 'PRJEB1;PRJEB2', '', 'PRJEB3'],
+            'is_environmental_sample': [True, True, False, True],
+            'country_is_european': [True, False, True, True],
+            'sample_tag_is_marine': [True, False, False, True],
+            'sample_tag_is_freshwater': [False, True, False, False],
+            'tax_id': ['8860', '9606', '', '12345']
+        })
+        sample_set = set()
+        for row in self.sample_df.to_dict('records'):
+            sample_obj = Sample(row['sample_accession'])
+            sample_obj.study_accession = row['study_accession']
+            sample_obj.tax_id = row['tax_id']
+            sample_obj.setEnvironmentalSample(row['is_environmental_sample'])
+            sample_obj.country_is_european = row['country_is_european']
+            sample_obj.sample_tag_is_marine = row['sample_tag_is_marine']
+            sample_obj.sample_tag_is_freshwater = row['sample_tag_is_freshwater']
+            sample_set.add(sample_obj)
+        self.object_collection = SampleCollection('test')
+        self.object_collection.put_sample_set(sample_set)
+        self.columnar_collection = SampleCollection('test')
+        self.columnar_collection.put_sample_table(self.sample_df)
+
+    def test_is_columnar(self):
+        self.assertFalse(self.object_collection.is_columnar())
+        self.assertTrue(self.columnar_collection.is_columnar())
+
+    def test_get_sample_table(self):
+        sample_table = self.object_collection.get_sample_table()
+        self.assertEqual(len(sample_table), 4)
+        self.assertEqual(set(sample_table.columns), set(Sample.text_fields) | set(Sample.flag_bits))
+        self.assertFalse(self.columnar_collection.get_sample_table()['sample_tag_is_terrestrial'].any())
+
+    def test_sample_table_is_rebuilt(self):
+        self.assertEqual(sorted(self.object_collection.get_sample_tag_list('marine')), ['SAMEA1', 'SAMEA4'])
+        sample_obj = next(sample_obj for sample_obj in self.object_collection.get_sample_objs()
+                          if sample_obj.sample_accession == 'SAMEA2')
+        sample_obj.sample_tag_is_marine = True
+        self.assertEqual(sorted(self.object_collection.get_sample_tag_list('marine')), ['SAMEA1', 'SAMEA2', 'SAMEA4'])
+        new_sample_obj = Sample('SAMEA5')
+        new_sample_obj.country_is_european = True
+        for collection in [self.object_collection, self.columnar_collection]:
+            collection.add_sample(new_sample_obj)
+            self.assertEqual(collection.get_sample_set_size(), 5)
+            self.assertIn('SAMEA5', collection.get_european_sample_accession_list())
+            self.assertIn('SAMEA5', collection.get_all_sample_acc_set())
+
+    def test_sample_table_sees_text_field_changes(self):
+        self.object_collection.get_sample_table()
+        sample_obj = next(sample_obj for sample_obj in self.object_collection.get_sample_objs()
+                          if sample_obj.sample_accession == 'SAMEA2')
+        sample_obj.country_clean = 'France'
+        sample_table = self.object_collection.get_sample_table()
+        self.assertEqual(sample_table.loc[sample_table['sample_accession'] == 'SAMEA2', 'country_clean'].tolist(),
+                         ['France'])
+        for sample_number in range(5, 105):
+            self.columnar_collection.add_sample(Sample(f'SAMEA{sample_number}'))
+        self.assertEqual(self.columnar_collection.get_sample_set_size(), 104)
+        self.assertEqual(self.columnar_collection.get_sample_table().index[-1], 103)
+
+    def test_sample_coll_df_columns(self):
+        for collection in [self.object_collection, self.columnar_collection]:
+            sample_df = collection.get_sample_coll_df()
+            self.assertFalse(any(column.startswith('sample_tag_is_') for column in sample_df.columns))
+            self.assertIn('category', sample_df.columns)
+            self.assertIn('country_is_european', sample_df.columns)
+
+    def test_masked_lists(self):
+        for collection in [self.object_collection, self.columnar_collection]:
+            self.assertEqual(sorted(collection.get_european_sample_accession_list()), ['SAMEA1', 'SAMEA3', 'SAMEA4'])
+            self.assertEqual(sorted(collection.get_sample_tag_list('marine')), ['SAMEA1', 'SAMEA4'])
+            self.assertEqual(collection.get_sample_tag_list('freshwater'), ['SAMEA2'])
+            self.assertEqual(collection.get_sample_tag_list('unknown'), [])
+            self.assertEqual(collection.get_all_sample_acc_set(), {'SAMEA1', 'SAMEA2', 'SAMEA3', 'SAMEA4'})
+        self.assertEqual(sorted(sample_obj.sample_accession
+                                for sample_obj in self.object_collection.get_environmental_sample_list()),
+                         ['SAMEA1', 'SAMEA2', 'SAMEA4'])
+        self.assertEqual(self.columnar_collection.get_environmental_sample_list(), ['SAMEA1', 'SAMEA2', 'SAMEA4'])
+
+    def test_get_sample_collection_stats(self):
+        stats_dict = self.columnar_collection.get_sample_collection_stats()
+        self.assertEqual(len(stats_dict['by_sample_id']), 4)
+        self.assertFalse(stats_dict['by_sample_id']['SAMEA3']['is_environmental_sample'])
+        self.assertEqual(sorted(stats_dict['by_study_id']), ['PRJEB1', 'PRJEB2', 'PRJEB3'])
+        self.assertEqual(list(stats_dict['by_study_id']['PRJEB1']['sample_id']), ['SAMEA2'])
+        self.assertEqual(self.columnar_collection.environmental_study_accession_set, {'PRJEB1', 'PRJEB2', 'PRJEB3'})
+
+    def test_addTaxonomyAnnotation(self):
+        test_taxon_collection = taxon_collection([
+            {'tax_id': '8860', 'scientific_name': 'Chloephaga melanoptera',
+             'tag': 'marine;marine_high_confidence;freshwater_medium_confidence;terrestrial_low_confidence'},
+            {'tax_id': '9606', 'scientific_name': 'Homo sapiens', 'tag': ''}])
+        with mock.patch('sample_collection.generate_taxon_collection', return_value = test_taxon_collection):
+            self.object_collection.addTaxonomyAnnotation()
+            self.columnar_collection.addTaxonomyAnnotation()
+        self.assertEqual([sample_obj.sample_accession for sample_obj in self.object_collection.tax_isMarine_set],
+                         ['SAMEA1'])
+        self.assertEqual(self.object_collection.tax_isTerrestrial_set, set())
+        self.assertEqual(self.columnar_collection.tax_isFreshwater_set, {'SAMEA1'})
+        self.assertEqual(self.object_collection.tax_id_set, {'8860', '9606', '', '12345'})
+        self.assertEqual(list(self.columnar_collection.get_tax_flag_mask('isMarine')), [True, False, False, False])
+        marine_bitmap = self.columnar_collection.get_category_bitmap('isMarine')
+        self.assertEqual((marine_bitmap & self.object_collection.get_category_bitmap('country_is_european')).get_accessions(),
+                         ['SAMEA1'])
+        self.assertEqual(len(self.object_collection.get_category_bitmap()), 4)
+        taxon_by_sample_acc = {sample_obj.sample_accession: sample_obj.taxonomy_obj.tax_id
+                               for sample_obj in self.object_collection.get_sample_objs()}
+        self.assertEqual(taxon_by_sample_acc, {'SAMEA1': '8860', 'SAMEA2': '9606', 'SAMEA3': '', 'SAMEA4': ''})
+
+
+if __name__ == '__main__':
+    unittest.main()
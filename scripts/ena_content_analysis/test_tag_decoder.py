@@ -0,0 +1,60 @@
+import unittest
+import pandas as pd
+from tag_decoder import *
+from taxonomy import taxon, taxon_collection
+
+
+class TestTagDecoder(unittest.TestCase):
+
+    def setUp(self):
+        self.tags = pd.Series(['marine;marine_high_confidence;env_tax:marine;env_geo:marine', '',
+                               'terrestrial_low_confidence;env_geo:terrestrial', None,
+                               'marine;marine_high_confidence;env_tax:marine;env_geo:marine'])
+        self.tag_decoder = TagDecoder(self.tags)
+
+    def test_unique_total(self):
+        self.assertEqual(self.tag_decoder.get_unique_total(), 3)
+
+    def test_env_tags(self):
+        self.assertEqual(list(self.tag_decoder.get_env_tag_strings()),
+                         ['env_tax:marine;env_geo:marine', '', 'env_geo:terrestrial', '',
+                          'env_tax:marine;env_geo:marine'])
+        self.assertEqual(list(self.tag_decoder.get_env_tag_lists())[2], ['env_geo:terrestrial'])
+        self.assertEqual(list(self.tag_decoder.get_env_tag_pattern_mask('marine|freshwater')),
+                         [True, False, False, False, True])
+
+    def test_masks(self):
+        self.assertEqual(list(self.tag_decoder.get_tag_mask('env_geo:terrestrial')), [False, False, True, False, False])
+        one_hot = self.tag_decoder.get_one_hot(['marine', 'env_geo:terrestrial'])
+        self.assertEqual(list(one_hot['marine']), [True, False, False, False, True])
+        self.assertEqual(list(self.tag_decoder.get_bitmask(['marine', 'env_geo:terrestrial'])), [1, 0, 2, 0, 1])
+
+    def test_habitat_flags(self):
+        flag_bit_by_habitat = {'marine': 1, 'terrestrial': 2}
+        self.assertEqual(list(self.tag_decoder.get_habitat_flags(flag_bit_by_habitat)), [1, 0, 0, 0, 1])
+        self.assertEqual(get_habitat_flags(('terrestrial_medium_confidence', 'marine_low_confidence'),
+                                           flag_bit_by_habitat), 2)
+
+    def test_add_env_tag_columns(self):
+        df = pd.DataFrame({'tag': self.tags})
+        self.assertIsNotNone(add_env_tag_columns(df))
+        self.assertEqual(list(df['env_tags'])[0], 'env_tax:marine;env_geo:marine')
+        decoded_df = pd.DataFrame({'env_tags': ['env_geo:marine']})   # no tag column, so it must not be decoded again
+        self.assertIsNone(add_env_tag_columns(decoded_df))
+        self.assertEqual(list(decoded_df.columns), ['env_tags'])
+
+    def test_taxon_collection_flags(self):
+        hit_list = [{'tax_id': '8860', 'scientific_name': 'Chloephaga melanoptera',
+                     'tag': 'marine;marine_high_confidence;freshwater_medium_confidence;terrestrial_low_confidence'},
+                    {'tax_id': '9606', 'scientific_name': 'Homo sapiens', 'tag': ''}]
+        taxon_collection_obj = taxon_collection(hit_list)
+        for hit in hit_list:
+            self.assertEqual(taxon_collection_obj.get_taxon_obj_by_id(hit['tax_id']).get_taxon_dict(),
+                             taxon(hit).get_taxon_dict())
+        taxon_obj = taxon_collection_obj.get_taxon_obj_by_id('8860')
+        self.assertTrue(taxon_obj.isMarine and taxon_obj.isFreshwater)
+        self.assertFalse(taxon_obj.isTerrestrial)
+
+
+if __name__ == '__main__':
+    unittest.main()
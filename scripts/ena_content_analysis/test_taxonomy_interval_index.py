@@ -0,0 +1,37 @@
+import unittest
+import pandas as pd
+from taxonomy_interval_index import *
+
+
+class TestTaxonomyIntervalIndex(unittest.TestCase):
+
+    tax_lineages = ['1;131567;2759;33154;4751;451864;5204',
+                    '1;131567;2759;33154;4751;4890',
+                    '1;131567;2759;33154;33208;9606',
+                    '1;131567;2;1783272;1239;91061;186826;81852;1350;1352',
+                    '']
+    interval_index = TaxonomyIntervalIndex(tax_lineages)
+
+    def test_is_under(self):
+        self.assertTrue(self.interval_index.is_under('5204', '4751'))
+        self.assertTrue(self.interval_index.is_under('4751', '4751'))
+        self.assertTrue(self.interval_index.is_under('1352', '1'))
+        self.assertFalse(self.interval_index.is_under('9606', '4751'))
+        self.assertFalse(self.interval_index.is_under('4751', '5204'))
+        self.assertFalse(self.interval_index.is_under('424242', '1'))
+
+    def test_intervals_nest(self):
+        (fungi_start, fungi_end) = self.interval_index.get_interval('4751')
+        self.assertEqual(fungi_end - fungi_start + 1, 4)   # 4751, 451864, 5204 and 4890
+        self.assertEqual(self.interval_index.get_taxon_total(), 18)
+
+    def test_get_subtree_mask(self):
+        tax_ids = pd.Series(['5204', '9606', '4890', None, '', '424242', '1352'])
+        self.assertListEqual(list(self.interval_index.get_subtree_mask(tax_ids, '4751')),
+                             [True, False, True, False, False, False, False])
+        self.assertListEqual(list(~self.interval_index.get_subtree_mask(tax_ids, ['9606', '2'])),
+                             [True, False, True, True, True, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from adaptive_chunking import IncompleteChunkedCallError
+from ena_portal_api import configure_portal_url
+from portal_api_metrics import configure_portal_metrics, get_portal_metrics
+from portal_api_stand_in import PortalApiStandIn
+from portal_response_cache import configure_portal_cache
+from taxonomy_store import *
+from taxonomy import generate_taxon_collection
+
+
+class TestTaxonomyStore(unittest.TestCase):
+    """
+    runs against the local portal_api_stand_in, so does not need the network
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stand_in = PortalApiStandIn(n_studies = 1, n_samples = 1, n_runs = 0, n_taxa = 200).start()
+        configure_portal_cache(enabled = False)
+        configure_portal_metrics(write_at_exit = False)
+        configure_portal_url(cls.stand_in.get_url())
+
+    @classmethod
+    def tearDownClass(cls):
+        configure_portal_url(None)
+        get_portal_metrics().reset()
+        configure_portal_metrics(write_at_exit = True)
+        cls.stand_in.stop()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        configure_taxonomy_store(enabled = True, db_file = os.path.join(self.tmp_dir.name, "taxonomy_store.sqlite"))
+        self.store = get_taxonomy_store()
+        self.taxa = self.stand_in.tables.taxon
+
+    def tearDown(self):
+        configure_taxonomy_store(enabled = False, db_file = get_default_taxonomy_store_file())
+        self.tmp_dir.cleanup()
+
+    def test_incremental_refresh(self):
+        tax_ids = [row["tax_id"] for row in self.taxa[0:50]]
+        self.assertEqual(self.store.refresh(tax_ids + ["999999"]), 51)
+        self.assertEqual(self.store.refresh(tax_ids + ["999999"]), 0)   # the not found one is remembered too
+        self.assertEqual(self.store.refresh([row["tax_id"] for row in self.taxa[0:60]]), 10)
+        self.assertEqual(self.store.get_stats()["not_found"], 1)
+        record_by_tax_id = self.store.get_records_by_tax_id(tax_ids + ["999999"])
+        self.assertEqual(sorted(record_by_tax_id), sorted(tax_ids))
+        self.assertEqual(record_by_tax_id["9606"]["scientific_name"], "Homo sapiens")
+
+    def test_failed_chunks_are_not_marked_not_found(self):
+        tax_ids = [row["tax_id"] for row in self.taxa[0:50]] + ["999999"]
+        self.stand_in.error_rate = 1.0
+        try:
+            with self.assertRaises(IncompleteChunkedCallError):
+                self.store.refresh(tax_ids, max_retries = 0,
+                                   checkpoint_file = os.path.join(self.tmp_dir.name, "failed_portal_chunks.jsonl"))
+        finally:
+            self.stand_in.error_rate = 0.0
+        self.assertEqual(self.store.get_stats()["not_found"], 0)
+        self.assertEqual(sorted(self.store.get_ids_to_fetch(tax_ids)), sorted(tax_ids))
+        self.assertEqual(self.store.refresh(tax_ids), 51)
+        self.assertEqual(self.store.get_stats()["not_found"], 1)
+
+    def test_lineage_index(self):
+        self.store.refresh([row["tax_id"] for row in self.taxa])
+        ancestor = self.taxa[5]["tax_id"]
+        expected = {row["tax_id"] for row in self.taxa if ancestor in row["tax_lineage"].split(";")}
+        self.assertEqual(self.store.get_descendant_tax_ids(ancestor), expected)
+        self.assertTrue(self.store.is_descendant("9606", "1"))
+        self.assertFalse(self.store.is_descendant("1", "9606"))
+
+    def test_pretty_taxonomy_rankings(self):
+        self.assertEqual(self.store.get_pretty_taxonomy_rankings("9606"), "root(1);Homo sapiens(9606)")
+        self.assertIsNone(self.store.get_pretty_taxonomy_rankings("999999"))
+
+    def test_generate_taxon_collection(self):
+        taxon_collection_obj = generate_taxon_collection(["9606", "9606", "1"])
+        self.assertEqual(len(taxon_collection_obj.get_all_taxon_obj_list()), 2)
+        self.assertEqual(taxon_collection_obj.get_taxon_obj_by_id("9606").scientific_name, "Homo sapiens")
+
+
+if __name__ == '__main__':
+    unittest.main()
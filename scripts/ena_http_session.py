@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Script of ena_http_session.py is to provide the one pooled HTTP session used for all the ENA/EBI API calls
+
+Re-using the one requests.Session means keep-alive connections are shared, so the many small chunked
+portal calls do not each pay for a new TCP and TLS handshake.
+Each response gets a .timing dict, splitting the latency into connect, time to first byte and download,
+which is what portal_api_metrics records.
+N.B. deliberately only depends on requests. There is only this one copy, in scripts/: the scripts in
+scripts/assemblytracking and scripts/ena_content_analysis append scripts/ to sys.path to import it.
+
+___author___ = "woollard@ebi.ac.uk"
+___start_date___ = 2026-10-18
+__docformat___ = 'reStructuredText'
+chmod a+x ena_http_session.py
+"""
+
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(name = 'mylogger')
+
+_session_settings = {
+    "pool_size": 10,         # should be at least as big as the number of threads doing calls at once
+    "timeout": (10, 600),    # (connect, read) seconds, the read is long as limit=0 searches can be slow to start
+    "gzip": True
+}
+_session = None
+_session_lock = threading.Lock()
+_thread_state = threading.local()   # the connect time of the request in flight on this thread
+
+
+def add_connect_time(seconds):
+    _thread_state.connect_s = getattr(_thread_state, "connect_s", 0.0) + seconds
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """
+    times the TCP connect, N.B. only called for a new connection, not a re-used keep-alive one
+    """
+    def connect(self):
+        start_time = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            add_connect_time(time.perf_counter() - start_time)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    """
+    times the TCP connect plus the TLS handshake
+    """
+    def connect(self):
+        start_time = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            add_connect_time(time.perf_counter() - start_time)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connection pools time the connects
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool,
+                                                   "https": TimedHTTPSConnectionPool}
+
+
+def configure_session(pool_size=None, timeout=None, gzip=None):
+    """
+    change the settings of the shared session, any existing session is closed and rebuilt on next use
+    e.g. configure_session(pool_size=20, timeout=(5, 300))
+    :param pool_size: max number of keep-alive connections kept per host
+    :param timeout: seconds, either a single number or a (connect, read) tuple
+    :param gzip: if True asks for gzip/deflate compressed responses
+    :return: the settings dict
+    """
+    global _session
+    with _session_lock:
+        if pool_size is not None:
+            _session_settings["pool_size"] = pool_size
+        if timeout is not None:
+            _session_settings["timeout"] = timeout
+        if gzip is not None:
+            _session_settings["gzip"] = gzip
+        if _session is not None:
+            _session.close()
+            _session = None
+    logger.debug(f"ena_http_session settings={_session_settings}")
+    return _session_settings
+
+
+def get_session_settings():
+    return _session_settings
+
+
+def build_session():
+    """
+    builds a requests.Session with a connection pool sized by the settings
+    :return: session
+    """
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections = _session_settings["pool_size"],
+                          pool_maxsize = _session_settings["pool_size"])
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if _session_settings["gzip"]:
+        session.headers["Accept-Encoding"] = "gzip, deflate"
+    else:
+        session.headers["Accept-Encoding"] = "identity"
+    return session
+
+
+def get_session():
+    """
+    lazily creates the shared session
+    :return: session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def timed_request(method, url, **kwargs):
+    """
+    runs the request on the shared session, adding response.timing
+    response.elapsed runs from sending the request to the headers being parsed, so includes any connect.
+    For stream=True the body has not been read yet, so download_s and bytes are 0 and are up to the caller.
+    :param method: "get" or "post"
+    :param url:
+    :param kwargs:
+    :return: response
+    """
+    kwargs.setdefault("timeout", _session_settings["timeout"])
+    _thread_state.connect_s = 0.0
+    start_time = time.perf_counter()
+    response = get_session().request(method, url, **kwargs)
+    total_s = time.perf_counter() - start_time
+    headers_s = min(response.elapsed.total_seconds(), total_s)
+    connect_s = _thread_state.connect_s
+    if kwargs.get("stream", False):
+        (download_s, size, wire_size) = (0.0, 0, 0)
+        total_s = headers_s
+    else:
+        download_s = total_s - headers_s
+        size = len(response.content)
+        wire_size = int(response.headers.get("Content-Length", size))   # i.e. the compressed size if gzipped
+    response.timing = {
+        "connect_s": connect_s,
+        "ttfb_s": max(0.0, headers_s - connect_s),
+        "download_s": download_s,
+        "total_s": total_s,
+        "bytes": size,
+        "wire_bytes": wire_size
+    }
+    return response
+
+
+def http_get(url, params=None, **kwargs):
+    """
+    drop in for requests.get(url, params), but via the shared session
+    :param url:
+    :param params:
+    :param kwargs: anything else requests.get accepts e.g. headers, stream
+    :return: response, with .timing
+    """
+    return timed_request("get", url, params = params, **kwargs)
+
+
+def http_post(url, data=None, **kwargs):
+    """
+    drop in for requests.post(url, data), but via the shared session
+    :param url:
+    :param data: N.B. a dict is sent as a form, so is good for long includeAccessions lists
+    :param kwargs: anything else requests.post accepts e.g. headers, stream
+    :return: response, with .timing
+    """
+    return timed_request("post", url, data = data, **kwargs)
+
+
+def main():
+    response = http_get('https://www.ebi.ac.uk/ena/portal/api/count?result=sample&dataPortal=ena')
+    logger.info(f"{response.status_code} {response.text}")
+
+
+if __name__ == '__main__':
+    main()
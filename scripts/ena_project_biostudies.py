@@ -14,7 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import requests, xmltodict
+import xmltodict
+from ena_http_session import http_get
 import argparse
 import pandas as pd
 from datetime import datetime, date
@@ -101,7 +102,7 @@ if args_dict['project']:
     url_start = "https://www.ebi.ac.uk/ena/browser/api/xml"
     project_acc = str(args_dict['project'][0])
     url = "{0}/{1}".format(url_start, project_acc)
-    response = requests.get(url)  # get requests retrieve the webpage for display
+    response = http_get(url)  # get requests retrieve the webpage for display
     data = xmltodict.parse(response.content)  # this function converts the xml content into a dictionary
     project_name = (data['PROJECT_SET']['PROJECT']['NAME'])
     project_title = (data['PROJECT_SET']['PROJECT']['TITLE'])
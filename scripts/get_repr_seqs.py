@@ -1,6 +1,6 @@
 #!/usr/bin/python
 
-import requests
+from ena_http_session import http_post
 import argparse
 import pandas as pd
 
@@ -43,7 +43,7 @@ def query_api():
     url = "https://www.ebi.ac.uk/ena/portal/api/search"
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
     payload = {'result': 'sequence', 'query':'tax_tree(2697049)', 'fields': 'collection_date', 'limit': '0', 'format': 'tsv'}
-    r = requests.post(url, data=payload, headers=headers)
+    r = http_post(url, data=payload, headers=headers)
     results = r.text
     return results
 
@@ -16,7 +16,7 @@
 
 import smtplib
 import os,sys
-import requests
+from ena_http_session import http_post
 import os.path
 import pandas as pd
 from datetime import datetime
@@ -60,7 +60,7 @@ def get_analyses():
         'analysis_accession%2Canalysis_alias%2Crun_accession%2Ccollection_date%2Cfirst_created%2Cfirst_public%2Csubmitted_ftp%2Csubmitted_md5'],
                'limit': '0', 'format': 'tsv'}
 
-    r = requests.post(url, data=payload, headers=headers)
+    r = http_post(url, data=payload, headers=headers)
     results = r.text
     # save tsv and then read output as pandas dataframe
     with open('analysis_input.tsv', 'w') as output:
@@ -113,7 +113,7 @@ def add_runs():
         'run_accession%2Cinstrument_platform%2Cinstrument_model%2Ccountry'],
                'limit': '0', 'format': 'tsv'}
 
-    r = requests.post(url, data=payload, headers=headers)
+    r = http_post(url, data=payload, headers=headers)
     results = r.text
     with open('all_rundata.tsv', 'w') as output:
         output.write(results)